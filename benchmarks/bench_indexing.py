@@ -0,0 +1,199 @@
+"""
+benchmark for finding the PBTs of a project and their context: the old extractor (which parses
+every file once for its PBTs, and then again, plus another parse and walk per function, for the
+functions, what they call and the imports) against gru.parsing.index, which parses and walks
+every file once.
+
+    python benchmarks/bench_indexing.py [--modules 200] [--functions 20] [--seed 0] [--jobs 1]
+
+writes synthetic projects of growing size to a temporary directory: modules of functions calling
+each other and a test file of hypothesis PBTs per few modules. for each, checks that both give
+the same PBTs with the same context and prints how long they took
+"""
+import argparse, ast, os, random, shutil, tempfile, time
+from typing import Dict, Set
+
+from gru.parsing.utils import find_pbt_functions, get_import_statements
+from gru.parsing.index import index_project
+from gru.parsing.callgraph import pbts_with_context
+
+# the extractor as it was, kept here to compare against
+
+def get_all_function_names(code : str) -> list:
+    return [node.name for node in ast.walk(ast.parse(code)) if isinstance(node, ast.FunctionDef)]
+
+def get_function_definition(func_name : str, code : str) -> str:
+    for node in ast.walk(ast.parse(code)):
+        if isinstance(node, ast.FunctionDef) and node.name == func_name:
+            return ast.unparse(node)
+    return None
+
+def get_called_function_names(func_name : str, code : str) -> Set[str]:
+    called_functions = set()
+    for node in ast.walk(ast.parse(code)):
+        if isinstance(node, ast.FunctionDef) and node.name == func_name:
+            for sub_node in ast.walk(node):
+                if any(sub_node in ast.walk(decorator) for decorator in node.decorator_list):
+                    continue
+                if isinstance(sub_node, ast.Call):
+                    if isinstance(sub_node.func, ast.Name):
+                        called_functions.add(sub_node.func.id)
+                    elif isinstance(sub_node.func, ast.Attribute):
+                        called_functions.add(sub_node.func.attr)
+    return called_functions
+
+def legacy_pbts(directory : str) -> list:
+    all_pbts = set()
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if file.endswith('.py'):
+                file_path = os.path.join(root, file)
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    for pbt_name, pbt in find_pbt_functions(f.read()):
+                        all_pbts.add((pbt_name, pbt, file_path))
+    return list(all_pbts)
+
+def legacy_extract(directory : str) -> dict:
+    pbts = legacy_pbts(directory)
+
+    pbt_deps: Dict[str, Set[str]] = {}
+    pbt_filenames: Dict[str, str] = {}
+    functions: Dict[str, str] = {}
+    function_deps: Dict[str, Set[str]] = {}
+    import_statements: Dict[str, Set[str]] = {}
+    pbt_requires_external_pkgs: Dict[str, bool] = {}
+    function_filenames: Dict[str, str] = {}
+
+    filenames = set()
+    for name, pbt, filename in pbts:
+        pbt_deps[name] = set()
+        pbt_filenames[name] = filename
+
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            if file.endswith('.py'):
+                filenames.add(file[0:file.index(".py")])
+                file_path = os.path.join(root, file)
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                    imports = get_import_statements(content)
+                    for func_name in get_all_function_names(content):
+                        functions[func_name] = get_function_definition(func_name, content)
+                        function_deps[func_name] = get_called_function_names(func_name, content)
+                        function_filenames[func_name] = file_path
+                        import_statements[func_name] = imports
+
+    prog_defs = set(functions.keys()) - set(pbts)
+    for name, pbt, filename in pbts:
+        deps = set(get_called_function_names(name, pbt))
+        to_add = deps.copy()
+        imports = set(import_statements[name])
+        while to_add != set():
+            proc = set()
+            for func in to_add:
+                if func in function_deps:
+                    imports = imports.union(set(import_statements[func]))
+                    proc = proc.union(set(function_deps[func]))
+            to_add = proc - deps
+            deps = deps.union(proc)
+
+        deps = deps.intersection(prog_defs)
+        pbt_deps[name] = deps
+
+        requires_external = False
+        for import_statement, state in list(imports):
+            if state == "third-party" and (
+                    any(dep in import_statement for dep in deps) or
+                    any(filename in import_statement for filename in filenames)):
+                imports.remove((import_statement, state))
+            elif state == "third-party" and not "hypothesis" in import_statement: requires_external = True
+
+        import_statements[name] = imports
+        pbt_requires_external_pkgs[name] = requires_external
+
+    full_pbt_deps = {}
+    for pbts, deps in pbt_deps.items():
+        full_pbt_deps[pbts] = (pbts, list(deps), functions[pbts], [functions[dep] for dep in deps],
+                               import_statements[pbts], pbt_requires_external_pkgs[pbts], pbt_filenames[pbts],
+                               {dep : function_filenames[dep] for dep in deps})
+    return full_pbt_deps
+
+# synthetic projects
+
+def write_project(directory : str, modules : int, functions : int, rng : random.Random):
+    package = os.path.join(directory, "pkg")
+    tests = os.path.join(directory, "tests")
+    os.makedirs(package)
+    os.makedirs(tests)
+    open(os.path.join(package, "__init__.py"), 'w').close()
+
+    names = [[f"f{m}_{f}" for f in range(functions)] for m in range(modules)]
+    for m in range(modules):
+        lines = ["import math, json", "from collections import defaultdict", "import numpy as np", ""]
+        if m > 0 : lines.insert(0, f"from pkg.mod{m - 1} import {names[m - 1][0]}")
+        for f, name in enumerate(names[m]):
+            # calls into earlier functions of this module and the one before, so dependencies chain across files
+            pool = names[m][:f] + (names[m - 1] if m > 0 else [])
+            callees = rng.sample(pool, min(3, len(pool)))
+            lines.append(f"def {name}(x, y=0):")
+            lines.append(f"    total = x + y")
+            lines.append(f"    if total > {rng.randint(0, 100)}:")
+            lines += [f"        total = total - {callee}(total) % 7" for callee in callees] or ["        total += 1"]
+            lines.append(f"    def {name}_helper(z):")
+            lines.append(f"        return math.floor(z * {rng.randint(1, 9)})")
+            lines.append(f"    return {name}_helper(total) if total >= 0 else -total")
+            lines.append("")
+        with open(os.path.join(package, f"mod{m}.py"), 'w') as f:
+            f.write("\n".join(lines))
+
+    for m in range(0, modules, 4):
+        lines = ["from hypothesis import given, strategies as st", f"from pkg.mod{m} import *", ""]
+        for f in rng.sample(range(functions), min(3, functions)):
+            lines.append("@given(st.integers(), st.integers())")
+            lines.append(f"def test_{names[m][f]}(x, y):")
+            lines.append(f"    assert {names[m][f]}(x, y) == {names[m][f]}(x, y)")
+            lines.append("")
+        with open(os.path.join(tests, f"test_mod{m}.py"), 'w') as f:
+            f.write("\n".join(lines))
+
+def normalized(pbts : dict) -> dict:
+    """the output with its unordered parts (dependency lists, the import set) sorted"""
+    ret = {}
+    for name, data in pbts.items():
+        order = sorted(range(len(data[1])), key=lambda i : data[1][i])
+        ret[name] = (data[0], [data[1][i] for i in order], data[2], [data[3][i] for i in order],
+                     sorted(data[4]), data[5], data[6], data[7])
+    return ret
+
+def timed(function, *args) -> tuple:
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark PBT and dependency extraction.')
+    parser.add_argument('--modules', type=int, default=200, help='Modules of the largest synthetic project')
+    parser.add_argument('--functions', type=int, default=20, help='Functions per module')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic projects')
+    parser.add_argument('--jobs', type=int, default=1, help='Processes the indexer parses files with')
+    args = parser.parse_args()
+
+    print(f"{'modules':>8}{'lines':>9}{'pbts':>7}{'old s':>9}{'indexed s':>11}{'speedup':>10}")
+    for modules in sorted({max(1, args.modules // 8), max(1, args.modules // 2), args.modules}):
+        directory = tempfile.mkdtemp(prefix="gru_bench_")
+        try:
+            write_project(directory, modules, args.functions, random.Random(args.seed))
+            lines = 0
+            for root, dirs, files in os.walk(directory):
+                for file in files:
+                    with open(os.path.join(root, file)) as f : lines += f.read().count("\n") + 1
+
+            old, old_seconds = timed(legacy_extract, directory)
+            new, new_seconds = timed(lambda : pbts_with_context(index_project(directory, [], None, args.jobs)))
+            assert normalized(old) == normalized(new), "indexer disagrees with the old extractor"
+            print(f"{modules:>8}{lines:>9}{len(new):>7}{old_seconds:>9.2f}{new_seconds:>11.2f}{old_seconds / new_seconds:>9.1f}x")
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
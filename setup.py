@@ -14,7 +14,6 @@ setup(
     install_requires=[
         'openai>=0.0.0',           # Specify the required version
         'pytest>=6.0.0',
-        'pytest-json-report>=1.2.4',
         'hypothesis>=6.0.0',
         'astor',
         'requests',
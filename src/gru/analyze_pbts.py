@@ -1,136 +1,262 @@
-import tempfile, os, subprocess, json, random, shutil, argparse
-from gru.mutator.harness import mutate_map
+import tempfile, os, random, argparse
+from gru.mutator.harness import draw_mutants, pool_size
+from gru.mutator.filter import describe_removed
+from gru.mutator.runner import MutantRunner, split_outcomes, run_pbts, sandbox_path
+from gru.mutator.limits import TIMEOUT
+from gru.mutator.coverage import NOT_COVERED
+from gru.mutator.sandbox import build_sandbox, CONFIG_FILES
+from gru.mutator.cache import OutcomeCache, cache_path, DEFAULT_CACHE_SIZE
+from gru.mutator.sequential import stratify, stratified_order, stratified_estimate, interval_settled
+from gru.mutator.subsumption import KillMatrix, SUBSUMED, matrix_path
+from gru.mutator.stats import KillStats, LIKELY_KILLED, stats_path, mutant_features
 from gru.parsing.utils import *
 from tqdm import tqdm
 
-from gru.parsing.ast_manip import (
-    replace_function_signatures_in_directory,
-)
-
-def find_pbts_in_repo(repo_dir : str) -> list:
-    pbts_data = extract_pbts_with_dirs_and_context(repo_dir)
-
-    ret = []
-    for pbt, data in pbts_data.items():
+from gru.parsing.index import IndexCache, index_path, index_project, pbt_names
+from gru.parsing.callgraph import CallGraph, pbts_with_context, affected_pbts, impacted_pbts
+from gru.parsing.gitdiff import changed_lines, changed_functions
+from gru.parsing.watch import snapshot, wait_for_changes
+
+def find_pbts_in_repo(repo_dir : str, index_cache : bool = False, index_jobs : int = 1) -> list:
+    # only the names are needed, so the context of every PBT isn't worked out
+    file_index = IndexCache(index_path(repo_dir)) if index_cache else None
+    index = index_project(repo_dir, [os.path.join(repo_dir, '.gru')], file_index, index_jobs)
+    if file_index is not None : file_index.close()
+    return pbt_names(index)
+
+def run_and_score(runner : MutantRunner, dep_list : str, mutation_set : list, mutant_num : int,
+                  ci_width : float = None, progress : bool = False, stats : KillStats = None, mutation_ids : dict = None) -> tuple:
+    """
+    runs the mutants and returns (outcomes, score, interval, number of mutants). by default the
+    score is measured on mutant_num sampled mutants and interval is None; with ci_width (in
+    percentage points) mutants from the whole of mutation_set are run, stratified by function and
+    operator, until the 95% interval of the estimated score is at most ci_width wide.
+
+    with stats (and mutation_ids, mutant -> id), the outcomes are added to the kill statistics,
+    and sampled mutants of classes that practically always die are mostly not run. those are marked
+    LIKELY_KILLED and left out of the score, which only counts the mutants that ran
+    """
+    features = mutant_features(dep_list, mutation_ids or {}) if stats is not None else {}
+
+    if ci_width is None:
+        mutants = runner.sample_mutants(mutation_set, mutant_num)
+        to_run, skipped = stats.skip_trivial(mutants, features) if stats is not None else (mutants, [])
+        outcomes = runner.run_reduced(to_run, progress=progress)
+        if stats is not None : stats.record(features, outcomes)
+        outcomes.update({mutant : LIKELY_KILLED for mutant in skipped})
+
+        passed_tests, failed_tests = split_outcomes(outcomes)
+        total = len(passed_tests) + len(failed_tests)
+        return outcomes, (100 * len(passed_tests) / total if total > 0 else 0), None, len(mutants)
+
+    strata = stratify(dep_list, mutation_set)
+    outcomes = runner.run_reduced(stratified_order(mutation_set, strata), progress=progress,
+                                  stop=lambda known : interval_settled(known, strata, ci_width / 100))
+    if stats is not None : stats.record(features, outcomes)
+    estimate = stratified_estimate(outcomes, strata)
+    if estimate is None : return outcomes, 0, (0, 100), len(mutation_set)
+    score, low, high = (100 * value for value in estimate)
+    return outcomes, score, (low, high), len(mutation_set)
+
+def describe_score(pbt_name : str, pbt_path : str, score : float, interval : tuple, ran : int, mutant_count : int) -> str:
+    description = str(pbt_name) + " at " + str(pbt_path) + " scored " + str(score) + "%"
+    if interval is not None:
+        description += " (95% interval " + format(interval[0], '.1f') + "-" + format(interval[1], '.1f') + "%, from "
+        description += str(ran) + " of " + str(mutant_count) + " mutants)"
+    return description
+
+def analyze_pbts_data(repo_dir : str, tmpdir : str, pbts_data : dict, mutant_num : int, jobs : int, mode : str, schema : bool,
+                      selective_sandbox : bool, reuse_sandbox : bool, timeout_factor : float, timeout_slack : float,
+                      memory_limit : int, coverage : bool, ci_width : float, replay : bool, seed : int,
+                      outcome_cache : OutcomeCache, kill_stats : KillStats, kill_matrix : KillMatrix,
+                      mutate_only : dict = None) -> list:
+    """
+    mutation analysis of every PBT in pbts_data, in a sandbox under tmpdir (reset in place if it's
+    already there). returns (name, path, score, interval, mutants run, mutant count) of every PBT that got scored.
+    given mutate_only (PBT name -> names of the dependencies to mutate, or None for all of them),
+    only those dependencies of a PBT get mutated
+    """
+    """ step 1: set up the sandbox """
+    dst_dir, sandbox_files = build_sandbox(repo_dir, tmpdir, pbts_data, selective_sandbox, reuse_sandbox)
+
+    """ step 2: check every PBT passes, all in one pytest session """
+    baselines = {}
+    if not coverage and not replay:
+        # coverage and replay need a baseline run of their own for every PBT anyway
+        pbts = [(sandbox_path(repo_dir, dst_dir, data[6]), data[0]) for data in pbts_data.values() if data[1] != []]
+        baselines = run_pbts(dst_dir, pbts, (None, memory_limit))
+
+    results = []
+
+    for pbt, data in tqdm(pbts_data.items()): 
         pbt_name = data[0]
-        ret.append(pbt_name)
-
-    return ret
+        dependency_names = data[1]
+        pbt_definition = data[2]
+        dependency_definitions = data[3]
+        import_reqs = data[4]
+        external_pkg_reqs = data[5]
+        pbt_path = data[6]
+        dependency_filenames = data[7]
 
-def analyze_pbts_in_repo(repo_dir : str, mutant_num : int):
+        if dependency_names == []:
+            print("no dependencies, so nothing to mutate! skipping")
+            continue
 
-    pbts_data = extract_pbts_with_dirs_and_context(repo_dir)
+        print("analyzing property-based test " + str(pbt_name) + " located at " + str(pbt_path) + "!")
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        """ step 1: copy dir to tmpdir """
-        dst_dir = os.path.join(tmpdir, os.path.basename(repo_dir))
-        shutil.copytree(repo_dir, dst_dir)
-
-        results = []
-
-        for pbt, data in tqdm(pbts_data.items()): 
-            pbt_name = data[0]
-            dependency_names = data[1]
-            pbt_definition = data[2]
-            dependency_definitions = data[3]
-            import_reqs = data[4]
-            external_pkg_reqs = data[5]
-            pbt_path = data[6]
-            dependency_filenames = data[7]
-
-            if dependency_names == []:
-                print("no dependencies, so nothing to mutate! skipping")
+        dep_list = ""
+        for dep_def in dependency_definitions : dep_list += dep_def + "\n\n"
+
+        with MutantRunner(repo_dir, dst_dir, pbt_path, pbt_name, dep_list, pbt_definition, jobs=jobs,
+                      mode=mode, dependency_filenames=dependency_filenames, schema=schema,
+                      sandbox_files=sandbox_files, timeout_factor=timeout_factor,
+                      timeout_slack=timeout_slack, memory_limit=memory_limit, coverage=coverage,
+                      cache=outcome_cache, replay=replay, kill_matrix=kill_matrix) as runner:
+            baseline = baselines.get((sandbox_path(repo_dir, dst_dir, pbt_path), pbt_name))
+            if baseline is not None : runner.seed_baseline(baseline[0], baseline[1])
+            outcome = runner.run_pbt()
+
+            if outcome is None:
+                print("PBT " + str(pbt_name) + " failed to be detected by pytest... skipping")
                 continue
 
-            print("analyzing property-based test " + str(pbt_name) + " located at " + str(pbt_path) + "!")
-            report_file_path = os.path.join(dst_dir, 'report.json')
-
-            env = os.environ.copy()
-            env['PYTHONPATH'] = dst_dir
-
-            result = subprocess.run(
-                ['pytest', '-q', '--json-report', '--json-report-file=' + report_file_path, 
-                 pbt_path + "::" + pbt_name],
-                env=env,  # pass the modified environment to the subprocess
-            )
-
-            with open(report_file_path, 'r') as f:
-                ret_data = json.loads(f.read())
-
-                if len(ret_data["tests"]) == 0: 
-                    print("PBT " + str(pbt_name) + " failed to be detected by pytest... skipping")
-                    continue
-
-                for test in ret_data["tests"]:
-                    name = test["nodeid"][test["nodeid"].index("::")+2:]
-                    outcome = test["outcome"]
-                    if outcome == "failed": 
-                        print("PBT " + str(pbt_name) + " did not pass with pytest... skipping")
-                        continue
+            if outcome == "failed": 
+                print("PBT " + str(pbt_name) + " did not pass with pytest... skipping")
+                if baseline is not None and baseline[2] : print(baseline[2])
+                continue
 
             print(str(pbt_name) + " passed with pytest, doing mutant analysis now ...")
 
-            dep_list = ""
-            for dep_def in dependency_definitions : dep_list += dep_def + "\n\n"
-            op_def_nodes = extract_function_defs(dep_list)
-
-            mutation_set = mutate_map(dep_list, mutant_num, 2)
-            mutants = list(random.sample(list(mutation_set), mutant_num))
-
-            passed_tests = set()
-            failed_tests = set()
-
-            for mutant in mutants:
-                def_nodes = extract_function_defs(mutant)
-
-                replace_function_signatures_in_directory(dst_dir, def_nodes)
-
-                env = os.environ.copy()
-                env['PYTHONPATH'] = dst_dir
+            functions = mutate_only.get(pbt_name) if mutate_only is not None else None
+            if functions is not None : print("only mutating " + ", ".join(sorted(functions)))
+            mutation_ids, removed = draw_mutants(dep_list, pool_size(mutant_num, coverage or ci_width is not None),
+                                                 seed, stratified=ci_width is not None, functions=functions)
+            if removed : print(describe_removed(removed))
+            mutation_set = list(mutation_ids)
 
-                report_file_path = os.path.join(dst_dir, 'report.json')
-                result = subprocess.run(
-                    ['pytest', '-q', '--json-report', '--json-report-file=' + report_file_path, 
-                     pbt_path + "::" + pbt_name],
-                    env=env
-                )
-
-                with open(report_file_path, 'r') as f:
-                    data = json.loads(f.read())
-
-                    # if len(data["tests"]) == 0 : return None
-
-                    for test in data["tests"]:
-                        name = test["nodeid"][test["nodeid"].index("::")+2:]
-                        outcome = test["outcome"]
-                        if outcome == "passed":
-                            passed_tests.add(mutant)
+            if mutation_set == []:
+                print("no runnable mutants for " + str(pbt_name) + "... skipping")
+                continue
 
-                        elif outcome == "failed":
-                            failed_tests.add(mutant)
+            outcomes, score, interval, mutant_count = run_and_score(runner, dep_list, mutation_set, mutant_num, ci_width,
+                                                                   stats=kill_stats, mutation_ids=mutation_ids)
+
+            timeouts = list(outcomes.values()).count(TIMEOUT)
+            if timeouts : print(str(timeouts) + " mutants timed out, counting them as killed")
+            not_covered = list(outcomes.values()).count(NOT_COVERED)
+            if not_covered : print(str(not_covered) + " mutants only change code the PBT never reaches, counting them as survived")
+            likely_killed = list(outcomes.values()).count(LIKELY_KILLED)
+            if likely_killed : print(str(likely_killed) + " mutants are of kinds that practically always get killed, skipping them and leaving them out of the score")
+            subsumed = list(outcomes.values()).count(SUBSUMED)
+            if subsumed : print(str(subsumed) + " mutants are subsumed by a mutant that got killed, counting them as killed without running them")
+            if kill_stats is not None : kill_stats.save()
+        
+        results.append((pbt_name, 
+                        pbt_path, 
+                        score,
+                        interval,
+                        len(outcomes),
+                        mutant_count,
+                        ))
+
+    return results
+
+def analyze_pbts_in_repo(repo_dir : str, mutant_num : int, jobs : int = 1, mode : str = "pytest", schema : bool = False,
+                         selective_sandbox : bool = False, reuse_sandbox : bool = False,
+                         timeout_factor : float = 5.0, timeout_slack : float = 10.0, memory_limit : int = None,
+                         coverage : bool = False, cache : bool = False, cache_size : int = DEFAULT_CACHE_SIZE,
+                         ci_width : float = None, replay : bool = False, seed : int = None, stats : bool = False,
+                         subsumption : bool = False, index_cache : bool = False, index_jobs : int = 1,
+                         watch : bool = False, watch_interval : float = 1.0, since : str = None):
+
+    if seed is not None : random.seed(seed) # for the sampling that happens after the mutants are drawn
+    mutate_only = None
+    if watch or since is not None:
+        # in watch mode the index stays warm on disk, so every round only parses the files that changed
+        last = snapshot(repo_dir) if watch else None
+        file_index = IndexCache(index_path(repo_dir)) if watch or index_cache else None
+        index = index_project(repo_dir, [os.path.join(repo_dir, '.gru')], file_index, index_jobs)
+        graph = CallGraph(index)
+        if since is not None:
+            # only the functions changed since the ref get mutated, and only for the PBTs that reach them
+            try:
+                changed = changed_functions(index, changed_lines(repo_dir, since))
+            except RuntimeError as e:
+                print(e)
+                if file_index is not None : file_index.close()
+                return
+            mutate_only = impacted_pbts(graph, changed)
+            print(str(len(changed)) + " functions changed since " + since + ", " + str(len(mutate_only)) + " PBTs depend on them")
+        pbts_data = pbts_with_context(index, graph, None if mutate_only is None else set(mutate_only))
+        if file_index is not None and not watch : file_index.close()
+    else:
+        file_index = IndexCache(index_path(repo_dir)) if index_cache else None
+        pbts_data = extract_pbts_with_dirs_and_context(repo_dir, [os.path.join(repo_dir, '.gru')], file_index, index_jobs)
+        if file_index is not None : file_index.close()
+    outcome_cache = OutcomeCache(cache_path(repo_dir), cache_size) if cache else None
+    kill_stats = KillStats(stats_path(repo_dir)) if stats else None
+    kill_matrix = KillMatrix(matrix_path(repo_dir)) if subsumption else None
 
-                replace_function_signatures_in_directory(dst_dir, op_def_nodes)
-            
-            results.append((pbt_name, 
-                            pbt_path, 
-                            (100 * len(passed_tests) / (len(passed_tests) + len(failed_tests)))
-                            ))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        results = analyze_pbts_data(repo_dir, tmpdir, pbts_data, mutant_num, jobs, mode, schema, selective_sandbox, reuse_sandbox,
+                                    timeout_factor, timeout_slack, memory_limit, coverage, ci_width, replay, seed,
+                                    outcome_cache, kill_stats, kill_matrix, mutate_only)
 
         print("RESULTS: \n")
-        for pbt_name, pbt_path, ratio in results:
-            print(str(pbt_name) + " at " + str(pbt_path) + " scored " + str(ratio) + "%")
-
-def analyze_pbt_in_repo(repo_dir: str, mutant_num: int, pbt_name_filter: str):
-    pbts_data = extract_pbts_with_dirs_and_context(repo_dir)
+        for pbt_name, pbt_path, ratio, interval, ran, mutant_count in results:
+            print(describe_score(pbt_name, pbt_path, ratio, interval, ran, mutant_count))
+        if not watch : return
+
+        """ step 4: re-analyze the PBTs a change touches, for as long as we're left running """
+        print("watching " + str(repo_dir) + " for changes, ctrl-c to stop")
+        try:
+            while True:
+                last, changed = wait_for_changes(repo_dir, last, watch_interval)
+                index = index_project(repo_dir, [os.path.join(repo_dir, '.gru')], file_index, index_jobs)
+                new_graph = CallGraph(index)
+                if any(os.path.basename(path) in CONFIG_FILES for path in changed):
+                    affected = {name for _, name in new_graph.pbt_reach} # could change how any PBT runs
+                else:
+                    affected = affected_pbts(graph, new_graph, changed)
+                graph = new_graph
+
+                if not affected:
+                    print(str(len(changed)) + " files changed, but no PBT depends on them")
+                    continue
+                print(str(len(changed)) + " files changed, re-analyzing " + ", ".join(sorted(affected)))
+                results = analyze_pbts_data(repo_dir, tmpdir, pbts_with_context(index, graph, affected), mutant_num, jobs, mode,
+                                            schema, selective_sandbox, reuse_sandbox, timeout_factor, timeout_slack,
+                                            memory_limit, coverage, ci_width, replay, seed, outcome_cache, kill_stats, kill_matrix)
+                print("RESULTS: \n")
+                for pbt_name, pbt_path, ratio, interval, ran, mutant_count in results:
+                    print(describe_score(pbt_name, pbt_path, ratio, interval, ran, mutant_count))
+        except KeyboardInterrupt:
+            print("stopped watching")
+        finally:
+            file_index.close()
+
+def analyze_pbt_in_repo(repo_dir: str, mutant_num: int, pbt_name_filter: str, jobs: int = 1, mode: str = "pytest", schema: bool = False,
+                        selective_sandbox: bool = False, reuse_sandbox: bool = False,
+                        timeout_factor: float = 5.0, timeout_slack: float = 10.0, memory_limit: int = None,
+                        coverage: bool = False, cache: bool = False, cache_size: int = DEFAULT_CACHE_SIZE,
+                        ci_width: float = None, replay: bool = False, seed: int = None, stats: bool = False,
+                        subsumption: bool = False, index_cache: bool = False, index_jobs: int = 1):
+    if seed is not None : random.seed(seed) # for the sampling that happens after the mutants are drawn
+    file_index = IndexCache(index_path(repo_dir)) if index_cache else None
+    pbts_data = extract_pbts_with_dirs_and_context(repo_dir, [os.path.join(repo_dir, '.gru')], file_index, index_jobs)
+    if file_index is not None : file_index.close()
+    outcome_cache = OutcomeCache(cache_path(repo_dir), cache_size) if cache else None
+    kill_stats = KillStats(stats_path(repo_dir)) if stats else None
+    kill_matrix = KillMatrix(matrix_path(repo_dir)) if subsumption else None
 
     if pbt_name_filter not in pbts_data:
         print(f"Property-based test {pbt_name_filter} not found in repository.")
         return
 
     with tempfile.TemporaryDirectory() as tmpdir:
-        """ step 1: copy dir to tmpdir """
-        dst_dir = os.path.join(tmpdir, os.path.basename(repo_dir))
-        shutil.copytree(repo_dir, dst_dir)
+        """ step 1: set up the sandbox """
+        dst_dir, sandbox_files = build_sandbox(repo_dir, tmpdir, {pbt_name_filter : pbts_data[pbt_name_filter]},
+                                               selective_sandbox, reuse_sandbox)
 
         data = pbts_data[pbt_name_filter]
         pbt_name = data[0]
@@ -147,77 +273,53 @@ def analyze_pbt_in_repo(repo_dir: str, mutant_num: int, pbt_name_filter: str):
             return
 
         print("analyzing property-based test " + str(pbt_name) + " located at " + str(pbt_path) + "!")
-        report_file_path = os.path.join(dst_dir, 'report.json')
-
-        env = os.environ.copy()
-        env['PYTHONPATH'] = dst_dir
-
-        result = subprocess.run(
-            ['pytest', '-q', '--json-report', '--json-report-file=' + report_file_path, 
-             pbt_path + "::" + pbt_name],
-            env=env,  # pass the modified environment to the subprocess
-        )
-
-        with open(report_file_path, 'r') as f:
-            ret_data = json.loads(f.read())
-
-            if len(ret_data["tests"]) == 0:
-                print("PBT " + str(pbt_name) + " failed to be detected by pytest... skipping")
-                return
-
-            for test in ret_data["tests"]:
-                name = test["nodeid"][test["nodeid"].index("::")+2:]
-                outcome = test["outcome"]
-                if outcome == "failed":
-                    print("PBT " + str(pbt_name) + " did not pass with pytest... skipping")
-                    return
-
-        print(str(pbt_name) + " passed with pytest, doing mutant analysis now ...")
 
         dep_list = ""
         for dep_def in dependency_definitions:
             dep_list += dep_def + "\n\n"
-        op_def_nodes = extract_function_defs(dep_list)
-
-        mutation_set = mutate_map(dep_list, mutant_num, 2)
-        mutants = list(random.sample(list(mutation_set), mutant_num))
-
-        passed_tests = set()
-        failed_tests = set()
 
-        for mutant in tqdm(mutants):
-            def_nodes = extract_function_defs(mutant)
+        with MutantRunner(repo_dir, dst_dir, pbt_path, pbt_name, dep_list, pbt_definition, jobs=jobs,
+                          mode=mode, dependency_filenames=dependency_filenames, schema=schema,
+                          sandbox_files=sandbox_files, timeout_factor=timeout_factor,
+                          timeout_slack=timeout_slack, memory_limit=memory_limit, coverage=coverage,
+                          cache=outcome_cache, replay=replay, kill_matrix=kill_matrix) as runner:
+            outcome = runner.run_pbt()
 
-            replace_function_signatures_in_directory(dst_dir, def_nodes)
-
-            env = os.environ.copy()
-            env['PYTHONPATH'] = dst_dir
+            if outcome is None:
+                print("PBT " + str(pbt_name) + " failed to be detected by pytest... skipping")
+                return
 
-            report_file_path = os.path.join(dst_dir, 'report.json')
-            result = subprocess.run(
-                ['pytest', '-q', '--json-report', '--json-report-file=' + report_file_path, 
-                 pbt_path + "::" + pbt_name],
-                env=env
-            )
+            if outcome == "failed":
+                print("PBT " + str(pbt_name) + " did not pass with pytest... skipping")
+                return
 
-            with open(report_file_path, 'r') as f:
-                data = json.loads(f.read())
+            print(str(pbt_name) + " passed with pytest, doing mutant analysis now ...")
 
-                for test in data["tests"]:
-                    name = test["nodeid"][test["nodeid"].index("::")+2:]
-                    outcome = test["outcome"]
-                    if outcome == "passed":
-                        passed_tests.add(mutant)
+            mutation_ids, removed = draw_mutants(dep_list, pool_size(mutant_num, coverage or ci_width is not None),
+                                                 seed, stratified=ci_width is not None)
+            if removed : print(describe_removed(removed))
+            mutation_set = list(mutation_ids)
 
-                    elif outcome == "failed":
-                        failed_tests.add(mutant)
+            if mutation_set == []:
+                print("no runnable mutants for " + str(pbt_name) + "... skipping")
+                return
 
-            replace_function_signatures_in_directory(dst_dir, op_def_nodes)
+            outcomes, score, interval, mutant_count = run_and_score(runner, dep_list, mutation_set, mutant_num, ci_width, progress=True,
+                                                                   stats=kill_stats, mutation_ids=mutation_ids)
 
-        score = 100 * len(passed_tests) / (len(passed_tests) + len(failed_tests)) if (len(passed_tests) + len(failed_tests)) > 0 else 0
+            timeouts = list(outcomes.values()).count(TIMEOUT)
+            if timeouts : print(str(timeouts) + " mutants timed out, counting them as killed")
+            not_covered = list(outcomes.values()).count(NOT_COVERED)
+            if not_covered : print(str(not_covered) + " mutants only change code the PBT never reaches, counting them as survived")
+            likely_killed = list(outcomes.values()).count(LIKELY_KILLED)
+            if likely_killed : print(str(likely_killed) + " mutants are of kinds that practically always get killed, skipping them and leaving them out of the score")
+            subsumed = list(outcomes.values()).count(SUBSUMED)
+            if subsumed : print(str(subsumed) + " mutants are subsumed by a mutant that got killed, counting them as killed without running them")
+            if kill_stats is not None : kill_stats.save()
 
-        print(f"{pbt_name} at {pbt_path} scored {score}%")
+        print(describe_score(pbt_name, pbt_path, score, interval, len(outcomes), mutant_count))
 
+    if interval is not None : return {pbt_name_filter: (score, interval)}
     return {pbt_name_filter: score}
 
 def main():
@@ -225,6 +327,42 @@ def main():
     parser.add_argument('--repo_dir', help='Path to the repository directory', required=True)
     parser.add_argument('--pbt_name', help='name of PBT to analyze')
     parser.add_argument('--mutant_num', type=int, default=10, help='Number of mutants')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of mutants to run in parallel, each in its own sandbox')
+    parser.add_argument('--mode', choices=['pytest', 'inprocess'], default='pytest',
+                        help='Run every mutant in a fresh pytest process, or hot-swap mutants into a long-lived worker')
+    parser.add_argument('--schema', action='store_true',
+                        help='Write all mutants into the sandbox once as a mutant schema, and pick them by id')
+    parser.add_argument('--selective_sandbox', action='store_true',
+                        help='Only put the files the PBTs import (plus conftest.py, __init__.py and config files) in the sandbox')
+    parser.add_argument('--reuse_sandbox', action='store_true',
+                        help='Keep the sandbox in <repo_dir>/.gru/sandbox and reset it on the next run instead of rebuilding it')
+    parser.add_argument('--timeout_factor', type=float, default=5.0,
+                        help='Kill a mutant after this many times the unmutated PBT runtime (plus --timeout_slack); 0 disables the timeout')
+    parser.add_argument('--timeout_slack', type=float, default=10.0, help='Seconds added to every mutant time budget')
+    parser.add_argument('--memory_limit', type=int, default=None, help='Address space limit for mutant runs, in MB')
+    parser.add_argument('--coverage', action='store_true',
+                        help='Trace which dependency lines the PBT reaches; skip mutants of unreached code and favour often-run code')
+    parser.add_argument('--cache', action='store_true',
+                        help='Remember baseline and mutant outcomes in <repo_dir>/.gru/cache.sqlite and reuse them while nothing they depend on changed')
+    parser.add_argument('--cache_size', type=int, default=DEFAULT_CACHE_SIZE, help='Size limit of the outcome cache, in MB')
+    parser.add_argument('--replay', action='store_true',
+                        help='Share a hypothesis example database in <repo_dir>/.gru between all runs, and replay recorded baseline inputs and killing inputs before every mutant run')
+    parser.add_argument('--ci_width', type=float, default=None,
+                        help='Estimate the score instead: run mutants stratified by function and operator until its 95%% interval is at most this many points wide')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed for drawing and sampling mutants, so that the same code gets the same mutants every run')
+    parser.add_argument('--stats', action='store_true',
+                        help='Keep kill rates per operator class and function in <repo_dir>/.gru/stats.json, and mostly skip mutants of classes that practically always get killed')
+    parser.add_argument('--subsumption', action='store_true',
+                        help='Record which PBT killed which mutant in <repo_dir>/.gru/kills.sqlite, and skip mutants subsumed by a mutant that got killed')
+    parser.add_argument('--index_cache', action='store_true',
+                        help='Keep what every file defines, calls and imports in <repo_dir>/.gru/index.sqlite, and only parse files that changed since')
+    parser.add_argument('--index_jobs', type=int, default=1, help='Number of processes that parse the project files when indexing it')
+    parser.add_argument('--watch', action='store_true',
+                        help='After the first pass, keep running and re-analyze the PBTs whose code or dependencies change (analyze-pbts only)')
+    parser.add_argument('--watch_interval', type=float, default=1.0, help='Seconds between checks for changed files in --watch mode')
+    parser.add_argument('--since', default=None,
+                        help='Only mutate the functions changed since this git ref, and only analyze the PBTs that depend on them (analyze-pbts only)')
     args = parser.parse_args()
 
     # Directly call the function since it's the primary purpose of this script
@@ -233,6 +371,27 @@ def main():
         result = analyze_pbts_in_repo(
             args.repo_dir,
             mutant_num=args.mutant_num,
+            jobs=args.jobs,
+            mode=args.mode,
+            schema=args.schema,
+            selective_sandbox=args.selective_sandbox,
+            reuse_sandbox=args.reuse_sandbox,
+            timeout_factor=args.timeout_factor,
+            timeout_slack=args.timeout_slack,
+            memory_limit=args.memory_limit,
+            coverage=args.coverage,
+            cache=args.cache,
+            cache_size=args.cache_size,
+            ci_width=args.ci_width,
+            replay=args.replay,
+            seed=args.seed,
+            stats=args.stats,
+            subsumption=args.subsumption,
+            index_cache=args.index_cache,
+            index_jobs=args.index_jobs,
+            watch=args.watch,
+            watch_interval=args.watch_interval,
+            since=args.since,
         )
 
     elif sys.argv[0].endswith('analyze-pbt'):
@@ -240,11 +399,31 @@ def main():
             args.repo_dir,
             mutant_num=args.mutant_num,
             pbt_name_filter=args.pbt_name,
+            jobs=args.jobs,
+            mode=args.mode,
+            schema=args.schema,
+            selective_sandbox=args.selective_sandbox,
+            reuse_sandbox=args.reuse_sandbox,
+            timeout_factor=args.timeout_factor,
+            timeout_slack=args.timeout_slack,
+            memory_limit=args.memory_limit,
+            coverage=args.coverage,
+            cache=args.cache,
+            cache_size=args.cache_size,
+            ci_width=args.ci_width,
+            replay=args.replay,
+            seed=args.seed,
+            stats=args.stats,
+            subsumption=args.subsumption,
+            index_cache=args.index_cache,
+            index_jobs=args.index_jobs,
         )
 
     elif sys.argv[0].endswith('find-pbts'):
         result = find_pbts_in_repo(
             args.repo_dir,
+            index_cache=args.index_cache,
+            index_jobs=args.index_jobs,
         )
 
     else:
@@ -0,0 +1,51 @@
+"""
+a persistent cache of LLM responses, kept in sqlite under <repo>/.gru/.
+
+a response is keyed by a hash of the model, the temperature and the prompt, plus how many
+responses to that same prompt came before it in the session. a repeated run gets the same
+responses in the same order without asking the LLM, while asking again for a prompt within a
+run (because the last candidate got rejected) moves on to the next response rather than getting
+the rejected one back. only once a run asks for more responses to a prompt than were ever cached
+does the LLM get asked again
+"""
+import hashlib, os, sqlite3, time
+from typing import List
+
+def response_cache_path(repo_dir : str) -> str:
+    return os.path.join(os.path.abspath(repo_dir), '.gru', 'llm_cache.sqlite')
+
+def prompt_key(model, query : str, temperature : float) -> str:
+    h = hashlib.sha256()
+    for part in (model.model, repr(temperature), model.abstract_base, query):
+        h.update(part.encode() + b'\0')
+    return h.hexdigest()
+
+class ResponseCache:
+
+    def __init__(self, path : str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT, attempt INTEGER, response TEXT, created REAL, PRIMARY KEY (key, attempt))')
+        self.db.commit()
+        self.asked = {} # prompt key -> responses to it handed out this session
+
+    def generate_n(self, model, query : str, n : int, timeout : float) -> List[str]:
+        """the next n responses to query, from the cache where it has them and from model otherwise"""
+        temperature = model.temperature_for(n)
+        key = prompt_key(model, query, temperature)
+        start = self.asked.get(key, 0)
+        self.asked[key] = start + n
+        responses = dict(self.db.execute('SELECT attempt, response FROM responses WHERE key = ? AND attempt >= ? AND attempt < ?',
+                                         (key, start, start + n)))
+        missing = [attempt for attempt in range(start, start + n) if attempt not in responses]
+        if missing:
+            fresh = model.generate_n(query, len(missing), timeout, temperature)
+            now = time.time()
+            self.db.executemany('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)',
+                                [(key, attempt, response, now) for attempt, response in zip(missing, fresh)])
+            self.db.commit()
+            responses.update(zip(missing, fresh))
+        return [responses[attempt] for attempt in range(start, start + n) if attempt in responses]
+
+    def close(self):
+        self.db.close()
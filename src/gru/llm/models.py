@@ -1,12 +1,30 @@
 import os
 import re
-import requests 
+import time
+import random
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = 120.0 # seconds to wait on a response before giving up on the attempt
+CONNECT_TIMEOUT = 10.0
+MAX_TRIES = 5
+BACKOFF = 1.0 # seconds before the first retry, doubled for every one after
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+MAX_N = 4 # completions per request; more than that are split over concurrent requests
+# a single completion goes with the model's own (low) temperature, but at that temperature a batch
+# of candidates comes back as near-duplicates, so a batch is sampled at the API's default instead
+SAMPLE_TEMPERATURE = 1.0
+
+# backoff jitter gets its own generator, so that retries don't shift what the --seed'ed global one draws next
+_jitter = random.Random()
 
 class OpenAIModel:
 
-    def __init__(self, system: str, temperature=0.3):
+    def __init__(self, system: str, temperature=0.3, pool_size : int = 8):
         """Sets up the model with a system prompt and a temperature"""
-        
+
         self.model = 'gpt-3.5-turbo'
         self.apikey = os.getenv('OPENAI_KEY')
         self.baseurl = "https://api.openai.com/v1/chat/completions"
@@ -14,40 +32,106 @@ class OpenAIModel:
         self.temperature = temperature
         self.abstract_base = "You are an AI assistant that writes Python code. "
         self.messages = [{"role": "system", "content": self.system}]
+        self.pool_size = pool_size
+        self._session = None
+        self._lock = threading.Lock()
 
     def reset(self):
         self.messages = [{"role": "system", "content": self.system}]
 
-    def generate_full(self, query: str) -> str:
-        
-        headers = {
-            'Authorization': f'Bearer {self.apikey}',
-            'Content-Type': 'application/json'
-        }
-        
-        base = self.abstract_base 
+    @property
+    def session(self) -> requests.Session:
+        """one keep-alive session for every request, with up to pool_size connections for concurrent ones"""
+        with self._lock:
+            if self._session is None:
+                self._session = requests.Session()
+                self._session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size))
+                self._session.headers.update({
+                    'Authorization': f'Bearer {self.apikey}',
+                    'Content-Type': 'application/json'
+                })
+            return self._session
+
+    def close(self):
+        with self._lock:
+            if self._session is not None : self._session.close()
+            self._session = None
+
+    def _post(self, data : dict, timeout : float) -> dict:
+        """
+        posts data, retrying with exponential backoff (and jitter) on timeouts, dropped connections,
+        rate limits and server errors. anything else, like a bad key, fails right away
+        """
+        error = None
+        for attempt in range(MAX_TRIES):
+            if attempt : time.sleep(BACKOFF * 2 ** (attempt - 1) * (1 + _jitter.random()))
+            try:
+                response = self.session.post(self.baseurl, json=data, timeout=(CONNECT_TIMEOUT, timeout))
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+                continue
+            if response.status_code in RETRY_STATUSES:
+                error = Exception(f"{response.status_code}: {response.text[:200]}")
+                retry_after = response.headers.get('Retry-After')
+                if retry_after is not None and retry_after.isdigit() : time.sleep(min(float(retry_after), 60.0))
+                continue
+            if response.status_code != 200:
+                raise Exception(f"request failed with {response.status_code}: {response.text[:200]}")
+            try:
+                return response.json()
+            except ValueError as e:
+                error = e
+        raise Exception(f"Failed to get response after {MAX_TRIES} tries: {error}")
+
+    def temperature_for(self, n: int) -> float:
+        """the temperature n completions of one prompt are sampled at"""
+        return self.temperature if n == 1 else max(self.temperature, SAMPLE_TEMPERATURE)
+
+    def _complete(self, query: str, n: int, timeout: float, temperature: float) -> list:
+        """n completions of query, from a single request"""
+
+        base = self.abstract_base
         data = {
-            'model': self.model, 
+            'model': self.model,
             'messages': [
                 {'role': 'user', 'content': base + "\n" + query}
-            ]
-        }            
-        
-        tries = 0
-        while tries < 5:
-            try:
-                response = requests.post(self.baseurl, headers=headers, json=data)
-                res = response.json()['choices'][0]['message']['content']
-                return res
-            except:
-                tries += 1
-        raise Exception(f"Failed to get response after {tries} tries.")
+            ],
+            'temperature': temperature,
+            'n': n,
+        }
+
+        res = self._post(data, timeout)
+        return [choice['message']['content'] for choice in res['choices']]
+
+    def generate_n(self, query: str, n: int = 1, timeout: float = DEFAULT_TIMEOUT, temperature: float = None) -> list:
+        """
+        n completions of query, at temperature_for(n) unless given one. up to MAX_N come from one
+        request, and more than that from several requests issued at once through generate_many
+        """
+        if temperature is None : temperature = self.temperature_for(n)
+        sizes = [MAX_N] * (n // MAX_N) + ([n % MAX_N] if n % MAX_N else [])
+        if len(sizes) <= 1 : return self._complete(query, n, timeout, temperature)
+        return [res for completions in self.generate_many([(query, size) for size in sizes], timeout, temperature) for res in completions]
+
+    def generate_full(self, query: str, timeout: float = DEFAULT_TIMEOUT) -> str:
+        return self.generate_n(query, 1, timeout)[0]
+
+    def generate_many(self, batches: list, timeout: float = DEFAULT_TIMEOUT, temperature: float = None) -> list:
+        """
+        the completions for every (query, n) in batches, each from a single request, with up to
+        pool_size of them in flight at once
+        """
+        def complete(batch):
+            query, n = batch
+            return self._complete(query, n, timeout, self.temperature_for(n) if temperature is None else temperature)
+        with ThreadPoolExecutor(max_workers=max(1, min(self.pool_size, len(batches)))) as pool:
+            return list(pool.map(complete, batches))
 
 # Initialize the model
 model = OpenAIModel(system="", temperature=0.2)
 
 if __name__ == "__main__":
-    model = ChatModel(system="", temperature=0.2)
+    model = OpenAIModel(system="", temperature=0.2)
     res1 = model.generate_full("""Find survey papers on Julia.""")
     print(res1)
     breakpoint()
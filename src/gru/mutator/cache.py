@@ -0,0 +1,123 @@
+"""
+a persistent cache of mutant outcomes, kept in sqlite under <repo>/.gru/.
+
+entries are keyed by a hash of everything the outcome depends on: the test file and the PBT
+source, the dependency files, conftest.py and config files, the hypothesis/python versions and
+HYPOTHESIS_* environment, how mutants are run (pytest or in-process, schema or rewritten files),
+the time and memory limits, and finally the mutant itself. change any of those and the key
+changes with it, so a stale entry is simply never looked up again, and ages out through
+least-recently-used eviction once the cache grows past its size limit.
+
+hypothesis draws random examples, so a cached outcome is the outcome of one run. PBTs that are
+flaky against a mutant will keep whatever outcome they had the first time
+"""
+import hashlib, json, os, sqlite3, sys, time
+from typing import Dict, Iterable, List, Optional
+
+from gru.mutator.sandbox import CONFIG_FILES
+
+DEFAULT_CACHE_SIZE = 64 # MB
+
+def cache_path(repo_dir : str) -> str:
+    return os.path.join(os.path.abspath(repo_dir), '.gru', 'cache.sqlite')
+
+def _hypothesis_version() -> str:
+    try:
+        from importlib.metadata import version
+        return version('hypothesis')
+    except Exception:
+        return 'unknown'
+
+def _file_digest(path : str) -> str:
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return 'missing'
+
+def context_key(repo_dir : str, pbt_path : str, dep_files : Iterable[str], dep_list : str, settings : tuple) -> str:
+    """a hash of everything besides the PBT source and the mutant that decides how a mutant run turns out"""
+    repo_dir = os.path.abspath(repo_dir)
+    files = {os.path.abspath(pbt_path)} | {os.path.abspath(path) for path in dep_files}
+    files |= {os.path.join(repo_dir, name) for name in CONFIG_FILES}
+
+    # conftest.py files (where hypothesis profiles usually get registered) from the test up to the repo
+    directory = os.path.dirname(os.path.abspath(pbt_path))
+    while directory.startswith(repo_dir):
+        files.add(os.path.join(directory, 'conftest.py'))
+        if directory == repo_dir : break
+        directory = os.path.dirname(directory)
+
+    h = hashlib.sha256()
+    for path in sorted(files):
+        h.update((os.path.relpath(path, repo_dir) + ':' + _file_digest(path) + '\n').encode())
+    h.update(dep_list.encode())
+    h.update(repr(settings).encode())
+    h.update((_hypothesis_version() + sys.version).encode())
+    h.update(repr(sorted((k, v) for k, v in os.environ.items() if k.startswith('HYPOTHESIS'))).encode())
+    return h.hexdigest()
+
+def entry_key(context : str, *parts : Optional[str]) -> str:
+    h = hashlib.sha256(context.encode())
+    for part in parts:
+        # None (the original PBT) has to hash differently from any actual source text
+        h.update(b'\0' + (b'\1' if part is None else part.encode()))
+    return h.hexdigest()
+
+class OutcomeCache:
+    """a key -> json value store with a size limit, evicting the least recently used entries"""
+
+    def __init__(self, path : str, max_size : int = DEFAULT_CACHE_SIZE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_bytes = max_size * 1024 * 1024
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS outcomes (key TEXT PRIMARY KEY, value TEXT, size INTEGER, used REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS outcomes_used ON outcomes (used)')
+        self.db.commit()
+
+    def get_many(self, keys : List[str]) -> Dict[str, object]:
+        found = {}
+        for i in range(0, len(keys), 500): # sqlite caps the number of query parameters
+            chunk = keys[i:i + 500]
+            rows = self.db.execute('SELECT key, value FROM outcomes WHERE key IN (' + ','.join('?' * len(chunk)) + ')', chunk)
+            found.update((key, json.loads(value)) for key, value in rows)
+        if found:
+            now = time.time()
+            self.db.executemany('UPDATE outcomes SET used = ? WHERE key = ?', [(now, key) for key in found])
+            self.db.commit()
+        return found
+
+    def get(self, key : str):
+        """the cached value for key, or None"""
+        return self.get_many([key]).get(key)
+
+    def put_many(self, values : Dict[str, object]):
+        now = time.time()
+        rows = []
+        for key, value in values.items():
+            value = json.dumps(value)
+            rows.append((key, value, len(key) + len(value), now))
+        self.db.executemany('INSERT OR REPLACE INTO outcomes VALUES (?, ?, ?, ?)', rows)
+        self.db.commit()
+        self._evict()
+
+    def put(self, key : str, value):
+        self.put_many({key : value})
+
+    def _evict(self):
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM outcomes').fetchone()[0]
+        if total <= self.max_bytes : return
+
+        # drop the oldest entries until we're comfortably under the limit again
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        stale = []
+        for key, size in self.db.execute('SELECT key, size FROM outcomes ORDER BY used'):
+            stale.append((key,))
+            freed += size
+            if freed >= target : break
+        self.db.executemany('DELETE FROM outcomes WHERE key = ?', stale)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,105 @@
+"""
+coverage-guided mutant selection.
+
+the baseline PBT is run once under gru.mutator.trace, which says how often every line of the
+dependency files ran. each node of the dependency text (dep_list, which is ast.unparse'd and so
+has its own line numbers) is mapped back onto the lines of the function in its real file, and a
+mutant's "heat" is how often its hottest mutation site ran. a mutant with heat 0 changes only
+code the PBT never reaches, so it is a certain survivor and doesn't need to be run at all
+"""
+import ast, math, os, random
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from gru.mutator.mutator import find_mutation_sites, get_node_at
+
+NOT_COVERED = "not covered"
+
+# file -> line -> number of times the line ran
+Hits = Dict[str, Dict[int, int]]
+
+def load_hits(data : dict) -> Hits:
+    """the json written by the trace plugin has string line numbers"""
+    return {filename : {int(line) : count for line, count in lines.items()} for filename, lines in data.items()}
+
+def _find_def(tree : ast.AST, name : str) -> Optional[ast.FunctionDef]:
+    # the same lookup get_function_definition does, so we land on the def the dependency text came from
+    for node in ast.walk(tree):
+        if isinstance(node, ast.FunctionDef) and node.name == name : return node
+    return None
+
+def _lines(node : ast.AST) -> Tuple[int, int]:
+    """the lines that run when node does; for compound statements that's just the header"""
+    start, end = node.lineno, getattr(node, 'end_lineno', None) or node.lineno
+    body = getattr(node, 'body', None)
+    if isinstance(node, ast.stmt) and isinstance(body, list) and body and not isinstance(node, ast.FunctionDef):
+        end = max(start, body[0].lineno - 1)
+    return start, end
+
+class CoverageMap:
+    """maps the nodes of the dependency text onto (file, first line, last line) in the files they came from"""
+
+    def __init__(self, dep_list : str, dep_files : Dict[str, str]):
+        self.tree = ast.parse(dep_list)
+        self.spans = {}
+
+        file_trees = {}
+        for fdef in self.tree.body:
+            if not isinstance(fdef, ast.FunctionDef) or fdef.name not in dep_files : continue
+            filepath = os.path.realpath(dep_files[fdef.name])
+            if filepath not in file_trees:
+                try:
+                    with open(filepath, 'r', encoding='utf-8') as f:
+                        file_trees[filepath] = ast.parse(f.read())
+                except (OSError, SyntaxError):
+                    file_trees[filepath] = None
+            if file_trees[filepath] is None : continue
+
+            file_def = _find_def(file_trees[filepath], fdef.name)
+            if file_def is None : continue
+
+            # the dependency text is the def unparsed, so both walk through the same nodes in the same order
+            nodes, file_nodes = list(ast.walk(fdef)), list(ast.walk(file_def))
+            if len(nodes) != len(file_nodes) or any(type(a) != type(b) for a, b in zip(nodes, file_nodes)):
+                continue # didn't line up, so leave the whole function unmapped (and never prune it)
+            for node, file_node in zip(nodes, file_nodes):
+                if hasattr(file_node, 'lineno'):
+                    self.spans[id(node)] = (filepath,) + _lines(file_node)
+
+    def heat(self, mutant : str, hits : Hits) -> float:
+        """how many times the hottest site of mutant ran; 0 if none of them ever did"""
+        try:
+            mutant_tree = ast.parse(mutant)
+        except SyntaxError:
+            return math.inf # let the run itself sort it out
+
+        sites = find_mutation_sites(self.tree, mutant_tree)
+        if not sites : return math.inf
+
+        heat = 0
+        for path, _ in sites:
+            span = self.spans.get(id(get_node_at(self.tree, path)))
+            if span is None : return math.inf # unmapped sites are never pruned
+            filepath, start, end = span
+            lines = hits.get(filepath, {})
+            heat = max(heat, max(lines.get(line, 0) for line in range(start, end + 1)))
+        return heat
+
+def sample_mutants(mutants : Iterable[str], num : int, heat : Dict[str, float]) -> List[str]:
+    """
+    picks num mutants, favouring ones whose sites run often (weighted by log of the hit count, so
+    a hot loop doesn't crowd everything else out). mutants that are never reached are only picked
+    once every reached one has been
+    """
+    mutants = sorted(mutants) # sets of strings don't have a stable order across runs
+    covered = [mutant for mutant in mutants if heat[mutant] > 0]
+    uncovered = [mutant for mutant in mutants if heat[mutant] == 0]
+
+    # weighted sampling without replacement: rank by u^(1/w) and keep the top num (Efraimidis-Spirakis)
+    def key(mutant):
+        weight = 1.0 if math.isinf(heat[mutant]) else math.log1p(heat[mutant])
+        return random.random() ** (1.0 / weight)
+    ranked = sorted(covered, key=key, reverse=True)
+
+    sample = ranked[:num]
+    if len(sample) < num : sample += random.sample(uncovered, min(num - len(sample), len(uncovered)))
+    return sample
@@ -0,0 +1,61 @@
+"""
+throwing away mutants that aren't worth a pytest run, before anything is run.
+
+every mutant is compiled in-process. ones that don't parse or compile can't tell us anything,
+and ones that compile to exactly the same bytecode as the original (or as a mutant we already
+kept) are trivially equivalent to it, so running them would only repeat a known outcome
+"""
+import types, warnings
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+DOES_NOT_COMPILE = "does not compile"
+SAME_AS_ORIGINAL = "same bytecode as the original"
+SAME_AS_MUTANT = "same bytecode as another mutant"
+
+def _normalize(code : types.CodeType) -> tuple:
+    """everything about a code object that affects what it does, leaving out names of files and line numbers"""
+    consts = tuple(_normalize(const) if isinstance(const, types.CodeType) else (type(const).__name__, repr(const))
+                   for const in code.co_consts)
+    return (code.co_name, code.co_code, consts, code.co_names, code.co_varnames, code.co_freevars,
+            code.co_cellvars, code.co_argcount, code.co_posonlyargcount, code.co_kwonlyargcount, code.co_flags,
+            getattr(code, 'co_exceptiontable', b''))
+
+def bytecode_key(source : str) -> tuple:
+    """compiles source and returns a key that's equal for sources with identical bytecode"""
+    with warnings.catch_warnings():
+        # mutants like `x is 1` compile with a SyntaxWarning, which we don't want to print
+        warnings.simplefilter("ignore")
+        return _normalize(compile(source, '<mutant>', 'exec'))
+
+def filter_mutants(code : str, mutants : Iterable[str], limit : int = None) -> Tuple[List[str], Dict[str, int]]:
+    """
+    drops the mutants of code that don't compile or are bytecode-identical to the original or to
+    each other. returns the kept mutants, and how many were dropped for each reason. with limit,
+    mutants are taken in the order given and no more are looked at once limit of them are kept
+    """
+    removed = Counter()
+    seen = {bytecode_key(code)}
+    original_key = next(iter(seen))
+
+    kept = []
+    for mutant in (sorted(mutants) if limit is None else mutants):
+        if limit is not None and len(kept) >= limit : break
+        try:
+            key = bytecode_key(mutant)
+        except Exception: # SyntaxError, ValueError, and whatever else a broken AST compiles into
+            removed[DOES_NOT_COMPILE] += 1
+            continue
+
+        if key in seen:
+            removed[SAME_AS_ORIGINAL if key == original_key else SAME_AS_MUTANT] += 1
+            continue
+
+        seen.add(key)
+        kept.append(mutant)
+    return kept, dict(removed)
+
+def describe_removed(removed : Dict[str, int]) -> str:
+    total = sum(removed.values())
+    reasons = ", ".join(str(count) + " " + reason for reason, count in sorted(removed.items()))
+    return "filtered out " + str(total) + " mutants before running them (" + reasons + ")"
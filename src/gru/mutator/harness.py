@@ -1,33 +1,172 @@
-from typing import Set
-import ast, astor
+from collections import defaultdict
+from typing import Dict, Iterator, List, Set, Tuple
+import bisect, heapq, itertools, random
 
 if __name__ == '__main__':
-    from mutator import mutate_ast
+    from mutator import MutationIndex, mutation_id, stratum_at
+    from filter import filter_mutants
 else:
-    from gru.mutator.mutator import mutate_ast
+    from gru.mutator.mutator import MutationIndex, mutation_id, stratum_at
+    from gru.mutator.filter import filter_mutants
 
 def mutate_map(code : str, num_mutants : int, depth : int) -> Set[str]:
     """
-    takes some python code and returns a set of mutants
+    takes some python code and returns a set of mutants: num_mutants random mutations of it, then
+    num_mutants random further mutations of each of those, and so on, depth deep
 
-    does some naive separation between operation types to ensure syntactic correctness is maintained
+    the code is parsed and indexed once, and further mutations only go to nodes not mutated yet
     """
-    if depth == 0 : return {}
-    mutants = set()
+    index = MutationIndex(code)
 
-    for i in range(num_mutants):
-        tree = ast.parse(code)
-        modified_tree = mutate_ast(tree)
-        mutants.add(astor.to_source(modified_tree))
+    def grow(mutant : frozenset, depth : int) -> Set[frozenset]:
+        if depth == 0 : return set()
+        taken = {path for path, _ in mutant}
+        mutants = set()
+        for i in range(num_mutants):
+            mutation = index.random_mutation(taken)
+            if mutation is None : break
+            mutants.add(mutant | {mutation})
 
-    ret = set()
-    for mutant in mutants:
-        # recurse
-        mut_depth_add = mutate_map(str(mutant), num_mutants, depth - 1) 
-        
-        # add result to ret
-        ret.add(mutant)
-        ret = ret.union(mut_depth_add)
+        ret = set(mutants)
+        for mutant in mutants:
+            ret |= grow(mutant, depth - 1)
+        return ret
 
-    ret = ret - {code} # remove non-mutated code
-    return ret
+    return {index.build(tuple(mutant)) for mutant in grow(frozenset(), depth)}
+
+class MutantSpace:
+    """
+    every mutant of some code with one or two mutations (see gru.mutator.mutator.MutationIndex),
+    from a single parse. a mutant is a descriptor, a tuple of mutations at different nodes, and
+    nothing is built until asked for. descriptors are numbered in a fixed order, the single
+    mutations first and then the pairs, so that any of them can be looked up by its index
+    """
+
+    def __init__(self, code : str, order : int = 2, functions : set = None):
+        self.index = MutationIndex(code, functions)
+        self.tree = self.index.tree
+        self.mutations = list(self.index.mutations())
+        n = len(self.mutations)
+
+        # a pair is a mutation and a later one of a different node. mutations of the same node are
+        # next to each other, so the partners of mutation i are everything from the end of its node's run on
+        self.partners_from = [n] * n
+        for i in reversed(range(n - 1)):
+            same_node = self.mutations[i][0] == self.mutations[i + 1][0]
+            self.partners_from[i] = self.partners_from[i + 1] if same_node else i + 1
+
+        # pair_offsets[i] is the number of pairs that start with a mutation before i
+        self.pair_offsets = [0]
+        for i in range(n if order >= 2 else 0):
+            self.pair_offsets.append(self.pair_offsets[-1] + n - self.partners_from[i])
+
+    def __len__(self) -> int:
+        return len(self.mutations) + self.pair_offsets[-1]
+
+    def __getitem__(self, index : int) -> tuple:
+        n = len(self.mutations)
+        if not 0 <= index < len(self) : raise IndexError(index)
+        if index < n : return (self.mutations[index],)
+
+        pair = index - n
+        i = bisect.bisect_right(self.pair_offsets, pair) - 1
+        return (self.mutations[i], self.mutations[self.partners_from[i] + pair - self.pair_offsets[i]])
+
+    def __iter__(self) -> Iterator[tuple]:
+        for mutation in self.mutations:
+            yield (mutation,)
+        for i in range(len(self.pair_offsets) - 1):
+            for j in range(self.partners_from[i], len(self.mutations)):
+                yield (self.mutations[i], self.mutations[j])
+
+    def strata(self) -> Dict[Tuple[str, str], List[Tuple[int, int]]]:
+        """
+        (function, node type) of the first mutation -> the (start, length) index ranges of the
+        descriptors in that stratum
+        """
+        n = len(self.mutations)
+        strata = defaultdict(list)
+        for i, (path, _) in enumerate(self.mutations):
+            stratum = strata[stratum_at(self.tree, path)]
+            stratum.append((i, 1))
+            if i + 1 < len(self.pair_offsets):
+                stratum.append((n + self.pair_offsets[i], self.pair_offsets[i + 1] - self.pair_offsets[i]))
+        return strata
+
+    def build(self, descriptor : tuple) -> str:
+        return self.index.build(descriptor)
+
+def _shuffled(size : int, rng : random.Random) -> Iterator[int]:
+    """the numbers below size in a random order, drawn lazily, so memory only grows with how many are taken"""
+    seen = set()
+    while len(seen) < size:
+        if 2 * len(seen) > size:
+            # past half, most draws would be repeats, so shuffle whatever is left instead
+            rest = [i for i in range(size) if i not in seen]
+            rng.shuffle(rest)
+            yield from rest
+            return
+        i = rng.randrange(size)
+        if i not in seen:
+            seen.add(i)
+            yield i
+
+def _shuffled_stratum(ranges : List[Tuple[int, int]], rng : random.Random) -> Iterator[int]:
+    starts = list(itertools.accumulate(length for _, length in ranges))
+    for position in _shuffled(starts[-1], rng):
+        r = bisect.bisect_right(starts, position)
+        yield ranges[r][0] + position - (starts[r - 1] if r > 0 else 0)
+
+def sample_order(space : MutantSpace, rng : random.Random, stratified : bool = False) -> Iterator[int]:
+    """
+    the indices of every descriptor in space, in a random order drawn lazily from rng. stratified
+    interleaves strata (see MutantSpace.strata) so any prefix has each one in close to its share
+    """
+    if not stratified:
+        yield from _shuffled(len(space), rng)
+        return
+
+    # the i-th draw of a stratum of size n is placed at roughly i/n, as in sequential.stratified_order
+    queue = []
+    for s, (_, ranges) in enumerate(sorted(space.strata().items())):
+        size = sum(length for _, length in ranges)
+        queue.append((rng.random() / size, s, 0, size, _shuffled_stratum(ranges, rng)))
+    heapq.heapify(queue)
+    while queue:
+        _, s, i, size, draws = heapq.heappop(queue)
+        yield next(draws)
+        if i + 1 < size : heapq.heappush(queue, ((i + 1 + rng.random()) / size, s, i + 1, size, draws))
+
+def iter_mutants(code : str, seed : int = None, order : int = 2, stratified : bool = False,
+                 functions : set = None) -> Iterator[Tuple[str, str]]:
+    """
+    (id, source) of every mutant of code with up to order (1 or 2) mutations, in a random order
+    that only depends on seed. each source is built when it's reached, so taking a few is cheap
+    however many mutants there are. given functions, only those top-level functions get mutated
+    """
+    space = MutantSpace(code, order, functions)
+    for index in sample_order(space, random.Random(seed), stratified):
+        descriptor = space[index]
+        yield mutation_id(descriptor), space.build(descriptor)
+
+def draw_mutants(code : str, num : int, seed : int = None, stratified : bool = False,
+                 functions : set = None) -> Tuple[Dict[str, str], Dict[str, int]]:
+    """
+    up to num mutants of code that are worth running (see gru.mutator.filter), drawn through
+    iter_mutants. returns source -> id of the kept ones, and how many were filtered out on the way
+    """
+    ids = {}
+    def sources():
+        for mutant_id, source in iter_mutants(code, seed, stratified=stratified, functions=functions):
+            ids.setdefault(source, mutant_id)
+            yield source
+
+    kept, removed = filter_mutants(code, sources(), limit=num)
+    return {source : ids[source] for source in kept}, removed
+
+def pool_size(num : int, picked : bool) -> int:
+    """
+    how many mutants to draw when num of them get run. num, unless mutants are then picked from the
+    pool (by coverage) or scored over it (--ci_width), where it's as many as mutate_map's two rounds of num
+    """
+    return num * (num + 1) if picked else num
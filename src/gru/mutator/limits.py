@@ -0,0 +1,63 @@
+"""
+time and resource limits for the processes mutants run in.
+
+mutants happily turn loops infinite or allocate without bound, so every child gets its own
+process group (so it can be killed along with anything it spawned) and, where the platform
+has them, rlimits on address space and cpu time
+"""
+import math, os, signal, subprocess
+from typing import Callable, Optional, Tuple
+
+try:
+    import resource
+except ImportError: # not on windows
+    resource = None
+
+TIMEOUT = "timeout"
+
+# (wall-clock seconds, memory limit in MB); None means unlimited
+Limits = Tuple[Optional[float], Optional[int]]
+NO_LIMITS = (None, None)
+
+def mutant_budget(baseline : float, factor : float, slack : float) -> Optional[float]:
+    """how long a mutant gets, given how long the unmutated PBT took; None disables the timeout"""
+    if baseline is None or factor <= 0 : return None
+    return factor * baseline + slack
+
+def preexec_limits(memory_limit : Optional[int], cpu_limit : Optional[float]) -> Optional[Callable]:
+    """a preexec_fn that puts rlimits on the child, or None if there is nothing to limit"""
+    if resource is None or (memory_limit is None and cpu_limit is None) : return None
+
+    def apply():
+        if memory_limit is not None:
+            limit = int(memory_limit) * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        if cpu_limit is not None:
+            # a backstop for the wall-clock timeout, which is what should normally fire first
+            seconds = int(math.ceil(cpu_limit)) + 1
+            resource.setrlimit(resource.RLIMIT_CPU, (seconds, seconds + 1))
+    return apply
+
+def popen_kwargs(limits : Limits, cpu : bool = True) -> dict:
+    """extra Popen arguments for a child running under limits (cpu=False for long-lived children)"""
+    timeout, memory_limit = limits
+    kwargs = {'start_new_session' : True}
+    preexec_fn = preexec_limits(memory_limit, timeout if cpu else None)
+    if preexec_fn is not None : kwargs['preexec_fn'] = preexec_fn
+    return kwargs
+
+def kill_group(proc : subprocess.Popen):
+    """kills a child started with popen_kwargs, and everything it spawned"""
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(proc.pid, signal.SIGKILL)
+        else:
+            proc.kill()
+    except (ProcessLookupError, PermissionError):
+        pass
+    proc.wait()
+
+def hit_limit(returncode : int) -> bool:
+    """did the child die from its cpu rlimit (or get killed outright)"""
+    signals = {getattr(signal, name) for name in ('SIGXCPU', 'SIGKILL') if hasattr(signal, name)}
+    return returncode is not None and returncode < 0 and -returncode in signals
@@ -1,6 +1,5 @@
-from collections import defaultdict
-import json, random, ast, astor, copy
-from typing import Set
+import random, ast
+from typing import Iterator, List, Optional, Tuple
 
 # ast.compare
 mut_compare = {"Eq", "NotEq", "Lt", "LtE", "Gt", "GtE"}
@@ -23,179 +22,237 @@ mut_augassign = {"Add", "Sub", "Mult", "Div", "FloorDiv", "Mod", "Pow",
 
 name_constant_mut = {True, False, None}
 
-def ast_to_dict(node) -> dict:
+# a mutation is (path, replacement): the path of the node it changes (as get_node_at takes it), and the
+# operator name, index or constant the node gets instead. a mutant is a tuple of mutations of different nodes
+Mutation = Tuple[tuple, object]
+
+# the operators that can stand in for each other, for every kind of node with an operator
+OPERATOR_GROUPS = {
+    ast.Compare : (mut_compare, mut_set_compare),
+    ast.BinOp : (mut_binop, mut_bitop, mut_shiftop),
+    ast.BoolOp : (mut_boolop,),
+    ast.UnaryOp : (mut_unaryop - {"If"},), # an if isn't an operator
+    ast.AugAssign : (mut_augassign,),
+}
+MUTABLE_TYPES = tuple(OPERATOR_GROUPS) + (ast.Subscript, ast.If)
+
+def replacements(node : ast.AST) -> list:
+    """everything node can be mutated into, in a fixed order, leaving out the choices that change nothing"""
+    if isinstance(node, tuple(OPERATOR_GROUPS)):
+        op = type(node.ops[0] if isinstance(node, ast.Compare) else node.op).__name__
+        for group in OPERATOR_GROUPS[type(node)]:
+            if op in group : return sorted(group - {op})
+        return []
+    if isinstance(node, ast.Subscript):
+        # only integer indices can be bumped; dict keys and the like are left alone
+        index = node.slice
+        if isinstance(index, ast.Constant) and isinstance(index.value, int) and not isinstance(index.value, bool):
+            return [i for i in dict.fromkeys([index.value + 1, index.value - 1, -1]) if i != index.value]
+        return []
+    if isinstance(node, ast.If):
+        pinned = node.test.value if isinstance(node.test, ast.Constant) else None
+        return [value for value in (False, True) if pinned is not value]
+    return []
+
+def mutable_nodes(tree : ast.AST) -> Iterator[Tuple[tuple, ast.AST]]:
+    """(path, node) of every node that can be mutated, depth first in field order"""
+    stack = [((), tree)]
+    while stack:
+        path, node = stack.pop()
+        if isinstance(node, MUTABLE_TYPES) : yield path, node
+
+        children = []
+        for field, value in ast.iter_fields(node):
+            if isinstance(value, ast.AST):
+                children.append((path + (field,), value))
+            elif isinstance(value, list):
+                children += [(path + (field, i), item) for i, item in enumerate(value) if isinstance(item, ast.AST)]
+        stack.extend(reversed(children))
+
+def _edit(node : ast.AST, replacement):
+    if isinstance(node, ast.Compare):
+        node.ops = [getattr(ast, replacement)()] + node.ops[1:]
+    elif isinstance(node, tuple(OPERATOR_GROUPS)):
+        node.op = getattr(ast, replacement)()
+    elif isinstance(node, ast.Subscript):
+        node.slice = ast.Constant(value=replacement)
+    elif isinstance(node, ast.If):
+        node.test = ast.Constant(value=replacement)
+
+def apply_mutation(tree : ast.AST, mutation : Mutation):
+    """makes a mutation to tree, in place"""
+    path, replacement = mutation
+    _edit(get_node_at(tree, path), replacement)
+
+def _shallow(node : ast.AST) -> ast.AST:
+    copied = node.__class__.__new__(node.__class__)
+    copied.__dict__.update(node.__dict__)
+    return copied
+
+def _copy_down(node : ast.AST, path : tuple) -> ast.AST:
+    """shallow-copies every node and list on path below node (which must already be a copy) and returns the last one"""
+    i = 0
+    while i < len(path):
+        field = path[i]
+        if i + 1 < len(path) and isinstance(path[i + 1], int):
+            items = list(getattr(node, field))
+            child = items[path[i + 1]] = _shallow(items[path[i + 1]])
+            setattr(node, field, items)
+            i += 2
+        else:
+            child = _shallow(getattr(node, field))
+            setattr(node, field, child)
+            i += 1
+        node = child
+    return node
+
+class MutationIndex:
+    """
+    the mutable nodes of some code, found with one walk over one parse. mutants are made without
+    touching the parsed tree: only the nodes on the path down to a mutated node are copied and
+    edited, and only the top-level statements a mutant changes get unparsed again.
+
+    given functions (names of top-level functions), only the nodes inside those are mutated
+    """
+
+    def __init__(self, code : str, functions : set = None):
+        self.tree = ast.parse(code)
+        self.sites = [(path, replacements(node)) for path, node in mutable_nodes(self.tree)]
+        self.sites = [(path, choices) for path, choices in self.sites
+                      if choices and (functions is None or stratum_at(self.tree, path)[0] in functions)]
+        self.texts = {} # top-level statement -> its unparsed text
+
+    def mutations(self) -> Iterator[Mutation]:
+        """every single mutation, with all the ones of the same node next to each other"""
+        for path, choices in self.sites:
+            for replacement in choices:
+                yield (path, replacement)
+
+    def random_mutation(self, taken : set = frozenset(), rng : random.Random = random) -> Optional[Mutation]:
+        """a random mutation of a random node whose path isn't in taken, or None if there's none left"""
+        if len(self.sites) <= len(taken) : return None
+        while True:
+            path, choices = rng.choice(self.sites)
+            if path not in taken : return (path, rng.choice(choices))
+
+    def _text(self, i : int) -> str:
+        if i not in self.texts : self.texts[i] = ast.unparse(self.tree.body[i])
+        return self.texts[i]
+
+    def build(self, mutations : tuple) -> str:
+        """source of the code with mutations made to it"""
+        root = _shallow(self.tree)
+        # deepest first, so a mutation that replaces a whole subtree (an if's test) can't take another's node away
+        for path, replacement in sorted(mutations, key=lambda mutation : -len(mutation[0])):
+            _edit(_copy_down(root, path), replacement)
+
+        changed = {path[1] for path, _ in mutations}
+        return "\n\n".join(ast.unparse(stmt) if i in changed else self._text(i) for i, stmt in enumerate(root.body))
+
+def mutation_id(mutations : tuple) -> str:
+    """a readable id for a set of mutations, like "body.0.body.1.test=Lt", that stays the same as long as the code does"""
+    return "+".join(".".join(str(step) for step in path) + "=" + str(replacement) for path, replacement in mutations)
+
+def parse_mutation_id(mutant_id : str) -> tuple:
+    """the mutations a mutation_id was made from"""
+    def value(text):
+        if text in ("True", "False") : return text == "True"
+        try:
+            return int(text)
+        except ValueError:
+            return text # an operator name
+
+    mutations = []
+    for part in mutant_id.split("+"):
+        path, replacement = part.rsplit("=", 1)
+        mutations.append((tuple(int(step) if step.isdigit() else step for step in path.split(".")), value(replacement)))
+    return tuple(mutations)
+
+def mutate_ast(tree : ast.AST) -> ast.AST:
     """
-    Translate AST node to a dict.
-    Typical fields include 'ops', 'type', 'left', 'right'
+    does a single syntactic mutation on the inputted AST, in place
     """
-    if isinstance(node, ast.AST):
-        fields = {key: ast_to_dict(value) for key, value in ast.iter_fields(node)}
-        return {'type': node.__class__.__name__, **fields}
-    elif isinstance(node, list):
-        return [ast_to_dict(item) for item in node]
-    else:
-        return node
-
-def dict_to_ast(d : dict) -> ast.AST:
+    nodes = list(mutable_nodes(tree))
+    assert len(nodes) > 0, "node_list should not be empty"
+
+    path, node = random.choice(nodes)
+    choices = replacements(node)
+    if choices : apply_mutation(tree, (path, random.choice(choices)))
+    return tree
+
+
+def _site_kind(node : ast.AST, parent : ast.AST) -> str:
     """
-    Translate dict into AST node in inverse with the previous function
+    whether a node can stand on its own as a mutation site: "expr" if it can be swapped for a
+    conditional expression, "stmt" if it can be swapped for an if statement, and None otherwise
     """
-    if not isinstance(d, dict):
-        return d
-    
-    node_type = getattr(ast, d['type'], None)
-    if not node_type:
-        return d
-    
-    fields = {}
-    for key, value in d.items():
-        if key != 'type':
-            if isinstance(value, list):
-                fields[key] = [dict_to_ast(item) for item in value]
-            else:
-                fields[key] = dict_to_ast(value)
-    return node_type(**fields)
-
-# NodeCollector, NodeFinder, NodeReplacer helpers for reasoning about the AST
-# ngl could probably do it in a better format, but it's ok for now i suppose
-class NodeCollector(ast.NodeVisitor):
-    def __init__(self):
-        self.nodes_by_type = defaultdict(list)
-    
-    def generic_visit(self, node):
-        node_type = type(node).__name__
-        self.nodes_by_type[node_type].append(node)
-        super().generic_visit(node)
-
-class NodeFinder(ast.NodeVisitor):
-    def __init__(self, condition):
-        self.condition = condition
-        self.target_node = None
-    
-    def generic_visit(self, node):
-        if self.condition(node):
-            self.target_node = node
-        super().generic_visit(node)
-
-class NodeReplacer(ast.NodeTransformer):
-    def __init__(self, target_node, new_node):
-        self.target_node = target_node
-        self.new_node = new_node
-    
-    def generic_visit(self, node):
-        if node == self.target_node:
-            return self.new_node
-        return super().generic_visit(node)
+    if isinstance(node, ast.stmt) : return "stmt"
+    if not isinstance(node, ast.expr) : return None
+    if not isinstance(getattr(node, 'ctx', ast.Load()), ast.Load) : return None
+    if isinstance(node, (ast.Starred, ast.FormattedValue)) : return None
+    if isinstance(parent, (ast.JoinedStr, ast.pattern)) : return None
+    return "expr"
 
-def mutate_ast(tree : ast.AST) -> ast.AST:
+def get_node_at(tree : ast.AST, path : tuple) -> ast.AST:
+    """follows a path of (field) and (field, index) steps down from tree"""
+    node = tree
+    for step in path:
+        if isinstance(step, int):
+            node = node[step]
+        else:
+            node = getattr(node, step)
+    return node
+
+def stratum_at(tree : ast.AST, path : tuple) -> Tuple[str, str]:
+    """(function, node type) of the node at path: the top-level function it's in, or "<module>", and what it is"""
+    function = get_node_at(tree, path[:2]) if len(path) >= 2 else None
+    function = function.name if isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)) else "<module>"
+    return (function, type(get_node_at(tree, path)).__name__)
+
+def find_mutation_sites(original : ast.AST, mutant : ast.AST) -> List[Tuple[tuple, str]]:
     """
-    does a single syntactic mutation on the inputted AST
+    compares an AST with a mutant of it and returns the (path, kind) of every place they differ.
+    each difference is lifted to the closest enclosing expression or statement, so that a
+    changed operator reports the BinOp/Compare/AugAssign it belongs to rather than the operator
     """
-    collector = NodeCollector()
-    collector.visit(tree)
-
-    # set of tuples; (node_type, node)
-    node_list = set()
-
-    for node_type, nodes in collector.nodes_by_type.items():
-        #if node_type in ["Compare", "BinOp", "BoolOp", "UnaryOp", "AugAssign", "Subscript", "Slice", "NameConstant", "If"]:
-        if node_type in ["Compare", "BinOp", "BoolOp", "UnaryOp", "AugAssign", "Subscript", "NameConstant", "If"]:
-            for node in nodes : node_list.add((node_type, node))
-
-    assert isinstance(collector.nodes_by_type, dict), "Expected nodes_by_type to be a dictionary"
-    assert all(isinstance(nodes, list) for nodes in collector.nodes_by_type.values()), "Expected nodes to be lists"
-    assert len(node_list) > 0, "node_list should not be empty"
-
-    node_type, node = random.choice(list(node_list))
-    nd = ast_to_dict(node)
-    if 'op' in nd:
-        op = nd['op']['type']
-    elif 'ops' in nd:
-        op = nd['ops'][0]['type']
-
-    # just lots of cases to properly mutate, could look prettier with a lambda idk
-    samp = None
-    match node_type:
-        case "Compare":
-            op = nd['ops'][0]['type']
-            if op in mut_compare:
-                samp = random.choice(list(mut_compare - {op}))
-            elif op in mut_set_compare:
-                samp = random.choice(list(mut_set_compare - {op}))
-            elif op == "Is" : samp = op
-            else:
-                samp = op
-        case "BinOp":
-            op = nd['op']['type']
-            if op in mut_binop:
-                samp = random.choice(list(mut_binop - {op}))
-            elif op in mut_bitop:
-                samp = random.choice(list(mut_bitop - {op}))
-            elif op in mut_shiftop:
-                samp = random.choice(list(mut_shiftop - {op}))
-            else:
-                samp = op
-        case "BoolOp":
-            op = nd['op']['type']
-            if op in mut_boolop:
-                samp = random.choice(list(mut_boolop - {op}))
-            else:
-                samp = op
-        case "UnaryOp":
-            op = nd['op']['type']
-            if op in mut_unaryop:
-                samp = random.choice(list(mut_unaryop - {op}))
-            else:
-                samp = op
-        case "AugAssign":
-            op = nd['op']['type']
-            if op in mut_augassign:
-                samp = random.choice(list(mut_augassign - {op}))
-            else:
-                samp = op
-        case "Subscript":
-            if 'slice' in nd:
-                if isinstance(nd['slice'], dict) and 'type' in nd['slice'] and nd['slice']['type'] == 'Constant':
-                    current_index = nd['slice']['value']
-                    samp = random.choice([current_index + 1, current_index - 1, -1])
-                    nd['slice']['value'] = samp
-        case "Slice":
-            if not (nd['lower'] != None or nd['upper'] != None):
-                tmp = nd['lower']
-                nd['lower'] = nd['upper']
-                nd['upper'] = tmp
-            else:
-                lower_value = nd['lower']['value'] if nd['lower'] else None
-                upper_value = nd['upper']['value'] if nd['upper'] else None
-
-                if random.random() > 0.5:
-                    nd['lower']['value'] = lower_value + random.choice([-1, 1])
-                else:
-                    nd['upper']['value'] = upper_value + random.choice([-1, 1])
-        case "NameConstant":
-            if 'value' in nd:
-                current_value = nd['value']
-                samp = random.choice(list(name_constant_mut - {current_value}))
-                nd['value'] = samp
-        case "If":
-            if 'test' in nd:
-                samp = random.choice([True, False])
-                nd['test'] = {'type': 'NameConstant', 'value': samp}
-        case _:
-            pass
-
-    if 'op' in nd:
-        nd['op']['type'] = samp
-    elif 'ops' in nd:
-        nd['ops'][0]['type'] = samp
-
-    try:
-        repl = dict_to_ast(nd)
-        replacer = NodeReplacer(node, repl)
-        modified_tree = replacer.visit(tree)
-    except Exception as e: 
-        return tree # if parsing fails, just bail
-
-    return modified_tree
+    sites = []
+
+    def record(anchors):
+        for path, kind in reversed(anchors):
+            if kind is not None:
+                sites.append((path, kind))
+                return
+
+    def visit(o, m, path, parent, anchors):
+        anchors = anchors + [(path, _site_kind(o, parent))]
+        if type(o) != type(m):
+            record(anchors)
+            return
+
+        for field in o._fields:
+            ov, mv = getattr(o, field, None), getattr(m, field, None)
+            if isinstance(ov, ast.AST):
+                visit(ov, mv, path + (field,), o, anchors)
+            elif isinstance(ov, list):
+                if not isinstance(mv, list) or len(ov) != len(mv):
+                    record(anchors)
+                    return
+                for i, (a, b) in enumerate(zip(ov, mv)):
+                    if isinstance(a, ast.AST):
+                        visit(a, b, path + (field, i), o, anchors)
+                    elif a != b:
+                        record(anchors)
+                        return
+            elif ov != mv:
+                record(anchors)
+                return
 
+    visit(original, mutant, (), None, [])
 
+    # a site nested inside another site of the same mutant is already covered by the outer one
+    sites = sorted(set(sites), key=lambda site : len(site[0]))
+    ret = []
+    for path, kind in sites:
+        if not any(path[:len(outer)] == outer for outer, _ in ret):
+            ret.append((path, kind))
+    return ret
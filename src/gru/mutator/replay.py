@@ -0,0 +1,281 @@
+"""
+sharing what hypothesis finds between mutant runs, instead of every run searching from scratch.
+
+two things are kept under <repo>/.gru/, across mutants, refinement iterations and invocations:
+
+- a hypothesis example database (.gru/hypothesis), which every run of every PBT uses. hypothesis
+  saves failing examples there and replays them first on the next run of the same test, so an
+  input that killed one mutant is the first thing tried against the next.
+- a replay corpus per PBT (.gru/replay/<pbt>/<version>/), holding pickled test arguments: a sample
+  of the inputs the baseline run generated, and every input that killed a mutant. the database
+  is keyed by the test's source and so forgets everything when refinement rewrites the PBT; the
+  corpus doesn't.
+
+before a mutant run, corpus entries are added to the PBT as explicit examples, so hypothesis runs
+them (with notes, assume() and all) before its own database and generation phases. inputs recorded
+by another version of the PBT may not be ones the current version would ever generate, so those
+are only replayed once the baseline run has checked they pass against the unmutated code.
+
+replaying goes through hypothesis internals (the inner test and given arguments of a test, explicit
+examples as a list on it). replay_supported checks once that they're there; if a hypothesis
+version doesn't have them, only the shared example database is used.
+
+this module is both the helpers the runner and the in-process worker use, and a pytest plugin
+(`-p gru.mutator.replay`) configured through the GRU_REPLAY_* environment variables
+"""
+import functools, hashlib, inspect, os, pickle, random
+from typing import Dict, List, Optional
+
+import pytest
+
+from gru.parsing.ast_manip import write_file_atomic
+
+HYPOTHESIS_DB_ENV = 'GRU_HYPOTHESIS_DB'
+REPLAY_DIR_ENV = 'GRU_REPLAY_DIR' # the corpus of one PBT
+REPLAY_VERSION_ENV = 'GRU_REPLAY_VERSION' # which version of the PBT is running
+REPLAY_ENTRIES_ENV = 'GRU_REPLAY_ENTRIES' # entries of other versions the baseline said are safe to replay
+REPLAY_VALID_ENV = 'GRU_REPLAY_VALID' # set for baseline runs: where to write those entries to
+
+MAX_REPLAY = 100 # entries replayed before a mutant run
+BASELINE_SAMPLES = 20 # baseline inputs recorded per run
+MAX_KEPT = 100 # entries of each kind kept per version
+
+# hypothesis control flow rather than a test failing
+_NOT_FAILURES = {'UnsatisfiedAssumption', 'StopTest', 'Skipped', 'Frozen'}
+
+def database_dir(repo_dir : str) -> str:
+    return os.path.join(os.path.abspath(repo_dir), '.gru', 'hypothesis')
+
+def corpus_dir(repo_dir : str, rel_pbt_path : str, pbt_name : str) -> str:
+    key = hashlib.sha256((rel_pbt_path + '::' + pbt_name).encode()).hexdigest()[:12]
+    return os.path.join(os.path.abspath(repo_dir), '.gru', 'replay', pbt_name + '-' + key)
+
+def version_of(pbt_source : str) -> str:
+    return hashlib.sha256(pbt_source.encode()).hexdigest()[:16]
+
+def replay_env(database : str, corpus : str, version : str, entries : List[str] = None, valid_file : str = None) -> Dict[str, str]:
+    env = {HYPOTHESIS_DB_ENV : database, REPLAY_DIR_ENV : corpus, REPLAY_VERSION_ENV : version}
+    if entries : env[REPLAY_ENTRIES_ENV] = os.pathsep.join(entries)
+    if valid_file is not None : env[REPLAY_VALID_ENV] = valid_file
+    return env
+
+def _entries(directory : str, kinds : tuple = ('kill', 'seen')) -> List[str]:
+    """the entries in directory, kills first and newest first within each kind"""
+    try:
+        names = [name for name in os.listdir(directory) if name.endswith('.pkl')]
+    except OSError:
+        return []
+    def mtime(name):
+        try:
+            return os.path.getmtime(os.path.join(directory, name))
+        except OSError:
+            return 0
+    return [name for kind in kinds for name in sorted((n for n in names if n.startswith(kind + '-')), key=mtime, reverse=True)]
+
+def _load(path : str) -> Optional[dict]:
+    try:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    except Exception: # missing, half-written by someone else, or the classes it needs are gone
+        return None
+
+def _dump(example : dict) -> Optional[bytes]:
+    try:
+        return pickle.dumps(example)
+    except Exception:
+        return None
+
+def _save(directory : str, kind : str, data : bytes):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, kind + '-' + hashlib.sha256(data).hexdigest()[:16] + '.pkl')
+    if os.path.exists(path):
+        os.utime(path) # seen again, so it's still relevant
+        return
+    write_file_atomic(path, data)
+
+    for stale in _entries(directory, (kind,))[MAX_KEPT:]:
+        try:
+            os.remove(os.path.join(directory, stale))
+        except OSError:
+            pass
+
+def _is_failure(e : BaseException) -> bool:
+    return not isinstance(e, KeyboardInterrupt) and type(e).__name__ not in _NOT_FAILURES
+
+_MISSING = object()
+
+@functools.lru_cache(maxsize=None)
+def replay_supported() -> bool:
+    """whether the installed hypothesis has the internals replaying relies on, tried on a throwaway test"""
+    try:
+        from hypothesis import given, example, strategies as st
+
+        @given(st.integers())
+        @example(0)
+        def probe(x):
+            pass
+
+        handle = probe.hypothesis
+        return (callable(getattr(handle, 'inner_test', None))
+                and set(getattr(handle, '_given_kwargs', None) or ()) == {'x'}
+                and isinstance(getattr(probe, 'hypothesis_explicit_examples', None), list)
+                and hasattr(example(x=0), '_this_example'))
+    except Exception:
+        return False
+
+def hypothesis_version() -> str:
+    try:
+        from importlib.metadata import version
+        return version('hypothesis')
+    except Exception:
+        return 'unknown'
+
+class Replayer:
+    """the replay state of the PBT running in this process, configured by a replay_env dict"""
+
+    def __init__(self, env : Dict[str, str]):
+        self.database = env.get(HYPOTHESIS_DB_ENV)
+        self.corpus = env.get(REPLAY_DIR_ENV)
+        self.version = env.get(REPLAY_VERSION_ENV, 'unknown')
+        self.entries = [entry for entry in env.get(REPLAY_ENTRIES_ENV, '').split(os.pathsep) if entry]
+        self.valid_file = env.get(REPLAY_VALID_ENV)
+
+        self.samples = [] # reservoir of pickled inputs the baseline generated
+        self.calls = 0
+        self.failing = None # pickled input of the last call that failed
+        self.explicit = _MISSING # the test's own explicit examples, while ours are added
+
+    @property
+    def baseline(self) -> bool:
+        return self.valid_file is not None
+
+    def _keep_sample(self, data : bytes):
+        self.calls += 1
+        if len(self.samples) < BASELINE_SAMPLES:
+            self.samples.append(data)
+            return
+        i = random.randrange(self.calls)
+        if i < BASELINE_SAMPLES : self.samples[i] = data
+
+    def _record(self, inner, given : set):
+        """wraps a test's inner function so that the inputs hypothesis calls it with are recorded"""
+        if getattr(inner, '_gru_replayer', None) is self : return inner
+        if hasattr(inner, '_gru_replayer') : inner = inner.__wrapped__ # left over from a previous run
+
+        @functools.wraps(inner) # hypothesis keys its database on the source, which this keeps pointing at inner
+        def recording(*args, **kwargs):
+            # fixtures aren't part of the input, and methods get self, which we couldn't replay
+            data = _dump({name : value for name, value in kwargs.items() if name in given}) if not args else None
+            try:
+                result = inner(*args, **kwargs)
+            except BaseException as e:
+                if data is not None and _is_failure(e) : self.failing = data
+                raise
+            if data is not None and self.baseline : self._keep_sample(data)
+            return result
+        recording._gru_replayer = self
+        return recording
+
+    def _examples(self, test) -> List[tuple]:
+        """(entry, arguments) of the corpus entries to replay for test"""
+        given = set(test.hypothesis._given_kwargs)
+        current = os.path.join(self.corpus, self.version)
+        if self.baseline:
+            # inputs of other versions are only candidates, to be checked against the unmutated code
+            versions = sorted(os.listdir(self.corpus)) if os.path.isdir(self.corpus) else []
+            paths = [os.path.join(version, name) for version in versions if version != self.version
+                     for name in _entries(os.path.join(self.corpus, version))]
+        else:
+            # kills of this version may come from runs still going on next to this one, so look again every time
+            paths = [os.path.join(self.version, name) for name in _entries(current, ('kill',))]
+            paths += self.entries + [os.path.join(self.version, name) for name in _entries(current, ('seen',))]
+
+        examples = []
+        for path in dict.fromkeys(paths):
+            values = _load(os.path.join(self.corpus, path))
+            # a rewritten PBT may not take the same arguments any more
+            if isinstance(values, dict) and set(values) == given : examples.append((path, values))
+            if len(examples) >= MAX_REPLAY : break
+        return examples
+
+    def _validate(self, test, fixtures : dict) -> List[str]:
+        """the candidate entries that pass against the unmutated code, called directly rather than through hypothesis"""
+        inner = test.hypothesis.inner_test
+        valid = []
+        for path, values in self._examples(test):
+            try:
+                inner(**fixtures, **values)
+            except KeyboardInterrupt:
+                raise
+            except BaseException:
+                continue
+            valid.append(path)
+        return valid
+
+    def prepare(self, test, fixtures : dict = None):
+        """sets test up to use the shared database, replay the corpus and record what it runs"""
+        test = getattr(test, '__func__', test)
+        if not getattr(test, 'is_hypothesis_test', False) or self.corpus is None : return
+        from hypothesis import settings, example
+        from hypothesis.database import DirectoryBasedExampleDatabase
+
+        if self.database is not None and not getattr(test, '_gru_database', False):
+            parent = getattr(test, '_hypothesis_internal_use_settings', None) or settings.default
+            test._hypothesis_internal_use_settings = settings(parent, database=DirectoryBasedExampleDatabase(self.database))
+            test._gru_database = True
+        if not replay_supported() : return # just the shared database, then
+
+        if self.baseline:
+            valid = self._validate(test, fixtures or {})
+            write_file_atomic(self.valid_file, os.pathsep.join(valid).encode())
+        else:
+            # hypothesis runs explicit examples last to first
+            self.explicit = getattr(test, 'hypothesis_explicit_examples', _MISSING)
+            replayed = [example(**values)._this_example for _, values in reversed(self._examples(test))]
+            own = [] if self.explicit is _MISSING else list(self.explicit)
+            test.hypothesis_explicit_examples = own + replayed
+
+        test.hypothesis.inner_test = self._record(test.hypothesis.inner_test, set(test.hypothesis._given_kwargs))
+        self.failing = None
+
+    def finish(self, test):
+        """puts test's own explicit examples back and saves what this run found out"""
+        test = getattr(test, '__func__', test)
+        if not getattr(test, 'is_hypothesis_test', False) or self.corpus is None or not replay_supported() : return
+        if not self.baseline:
+            if self.explicit is _MISSING : del test.hypothesis_explicit_examples
+            else : test.hypothesis_explicit_examples = self.explicit
+            self.explicit = _MISSING
+
+        directory = os.path.join(self.corpus, self.version)
+        if self.failing is not None and not self.baseline : _save(directory, 'kill', self.failing)
+        for data in self.samples : _save(directory, 'seen', data)
+        self.samples, self.calls, self.failing = [], 0, None
+
+def read_valid(valid_file : str) -> Optional[List[str]]:
+    """the entries a baseline run wrote out, or None if it didn't get that far"""
+    try:
+        with open(valid_file, 'r') as f:
+            return [entry for entry in f.read().split(os.pathsep) if entry]
+    except OSError:
+        return None
+
+_replayer = Replayer(dict(os.environ)) if os.environ.get(REPLAY_DIR_ENV) else None
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    test = getattr(item, 'obj', None)
+    if _replayer is None or test is None:
+        yield
+        return
+
+    try:
+        parameters = inspect.signature(test).parameters
+    except (TypeError, ValueError):
+        parameters = {}
+    fixtures = {name : value for name, value in getattr(item, 'funcargs', {}).items() if name in parameters}
+    _replayer.prepare(test, fixtures)
+    try:
+        yield
+    finally:
+        _replayer.finish(test)
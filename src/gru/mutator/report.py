@@ -0,0 +1,59 @@
+"""
+a pytest plugin that streams test results back to gru as they happen.
+
+loaded with `-p gru.mutator.report`. gru opens a pipe and hands its write end to pytest, with the
+descriptor number in GRU_REPORT_FD. for every test, one line of json goes down the pipe as soon as
+the test is done: the test file and name, its outcome ("passed", "failed", "skipped" or "error"
+for a test that didn't get past setup), how long its setup and call took, and the falsifying
+example hypothesis reported, if any. nothing touches the disk, so any number of runs can report at the same time
+"""
+import json, os
+
+import pytest
+
+REPORT_FD_ENV = 'GRU_REPORT_FD'
+MAX_EXAMPLE = 2000 # characters; keeps every line under the size a pipe writes in one go
+
+_fd = int(os.environ[REPORT_FD_ENV]) if os.environ.get(REPORT_FD_ENV) else None
+_setup_durations = {} # nodeid -> seconds its fixtures took to set up
+
+# how hypothesis starts the note it attaches to the error, depending on its version
+EXAMPLE_PREFIXES = ('Falsifying', 'Failing test case', 'Failing explicit example')
+
+def _falsifying_example(excinfo) -> str:
+    notes = getattr(excinfo.value, '__notes__', None) or []
+    example = "\n".join(note for note in notes if isinstance(note, str) and note.startswith(EXAMPLE_PREFIXES))
+    return example[:MAX_EXAMPLE]
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    report.gru_path = os.path.realpath(str(getattr(item, 'path', None) or item.fspath))
+    report.gru_name = getattr(item, 'originalname', None) or item.name
+    report.gru_example = _falsifying_example(call.excinfo) if call.excinfo is not None else ""
+
+def pytest_runtest_logreport(report):
+    if _fd is None : return
+    if report.when == 'setup' and report.passed:
+        _setup_durations[report.nodeid] = report.duration
+        return
+    if report.when == 'call':
+        outcome = report.outcome
+    elif report.when == 'setup' and not report.passed:
+        outcome = 'skipped' if report.skipped else 'error'
+    else:
+        return
+
+    duration = _setup_durations.pop(report.nodeid, 0.0) + report.duration
+    record = {"path" : getattr(report, 'gru_path', None), "name" : getattr(report, 'gru_name', None),
+              "nodeid" : report.nodeid, "outcome" : outcome, "duration" : duration,
+              "example" : getattr(report, 'gru_example', "")}
+    os.write(_fd, (json.dumps(record) + "\n").encode())
+
+def pytest_unconfigure(config):
+    if _fd is not None:
+        try:
+            os.close(_fd)
+        except OSError:
+            pass
@@ -0,0 +1,610 @@
+"""
+helpers for running a PBT against mutants of its dependencies inside a sandboxed copy of a repo
+"""
+import ast, functools, os, json, time, random, select, subprocess, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, List, Dict, Optional, Tuple
+from tqdm import tqdm
+
+from gru.parsing.utils import extract_function_defs
+from gru.parsing.ast_manip import replace_function_signatures_in_directory, FunctionSplicer
+from gru.mutator.worker import InProcessWorker, FALLBACK
+from gru.mutator.schema import build_schema, write_schema, MUTANT_ID_ENV
+from gru.mutator.sandbox import prepare_sandbox
+from gru.mutator.limits import TIMEOUT, NO_LIMITS, Limits, mutant_budget, popen_kwargs, kill_group, hit_limit
+from gru.mutator.coverage import NOT_COVERED, CoverageMap, load_hits, sample_mutants
+from gru.mutator.trace import TRACE_FILE_ENV, TRACE_TARGETS_ENV
+from gru.mutator.report import REPORT_FD_ENV
+from gru.mutator.subsumption import SUBSUMED, KillMatrix
+from gru.mutator.cache import OutcomeCache, context_key, entry_key
+from gru.mutator.replay import database_dir, corpus_dir, version_of, replay_env, read_valid, replay_supported, hypothesis_version
+
+def sandbox_path(repo_dir : str, sandbox_dir : str, path : str) -> str:
+    """maps a path inside repo_dir onto the same path inside sandbox_dir"""
+    rel_path = os.path.relpath(os.path.abspath(path), os.path.abspath(repo_dir))
+    return os.path.join(sandbox_dir, rel_path)
+
+def _read_records(proc : subprocess.Popen, read_fd : int, timeout : Optional[float]) -> List[dict]:
+    """reads report lines off the pipe until pytest is done, raising TimeoutExpired past timeout"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    data = b''
+    while True:
+        wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+        if wait <= 0 : raise subprocess.TimeoutExpired(proc.args, timeout)
+        ready, _, _ = select.select([read_fd], [], [], wait)
+        if ready:
+            chunk = os.read(read_fd, 65536)
+            if not chunk : break
+            data += chunk
+        elif proc.poll() is not None:
+            # pytest is gone (but something it started may still hold the pipe open), so take what's left and stop
+            while select.select([read_fd], [], [], 0)[0]:
+                chunk = os.read(read_fd, 65536)
+                if not chunk : break
+                data += chunk
+            break
+
+    proc.wait(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+    return [json.loads(line) for line in data.decode(errors='replace').splitlines() if line.strip()]
+
+def run_tests(sandbox_dir : str, node_ids : List[str], mutant_id : int = None, limits : Limits = NO_LIMITS,
+              trace : Tuple[str, List[str]] = None, replay : Dict[str, str] = None) -> Optional[List[dict]]:
+    """
+    runs tests with pytest inside sandbox_dir, returning what gru.mutator.report sent back for each
+    of them, or None if the run was killed for going past its limits. with trace = (trace file,
+    files), line hits in those files are written to the trace file. with replay (see
+    gru.mutator.replay.replay_env), the tests share their examples with other runs
+    """
+    import gru
+    env = os.environ.copy()
+    # the plugins live in gru, so gru has to be importable next to the sandbox
+    env['PYTHONPATH'] = sandbox_dir + os.pathsep + os.path.dirname(os.path.dirname(os.path.abspath(gru.__file__)))
+    if mutant_id is not None : env[MUTANT_ID_ENV] = str(mutant_id)
+
+    plugins = ['-p', 'gru.mutator.report']
+    if trace is not None:
+        env[TRACE_FILE_ENV] = trace[0]
+        env[TRACE_TARGETS_ENV] = os.pathsep.join(trace[1])
+        plugins += ['-p', 'gru.mutator.trace']
+    if replay is not None:
+        env.update(replay)
+        plugins += ['-p', 'gru.mutator.replay']
+
+    # results come back over a pipe, so concurrent runs never share anything on disk
+    read_fd, write_fd = os.pipe()
+    env[REPORT_FD_ENV] = str(write_fd)
+    try:
+        proc = subprocess.Popen(
+            ['pytest', '-q'] + plugins + node_ids,
+            env=env,  # pass the modified environment to the subprocess
+            cwd=sandbox_dir,
+            pass_fds=(write_fd,),
+            **popen_kwargs(limits),
+        )
+    except BaseException:
+        os.close(read_fd)
+        raise
+    finally:
+        os.close(write_fd)
+
+    try:
+        records = _read_records(proc, read_fd, limits[0])
+    except subprocess.TimeoutExpired:
+        kill_group(proc)
+        return None
+    except BaseException:
+        # the child is in its own session, so it won't see a ctrl-c meant for us
+        kill_group(proc)
+        raise
+    finally:
+        os.close(read_fd)
+
+    if not records and hit_limit(proc.returncode) : return None
+    return records
+
+def outcome_of(records : List[dict]) -> Optional[str]:
+    outcomes = {record["outcome"] for record in records}
+    if "failed" in outcomes : return "failed"
+    if "passed" in outcomes : return "passed"
+    return None
+
+def run_pbt(sandbox_dir : str, pbt_path : str, pbt_name : str, mutant_id : int = None, limits : Limits = NO_LIMITS,
+            trace : Tuple[str, List[str]] = None, replay : Dict[str, str] = None) -> Optional[str]:
+    """
+    runs a single PBT with pytest inside sandbox_dir.
+    returns "passed" or "failed", "timeout" if it ran past its limits, or None if pytest failed to
+    detect the test at all
+    """
+    records = run_tests(sandbox_dir, [pbt_path + "::" + pbt_name], mutant_id, limits, trace, replay)
+    if records is None : return TIMEOUT
+    return outcome_of(records)
+
+def run_pbts(sandbox_dir : str, pbts : List[Tuple[str, str]], limits : Limits = NO_LIMITS) -> Dict[Tuple[str, str], tuple]:
+    """
+    runs several PBTs, given as (path, name), in a single pytest session inside sandbox_dir.
+    returns (outcome, seconds, falsifying example) for every PBT pytest reported on. seconds is
+    the PBT's own time plus the session's startup and collection time, which is roughly what
+    running it alone would take
+    """
+    start = time.monotonic()
+    records = run_tests(sandbox_dir, [path + "::" + name for path, name in pbts], limits=limits)
+    elapsed = time.monotonic() - start
+    if not records : return {}
+
+    by_pbt = {}
+    for record in records:
+        by_pbt.setdefault((record["path"], record["name"]), []).append(record)
+    overhead = max(0.0, elapsed - sum(record["duration"] for record in records))
+
+    results = {}
+    for path, name in pbts:
+        pbt_records = by_pbt.get((os.path.realpath(path), name))
+        if not pbt_records : continue
+        examples = [record["example"] for record in pbt_records if record["example"]]
+        results[(path, name)] = (outcome_of(pbt_records), sum(record["duration"] for record in pbt_records) + overhead,
+                                 examples[0] if examples else None)
+    return results
+
+def run_mutant(sandbox_dir : str, pbt_path : str, pbt_name : str, mutant : str, dep_list : str, limits : Limits = NO_LIMITS,
+               replay : Dict[str, str] = None) -> Optional[str]:
+    """writes a mutant into the sandbox, runs the PBT against it, then restores the original dependencies"""
+    replace_function_signatures_in_directory(sandbox_dir, extract_function_defs(mutant))
+    try:
+        return run_pbt(sandbox_dir, pbt_path, pbt_name, limits=limits, replay=replay)
+    finally:
+        replace_function_signatures_in_directory(sandbox_dir, extract_function_defs(dep_list))
+
+def changed_function_defs(code : str, mutant : str) -> List[ast.FunctionDef]:
+    """the top-level function definitions of mutant that differ from the ones in code"""
+    originals = {node.name : ast.dump(node) for node in ast.parse(code).body if isinstance(node, ast.FunctionDef)}
+    return [node for node in ast.parse(mutant).body
+            if isinstance(node, ast.FunctionDef) and originals.get(node.name) != ast.dump(node)]
+
+def killed(outcome : Optional[str]) -> bool:
+    """
+    a mutant that timed out, or wasn't run because a mutant that subsumes it died, counts as killed.
+    one skipped because mutants like it practically always die (LIKELY_KILLED) counts as neither
+    killed nor survived, so it stays out of the score
+    """
+    return outcome in ("failed", TIMEOUT, SUBSUMED)
+
+def survived(outcome : Optional[str]) -> bool:
+    """a mutant the PBT never reaches counts as surviving"""
+    return outcome in ("passed", NOT_COVERED)
+
+def split_outcomes(outcomes : Dict[str, Optional[str]]) -> Tuple[set, set]:
+    """splits a mutant -> outcome map into the (passed_tests, failed_tests) sets used everywhere else"""
+    passed_tests = {mutant for mutant, outcome in outcomes.items() if survived(outcome)}
+    failed_tests = {mutant for mutant, outcome in outcomes.items() if killed(outcome)}
+    return passed_tests, failed_tests
+
+class Sandbox:
+    """
+    one copy of the repo, plus what gru has written into it: the current PBT, the current
+    schema (if any), and the in-process worker living in it (if any)
+    """
+
+    def __init__(self, sandbox_dir : str, config : tuple):
+        rel_pbt_path, pbt_name, dep_list, original_pbt, mode, rel_dep_files = config
+        self.dir = sandbox_dir
+        self.pbt_path = os.path.join(sandbox_dir, rel_pbt_path)
+        self.pbt_name = pbt_name
+        self.dep_list = dep_list
+        self.original_pbt = original_pbt
+        self.mode = mode
+        self.dep_files = {name : os.path.join(sandbox_dir, path) for name, path in rel_dep_files.items()}
+        self.pbt_source = None # None means the original PBT is what's in the sandbox
+        self.schema = None
+        self.worker = None
+        self.limits = NO_LIMITS # applied to mutant runs only
+        self.replay = None # replay settings of mutant runs
+
+        # with known file locations, only the changed functions get spliced into only their own files
+        self.pbt_splicer = FunctionSplicer({pbt_name : self.pbt_path})
+        self.pbt_rewritten = False
+        self.dep_splicer = FunctionSplicer(self.dep_files) if self.dep_files else None
+        self.changed_defs = {} # mutant -> its changed function defs, since refinement runs the same mutants again and again
+
+    def _write_pbt(self, pbt_source : Optional[str]):
+        self.pbt_splicer.restore()
+        if self.pbt_rewritten:
+            replace_function_signatures_in_directory(self.dir, extract_function_defs(self.original_pbt))
+            self.pbt_rewritten = False
+        if pbt_source is None : return
+
+        pbt_defs = [fdef for fdef in extract_function_defs(pbt_source) if fdef.name == self.pbt_name]
+        if not self.pbt_splicer.splice(pbt_defs):
+            replace_function_signatures_in_directory(self.dir, extract_function_defs(pbt_source))
+            self.pbt_rewritten = True
+
+    def _run_rewritten(self, mutant : str) -> Optional[str]:
+        """writes a mutant into the sandbox, runs the PBT against it, then restores the original dependencies"""
+        if mutant not in self.changed_defs : self.changed_defs[mutant] = changed_function_defs(self.dep_list, mutant)
+        if self.dep_splicer is None or not self.dep_splicer.splice(self.changed_defs[mutant]):
+            return run_mutant(self.dir, self.pbt_path, self.pbt_name, mutant, self.dep_list, self.limits, self.replay)
+        try:
+            return self.run_pbt(limits=self.limits, replay=self.replay)
+        finally:
+            self.dep_splicer.restore()
+
+    def sync(self, pbt_source : Optional[str], schema : Optional[str]):
+        """makes sure the given PBT and schema are the ones written into the sandbox"""
+        if schema != self.schema:
+            # the schema goes underneath the PBT, in case they share a file
+            self._write_pbt(None)
+            write_schema(self.dir, schema if schema is not None else self.dep_list, self.dep_files)
+            self.schema = schema
+            self._write_pbt(pbt_source)
+            self.pbt_source = pbt_source
+            # a running worker has the old code imported, so it has to start over
+            self.close()
+
+        elif pbt_source != self.pbt_source:
+            self._write_pbt(pbt_source)
+            self.pbt_source = pbt_source
+
+    def run_pbt(self, mutant_id : int = None, limits : Limits = NO_LIMITS, trace : Tuple[str, List[str]] = None,
+                replay : Dict[str, str] = None) -> Optional[str]:
+        return run_pbt(self.dir, self.pbt_path, self.pbt_name, mutant_id, limits, trace, replay)
+
+    def run_mutant(self, mutant : str, mutant_id : int = None) -> Optional[str]:
+        """
+        runs the PBT against a mutant. with a schema written, the mutant is selected by its id and
+        nothing is rewritten; otherwise the in-process worker is tried first (if there is one),
+        falling back to rewriting files + pytest
+        """
+        if self.mode == "inprocess":
+            if self.worker is None:
+                self.worker = InProcessWorker(self.dir, self.pbt_path, self.pbt_name, self.dep_list, self.dep_files)
+            outcome = self.worker.run(mutant, self.pbt_source, mutant_id if self.schema is not None else None,
+                                      self.limits, self.replay)
+            if outcome != FALLBACK : return outcome
+
+        if self.schema is not None:
+            return self.run_pbt(mutant_id, self.limits, replay=self.replay)
+        return self._run_rewritten(mutant)
+
+    def close(self):
+        if self.worker is not None:
+            self.worker.close()
+            self.worker = None
+
+# per-process state for pool workers. each worker claims one private sandbox when it starts
+_worker_sandbox_dir = None
+_worker_sandbox = None
+
+def _init_worker(slots):
+    global _worker_sandbox_dir
+    _worker_sandbox_dir = slots.get()
+
+def _run_pool_task(task) -> Optional[str]:
+    global _worker_sandbox
+    config, pbt_source, schema, mutant, mutant_id, limits, replay = task
+    if _worker_sandbox is None:
+        _worker_sandbox = Sandbox(_worker_sandbox_dir, config)
+
+    _worker_sandbox.sync(pbt_source, schema)
+    _worker_sandbox.limits = limits
+    _worker_sandbox.replay = replay
+    return _worker_sandbox.run_mutant(mutant, mutant_id)
+
+@functools.lru_cache(maxsize=None)
+def warn_no_replay():
+    """said once per process: runs still share the example database, but nothing gets replayed"""
+    print("hypothesis " + hypothesis_version() + " doesn't have the internals --replay needs, "
+          "so only the shared example database is used")
+
+class MutantRunner:
+    """
+    runs one PBT against mutants of its dependencies.
+
+    with jobs == 1 everything happens in sandbox_dir, one mutant at a time. with jobs > 1 the
+    mutants are fanned out over a process pool where every worker owns a private copy of the
+    repo (and so its own report path), which gives the same outcomes as a sequential run.
+
+    mode is either "pytest", where every mutant is written to disk and gets a fresh pytest
+    process, or "inprocess", where a long-lived worker per sandbox hot-swaps the mutated
+    functions and only falls back to pytest for mutants it can't handle.
+
+    with schema=True, a batch of mutants is folded into one mutant schema that is written into
+    each sandbox once, and mutants are then picked by id instead of being written to disk.
+
+    sandbox_files is the list of repo files the worker sandboxes are built from (everything if None).
+
+    every mutant gets timeout_factor times the runtime of the unmutated PBT plus timeout_slack
+    seconds (timeout_factor = 0 turns this off), and memory_limit MB of address space. a mutant
+    that runs past either is killed and recorded as "timeout".
+
+    with coverage=True, the baseline run also records which dependency lines the PBT reaches.
+    mutants that only change unreached code are recorded as "not covered" without being run, and
+    sample_mutants favours mutants of often-run code.
+
+    given an OutcomeCache, baseline runs and mutant outcomes already known for the exact same
+    inputs are answered from the cache instead of being run.
+
+    with replay=True, all runs share a hypothesis example database in <repo_dir>/.gru, and every
+    mutant run first replays the inputs recorded by baseline runs and the inputs that killed
+    earlier mutants (see gru.mutator.replay).
+
+    given a KillMatrix, the outcome of every mutant that runs is recorded in it, and run_reduced
+    runs only the mutants the matrix can't vouch for (see gru.mutator.subsumption)
+    """
+
+    def __init__(self, repo_dir : str, sandbox_dir : str, pbt_path : str, pbt_name : str,
+                 dep_list : str, pbt_definition : str, jobs : int = 1, mode : str = "pytest",
+                 dependency_filenames : Dict[str, str] = None, schema : bool = False,
+                 sandbox_files : List[str] = None, timeout_factor : float = 5.0, timeout_slack : float = 10.0,
+                 memory_limit : int = None, coverage : bool = False, cache : OutcomeCache = None,
+                 replay : bool = False, kill_matrix : KillMatrix = None):
+        self.repo_dir = repo_dir
+        self.timeout_factor = timeout_factor
+        self.timeout_slack = timeout_slack
+        self.memory_limit = memory_limit
+        self.baselines = {} # pbt source (None for the original) -> seconds the unmutated run took
+        self.sandbox_files = sandbox_files
+        self.sandbox_dir = sandbox_dir
+        self.pbt_name = pbt_name
+        self.jobs = max(1, jobs)
+        self.pool = None
+        self.use_schema = schema
+        self.schema = None
+        self.schema_ids = {}
+
+        rel_pbt_path = os.path.relpath(os.path.abspath(pbt_path), os.path.abspath(repo_dir))
+        rel_dep_files = {name : os.path.relpath(os.path.abspath(path), os.path.abspath(repo_dir))
+                         for name, path in (dependency_filenames or {}).items()}
+        self.config = (rel_pbt_path, pbt_name, dep_list, pbt_definition, mode, rel_dep_files)
+        self.sandbox = Sandbox(sandbox_dir, self.config)
+
+        self.coverage_map = CoverageMap(dep_list, self.sandbox.dep_files) if coverage else None
+        self.hits = {} # pbt source (None for the original) -> line hits of its baseline run
+
+        self.replay = (database_dir(repo_dir), corpus_dir(repo_dir, rel_pbt_path, pbt_name)) if replay else None
+        if replay and not replay_supported() : warn_no_replay()
+        self.replay_entries = {} # pbt source (None for the original) -> corpus entries its baseline found safe to replay
+        self.seeded = {} # pbt source (None for the original) -> (outcome, seconds) of a baseline run somewhere else
+
+        self.kill_matrix = kill_matrix
+        self.test_id = rel_pbt_path + '::' + pbt_name # the same for every version of the PBT
+        self.cache = cache
+        if cache is not None:
+            self.cache_context = context_key(repo_dir, pbt_path, (dependency_filenames or {}).values(), dep_list,
+                                             (mode, schema, timeout_factor, timeout_slack, memory_limit, replay))
+
+    @property
+    def pbt_source(self) -> Optional[str]:
+        return self.sandbox.pbt_source
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.schema is not None:
+            # leave the main sandbox as we found it for whoever uses it next
+            self.sandbox.sync(self.sandbox.pbt_source, None)
+        self.sandbox.close()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self.pool is None:
+            # worker sandboxes live next to the main one, so they get cleaned up (or reused) with it
+            slots = multiprocessing.Queue()
+            for i in range(self.jobs):
+                worker_dir = self.sandbox_dir.rstrip(os.sep) + "-worker-" + str(i)
+                prepare_sandbox(self.repo_dir, worker_dir, self.sandbox_files)
+                slots.put(worker_dir)
+
+            self.pool = ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker, initargs=(slots,))
+        return self.pool
+
+    def _prepare_schema(self, mutants : List[str]):
+        """builds (and writes) a schema covering mutants, unless the current one already does"""
+        if all(mutant in self.schema_ids for mutant in mutants) : return
+
+        dep_list = self.config[2]
+        try:
+            self.schema = build_schema(dep_list, mutants)
+            self.schema_ids = {mutant : i for i, mutant in enumerate(mutants, start=1)}
+            self.sandbox.sync(self.sandbox.pbt_source, self.schema)
+        except Exception as e:
+            print("failed to build a mutant schema (" + str(e) + "), writing mutants to disk instead")
+            self.use_schema = False
+            self.schema = None
+            self.schema_ids = {}
+            self.sandbox.sync(self.sandbox.pbt_source, None)
+
+    def _run_baseline(self) -> Optional[str]:
+        """
+        runs the PBT that's in the sandbox against the unmutated code, timing it for the mutant
+        budget and, with coverage on, recording which dependency lines it reaches
+        """
+        pbt_source = self.sandbox.pbt_source
+        if self.cache is None : return self._measure_baseline()
+
+        # hits are stored relative to the sandbox, which is somewhere else on every run
+        sandbox_dir = os.path.realpath(self.sandbox_dir)
+        key = entry_key(self.cache_context, 'baseline', pbt_source)
+        cached = self.cache.get(key)
+        if (cached is not None and (self.coverage_map is None or cached['hits'] is not None)
+                and (self.replay is None or cached.get('replay') is not None)):
+            self.baselines[pbt_source] = cached['seconds']
+            if cached['hits'] is not None:
+                self.hits[pbt_source] = {os.path.join(sandbox_dir, path) : lines for path, lines in load_hits(cached['hits']).items()}
+            if cached.get('replay') is not None : self.replay_entries[pbt_source] = cached['replay']
+            return cached['outcome']
+
+        outcome = self._measure_baseline()
+        hits = self.hits.get(pbt_source)
+        if hits is not None : hits = {os.path.relpath(path, sandbox_dir) : lines for path, lines in hits.items()}
+        self.cache.put(key, {'outcome' : outcome, 'seconds' : self.baselines[pbt_source], 'hits' : hits,
+                             'replay' : self.replay_entries.get(pbt_source)})
+        return outcome
+
+    def _replay_env(self, valid_file : str = None) -> Optional[Dict[str, str]]:
+        """replay settings for runs of the current PBT; valid_file is given for its baseline run"""
+        if self.replay is None : return None
+        pbt_source = self.sandbox.pbt_source
+        version = version_of(pbt_source if pbt_source is not None else self.config[3])
+        return replay_env(self.replay[0], self.replay[1], version, self.replay_entries.get(pbt_source), valid_file)
+
+    def seed_baseline(self, outcome : Optional[str], seconds : float):
+        """
+        takes the baseline of the original PBT from a run made elsewhere (like a batched run_pbts)
+        instead of running it again. coverage and replay need a baseline run of their own, so with
+        either of those on it's ignored
+        """
+        self.seeded[None] = (outcome, seconds)
+
+    def _measure_baseline(self) -> Optional[str]:
+        pbt_source = self.sandbox.pbt_source
+        if pbt_source in self.seeded and self.coverage_map is None and self.replay is None:
+            outcome, self.baselines[pbt_source] = self.seeded.pop(pbt_source)
+            return outcome
+
+        valid_file = os.path.join(self.sandbox_dir, 'replay.txt')
+        if os.path.exists(valid_file) : os.remove(valid_file)
+        try:
+            return self._time_baseline(self._replay_env(valid_file))
+        finally:
+            if self.replay is not None : self.replay_entries[pbt_source] = read_valid(valid_file) or []
+
+    def _time_baseline(self, replay : Optional[Dict[str, str]]) -> Optional[str]:
+        pbt_source = self.sandbox.pbt_source
+        if self.coverage_map is None:
+            start = time.monotonic()
+            outcome = self.sandbox.run_pbt(limits=(None, self.memory_limit), replay=replay)
+            self.baselines[pbt_source] = time.monotonic() - start
+            return outcome
+
+        # line numbers only mean something in the original files, not in a written schema
+        if self.schema is not None : self.sandbox.sync(pbt_source, None)
+        trace_file = os.path.join(self.sandbox_dir, 'trace.json')
+        if os.path.exists(trace_file) : os.remove(trace_file)
+        try:
+            start = time.monotonic()
+            outcome = self.sandbox.run_pbt(limits=(None, self.memory_limit),
+                                           trace=(trace_file, sorted(set(self.sandbox.dep_files.values()))), replay=replay)
+            self.baselines[pbt_source] = time.monotonic() - start
+        finally:
+            if self.schema is not None : self.sandbox.sync(pbt_source, self.schema)
+
+        if os.path.exists(trace_file):
+            with open(trace_file, 'r') as f:
+                self.hits[pbt_source] = load_hits(json.load(f))
+        return outcome
+
+    def heat(self, mutant : str) -> float:
+        """how often the current PBT runs the code mutant changes (infinite if that isn't known)"""
+        hits = self.hits.get(self.sandbox.pbt_source)
+        if self.coverage_map is None or hits is None : return float('inf')
+        return self.coverage_map.heat(mutant, hits)
+
+    def sample_mutants(self, mutants : Iterable[str], num : int) -> List[str]:
+        """picks num of the given mutants to run, uniformly or (with coverage on) favouring reached code"""
+        mutants = list(mutants)
+        if self.coverage_map is None : return random.sample(mutants, min(num, len(mutants)))
+        if self.sandbox.pbt_source not in self.hits : self._run_baseline()
+        return sample_mutants(mutants, num, {mutant : self.heat(mutant) for mutant in mutants})
+
+    def limits(self) -> Limits:
+        """the limits mutants of the current PBT run under"""
+        return (mutant_budget(self.baselines.get(self.sandbox.pbt_source), self.timeout_factor, self.timeout_slack),
+                self.memory_limit)
+
+    def set_pbt(self, pbt_source : str):
+        """makes pbt_source the PBT that mutants are run against from now on"""
+        self.sandbox.sync(pbt_source, self.schema)
+
+    def run_pbt(self, pbt_source : str = None) -> Optional[str]:
+        """
+        runs the current PBT against the unmutated code. if pbt_source is given, that PBT is run
+        instead, and the current PBT is put back afterwards
+        """
+        if pbt_source is None:
+            return self._run_baseline()
+
+        current_pbt = self.sandbox.pbt_source
+        self.sandbox.sync(pbt_source, self.schema)
+        try:
+            return self._run_baseline()
+        finally:
+            self.sandbox.sync(current_pbt, self.schema)
+
+    def run_mutants(self, mutants : List[str], progress : bool = False,
+                    stop : Callable[[Dict[str, Optional[str]]], bool] = None) -> Dict[str, Optional[str]]:
+        """
+        runs the current PBT against every mutant, returning a mutant -> outcome map. stop, if given,
+        is asked after every outcome (with all outcomes known so far) whether the rest can be
+        skipped; mutants that never got to run are left out of the map
+        """
+        if self.sandbox.pbt_source not in self.baselines : self._run_baseline()
+
+        known = {}
+        if self.coverage_map is not None:
+            for mutant in mutants:
+                if self.heat(mutant) == 0 : known[mutant] = NOT_COVERED
+
+        keys = {}
+        if self.cache is not None:
+            keys = {mutant : entry_key(self.cache_context, self.sandbox.pbt_source, mutant) for mutant in mutants if mutant not in known}
+            cached = self.cache.get_many(list(keys.values()))
+            known.update((mutant, cached[key]) for mutant, key in keys.items() if key in cached)
+
+        to_run = [mutant for mutant in mutants if mutant not in known]
+        if self.use_schema : self._prepare_schema(to_run)
+        limits = self.limits()
+        replay = self._replay_env()
+
+        ran = []
+        if to_run and not (stop is not None and stop(known)):
+            if self.jobs > 1:
+                tasks = [(self.config, self.sandbox.pbt_source, self.schema, mutant, self.schema_ids.get(mutant), limits, replay)
+                         for mutant in to_run]
+                pool = self._get_pool()
+                futures = [pool.submit(_run_pool_task, task) for task in tasks]
+                results = zip(to_run, (future.result() for future in futures))
+            else:
+                self.sandbox.limits = limits
+                self.sandbox.replay = replay
+                results = ((mutant, self.sandbox.run_mutant(mutant, self.schema_ids.get(mutant))) for mutant in to_run)
+
+            for mutant, outcome in (tqdm(results, total=len(to_run)) if progress else results):
+                known[mutant] = outcome
+                ran.append(mutant)
+                if stop is not None and stop(known) : break
+
+            if self.jobs > 1:
+                # whatever hasn't started yet is dropped, anything already running just finishes
+                for future in futures : future.cancel()
+
+        if self.cache is not None and ran:
+            self.cache.put_many({keys[mutant] : known[mutant] for mutant in ran})
+        outcomes = {mutant : known[mutant] for mutant in mutants if mutant in known}
+        if self.kill_matrix is not None:
+            self.kill_matrix.record(self.test_id, self.config[0] + '::' + (self.sandbox.pbt_source or self.config[3]), outcomes)
+        return outcomes
+
+    def run_reduced(self, mutants : List[str], progress : bool = False,
+                    stop : Callable[[Dict[str, Optional[str]]], bool] = None) -> Dict[str, Optional[str]]:
+        """
+        like run_mutants, but with a kill matrix only the dominators among mutants (and mutants no
+        dominator vouches for) run first. a mutant subsumed by a dominator that got killed is then
+        recorded as "subsumed" instead of being run, and only the rest run after that. what earlier
+        versions of this PBT (refinement candidates) did never counts towards that
+        """
+        if self.kill_matrix is None : return self.run_mutants(mutants, progress, stop)
+
+        first, subsumed_by = self.kill_matrix.reduce(mutants, self.test_id)
+        outcomes = self.run_mutants(first, progress, stop)
+        for mutant, dominators in subsumed_by.items():
+            if any(killed(outcomes.get(dominator)) for dominator in dominators) : outcomes[mutant] = SUBSUMED
+
+        rest = [mutant for mutant in mutants if mutant not in outcomes]
+        if rest and not (stop is not None and stop(outcomes)):
+            outcomes.update(self.run_mutants(rest, progress, None if stop is None else (lambda known : stop({**outcomes, **known}))))
+        return {mutant : outcomes[mutant] for mutant in mutants if mutant in outcomes}
@@ -0,0 +1,205 @@
+"""
+building the sandboxes mutants run in.
+
+instead of `shutil.copytree` of the whole repo, a sandbox is built from a list of files: either
+everything except VCS metadata, virtualenvs and caches, or (selectively) just the import closure
+of the PBTs and their dependencies plus conftest.py files, package __init__s and config.
+
+files are hardlinked rather than copied where the filesystem allows it. that's safe because
+everything gru writes into a sandbox goes through write_file_atomic, which replaces a file
+instead of writing through the link (tests that write into repo files in place are on their own).
+a manifest of what was placed is kept in the sandbox, so a reused sandbox is reset by only
+touching the files that changed since the last run
+"""
+import ast, json, os, shutil
+from typing import Dict, Iterable, List, Set, Tuple
+
+from gru.mutator.worker import find_basedir
+
+MANIFEST = '.gru-manifest.json'
+
+IGNORED_DIRS = {'.git', '.hg', '.svn', '.gru', '.tox', '.nox', '.venv', 'venv', '__pycache__',
+                '.pytest_cache', '.mypy_cache', '.ruff_cache', '.hypothesis', 'node_modules', '.eggs'}
+
+CONFIG_FILES = {'pytest.ini', 'pyproject.toml', 'setup.cfg', 'tox.ini', 'setup.py', 'conftest.py'}
+
+def sandbox_dir_for(repo_dir : str, tmpdir : str, reuse : bool = False) -> str:
+    """where the sandbox for repo_dir lives: a persistent spot under .gru/ when reusing, tmpdir otherwise"""
+    name = os.path.basename(os.path.abspath(repo_dir))
+    if reuse : return os.path.join(os.path.abspath(repo_dir), '.gru', 'sandbox', name)
+    return os.path.join(tmpdir, name)
+
+def _is_ignored_dir(path : str, name : str) -> bool:
+    if name in IGNORED_DIRS or name.endswith('.egg-info') : return True
+    # any virtualenv, whatever it's called
+    return os.path.exists(os.path.join(path, 'pyvenv.cfg'))
+
+def all_files(repo_dir : str) -> List[str]:
+    """every file in repo_dir (relative paths), minus VCS metadata, virtualenvs and caches"""
+    files = []
+    for root, dirs, filenames in os.walk(repo_dir):
+        dirs[:] = sorted(d for d in dirs if not _is_ignored_dir(os.path.join(root, d), d))
+        rel_root = os.path.relpath(root, repo_dir)
+        for filename in sorted(filenames):
+            files.append(os.path.normpath(os.path.join(rel_root, filename)))
+    return files
+
+def _module_file(root : str, dotted : str) -> str:
+    """the file a dotted module name resolves to under root, or None"""
+    if not dotted : return None
+    base = os.path.join(root, *dotted.split('.'))
+    for candidate in (base + '.py', os.path.join(base, '__init__.py')):
+        if os.path.isfile(candidate) : return candidate
+    return None
+
+def _imported_modules(filepath : str) -> Set[str]:
+    """dotted names of everything a file imports, with relative imports made absolute where possible"""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+    except Exception:
+        return set()
+
+    package_dir = os.path.dirname(filepath)
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names : modules.add(alias.name)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                # relative imports are resolved against the file's own directory, marked with a path
+                base = package_dir
+                for _ in range(node.level - 1) : base = os.path.dirname(base)
+                prefix = os.path.join(base, *node.module.split('.')) if node.module else base
+                modules.add(('path', prefix))
+                for alias in node.names : modules.add(('path', os.path.join(prefix, alias.name)))
+            elif node.module:
+                modules.add(node.module)
+                for alias in node.names : modules.add(node.module + '.' + alias.name)
+    return modules
+
+def import_closure(repo_dir : str, seeds : Iterable[str]) -> Set[str]:
+    """every file inside repo_dir reachable from the seed files by following imports"""
+    repo_dir = os.path.abspath(repo_dir)
+    seeds = [os.path.abspath(seed) for seed in seeds]
+    roots = [repo_dir, os.path.join(repo_dir, 'src')] + sorted({find_basedir(seed) for seed in seeds})
+
+    found = set()
+    todo = list(seeds)
+    while todo:
+        filepath = todo.pop()
+        if filepath in found or not os.path.isfile(filepath) : continue
+        found.add(filepath)
+
+        for module in _imported_modules(filepath):
+            if isinstance(module, tuple):
+                candidates = [path for path in (module[1] + '.py', os.path.join(module[1], '__init__.py')) if os.path.isfile(path)]
+            else:
+                parts = module.split('.')
+                candidates = []
+                for root in roots:
+                    # the module itself plus every package on the way to it
+                    for i in range(1, len(parts) + 1):
+                        candidate = _module_file(root, '.'.join(parts[:i]))
+                        if candidate : candidates.append(candidate)
+
+            for candidate in candidates:
+                candidate = os.path.abspath(candidate)
+                if candidate.startswith(repo_dir + os.sep) and candidate not in found:
+                    todo.append(candidate)
+    return found
+
+def selective_files(repo_dir : str, pbts_data : Dict[str, tuple]) -> List[str]:
+    """
+    the files (relative paths) the given PBTs need: the test and dependency files and their import
+    closure, the package __init__s and conftest.py files above them, and top-level config files
+    """
+    repo_dir = os.path.abspath(repo_dir)
+    seeds = set()
+    for data in pbts_data.values():
+        seeds.add(data[6])
+        seeds.update(data[7].values())
+
+    files = import_closure(repo_dir, seeds)
+
+    for filepath in list(files):
+        directory = os.path.dirname(filepath)
+        while directory.startswith(repo_dir):
+            for name in ('__init__.py', 'conftest.py'):
+                candidate = os.path.join(directory, name)
+                if os.path.isfile(candidate) : files.add(candidate)
+            if directory == repo_dir : break
+            directory = os.path.dirname(directory)
+
+    for name in CONFIG_FILES:
+        candidate = os.path.join(repo_dir, name)
+        if os.path.isfile(candidate) : files.add(candidate)
+
+    return sorted(os.path.relpath(filepath, repo_dir) for filepath in files)
+
+def _place(src : str, dst : str):
+    if os.path.lexists(dst) : os.remove(dst)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        # different filesystem (or no hardlink support), so fall back to a real copy
+        shutil.copy2(src, dst)
+
+def _unchanged(src_stat : os.stat_result, dst : str) -> bool:
+    """is dst still the file that was placed: the same inode, or a copy with the same size and mtime"""
+    try:
+        dst_stat = os.stat(dst)
+    except OSError:
+        return False
+    if (dst_stat.st_dev, dst_stat.st_ino) == (src_stat.st_dev, src_stat.st_ino) : return True
+    return dst_stat.st_size == src_stat.st_size and dst_stat.st_mtime_ns == src_stat.st_mtime_ns
+
+def prepare_sandbox(repo_dir : str, dst_dir : str, files : List[str] = None) -> str:
+    """
+    makes dst_dir hold exactly the given files from repo_dir (all of them if files is None). an
+    existing sandbox is reset in place: files that still match are left alone, anything changed in
+    the repo or left behind by an earlier run is replaced, and files no longer wanted are removed
+    """
+    if files is None : files = all_files(repo_dir)
+
+    manifest_path = os.path.join(dst_dir, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+    new_manifest = {}
+    for rel_path in files:
+        src = os.path.join(repo_dir, rel_path)
+        dst = os.path.join(dst_dir, rel_path)
+        try:
+            src_stat = os.stat(src)
+        except OSError:
+            continue
+
+        entry = [src_stat.st_mtime_ns, src_stat.st_size]
+        if manifest.get(rel_path) != entry or not _unchanged(src_stat, dst):
+            _place(src, dst)
+        new_manifest[rel_path] = entry
+
+    for rel_path in set(manifest) - set(new_manifest):
+        dst = os.path.join(dst_dir, rel_path)
+        if os.path.lexists(dst) : os.remove(dst)
+
+    os.makedirs(dst_dir, exist_ok=True)
+    with open(manifest_path, 'w') as f:
+        json.dump(new_manifest, f)
+
+    return dst_dir
+
+def build_sandbox(repo_dir : str, tmpdir : str, pbts_data : Dict[str, tuple], selective : bool = False,
+                  reuse : bool = False) -> Tuple[str, List[str]]:
+    """
+    prepares the sandbox for a run over pbts_data, returning its path and the files it was built
+    from, which the extra sandboxes for parallel workers are built from too
+    """
+    files = selective_files(repo_dir, pbts_data) if selective else all_files(repo_dir)
+    dst_dir = sandbox_dir_for(repo_dir, tmpdir, reuse)
+    prepare_sandbox(repo_dir, dst_dir, files)
+    return dst_dir, files
@@ -0,0 +1,126 @@
+"""
+mutant schemata: every mutant of a set of dependency functions compiled into one "meta-mutant".
+
+each mutation site becomes a branch on the active mutant id, e.g. `a + b` turns into
+`(a - b if _gru_mutant_id() == 3 else a + b)`, and the id is read from the GRU_MUTANT_ID
+environment variable (0 means the original code). the schema is written into a sandbox once,
+and from then on a mutant is picked just by setting the id
+"""
+import ast, copy, os
+from collections import defaultdict
+from typing import Dict, List
+
+from gru.mutator.mutator import find_mutation_sites, get_node_at
+from gru.parsing.ast_manip import write_file_atomic
+
+MUTANT_ID_ENV = 'GRU_MUTANT_ID'
+MUTANT_ID_FUNC = '_gru_mutant_id'
+
+SCHEMA_HELPER = f"""
+def {MUTANT_ID_FUNC}():
+    import os
+    return int(os.environ.get({MUTANT_ID_ENV!r}, '0'))
+"""
+
+def _guard(mutant_id : int) -> ast.expr:
+    return ast.Compare(
+        left=ast.Call(func=ast.Name(id=MUTANT_ID_FUNC, ctx=ast.Load()), args=[], keywords=[]),
+        ops=[ast.Eq()],
+        comparators=[ast.Constant(value=mutant_id)],
+    )
+
+def _set_node_at(tree : ast.AST, path : tuple, new_node : ast.AST):
+    parent = get_node_at(tree, path[:-1])
+    if isinstance(path[-1], int):
+        parent[path[-1]] = new_node
+    else:
+        setattr(parent, path[-1], new_node)
+
+def _same_signature(fdef : ast.FunctionDef, other : ast.FunctionDef) -> bool:
+    """do two function definitions differ in their body only"""
+    return ast.dump(ast.FunctionDef(**{**vars(fdef), 'body' : []})) == ast.dump(ast.FunctionDef(**{**vars(other), 'body' : []}))
+
+def build_schema(code : str, mutants : List[str]) -> str:
+    """
+    folds mutants (whole mutated copies of code) into a single version of code where mutant i
+    (counting from 1, in list order) is active when GRU_MUTANT_ID == i
+    """
+    original = ast.parse(code)
+
+    variants = defaultdict(list) # path -> [(mutant_id, kind, mutated node)]
+    for mutant_id, mutant in enumerate(mutants, start=1):
+        try:
+            mutant_tree = ast.parse(mutant)
+        except SyntaxError:
+            continue
+        for path, kind in find_mutation_sites(original, mutant_tree):
+            node, variant = get_node_at(original, path), get_node_at(mutant_tree, path)
+            if isinstance(node, ast.FunctionDef):
+                # the whole function changed (e.g. statements were added), which can only be
+                # branched on inside the function, since the def itself has to stay a def
+                if not _same_signature(node, variant):
+                    raise ValueError("mutant " + str(mutant_id) + " changes the signature of " + node.name)
+                variants[path + ('body',)].append((mutant_id, "body", variant.body))
+            else:
+                variants[path].append((mutant_id, kind, variant))
+
+    schema = copy.deepcopy(original)
+
+    # deepest sites first, so an outer site wraps the already-branched version of an inner one
+    for path in sorted(variants, key=len, reverse=True):
+        node = get_node_at(schema, path)
+        for mutant_id, kind, variant in variants[path]:
+            if kind == "expr":
+                node = ast.IfExp(test=_guard(mutant_id), body=variant, orelse=node)
+            elif kind == "body":
+                node = [ast.If(test=_guard(mutant_id), body=variant, orelse=node)]
+            else:
+                node = ast.If(test=_guard(mutant_id), body=[variant], orelse=[node])
+        _set_node_at(schema, path, node)
+
+    return ast.unparse(ast.fix_missing_locations(schema))
+
+def _insert_helper(tree : ast.Module):
+    """adds the mutant id helper after the module docstring and any __future__ imports"""
+    index = 0
+    body = tree.body
+    if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) and isinstance(body[0].value.value, str):
+        index = 1
+    while index < len(body) and isinstance(body[index], ast.ImportFrom) and body[index].module == '__future__':
+        index += 1
+    body[index:index] = ast.parse(SCHEMA_HELPER).body
+
+def write_schema(sandbox_dir : str, schema : str, dep_files : Dict[str, str] = None):
+    """
+    replaces the dependency functions in the sandbox with their schema versions and gives every
+    touched file the mutant id helper. dep_files maps function names to the files they live in;
+    without it every .py file in the sandbox is checked
+    """
+    schema_defs = {node.name : node for node in ast.parse(schema).body if isinstance(node, ast.FunctionDef)}
+
+    if dep_files:
+        filepaths = sorted(set(dep_files.values()))
+    else:
+        filepaths = []
+        for subdir, _, files in os.walk(sandbox_dir):
+            filepaths += [os.path.join(subdir, file) for file in files if file.endswith('.py')]
+
+    for filepath in filepaths:
+        with open(filepath, 'r') as f:
+            tree = ast.parse(f.read())
+
+        replaced = False
+        for node in ast.walk(tree):
+            for field in ('body', 'orelse', 'finalbody'):
+                stmts = getattr(node, field, None)
+                if not isinstance(stmts, list) : continue
+                for i, stmt in enumerate(stmts):
+                    if isinstance(stmt, ast.FunctionDef) and stmt.name in schema_defs:
+                        stmts[i] = copy.deepcopy(schema_defs[stmt.name])
+                        replaced = True
+
+        if not replaced : continue
+        if not any(isinstance(stmt, ast.FunctionDef) and stmt.name == MUTANT_ID_FUNC for stmt in tree.body):
+            _insert_helper(tree)
+
+        write_file_atomic(filepath, ast.unparse(tree).encode('utf-8'))
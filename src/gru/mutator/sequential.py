@@ -0,0 +1,108 @@
+"""
+stopping mutant runs as soon as more runs can't change the answer.
+
+for the refinement thresholds that's exact: once enough mutants are killed (or too many have
+survived) the comparison against the threshold is settled whatever the rest would do.
+
+for analyze's statistical mode the mutation score is estimated instead of measured. mutants are
+grouped into strata by the function and the kind of node they mutate, run interleaved across
+strata, and the score is the stratified estimate with a 95% interval (wilson, on the effective
+sample size of the stratified estimator, with a finite population correction since the mutant
+pool is finite). runs stop once the interval is narrow enough
+"""
+import ast, math, random
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from gru.mutator.mutator import find_mutation_sites, stratum_at
+from gru.mutator.runner import killed, survived
+
+Z_95 = 1.96
+
+def threshold_decided(outcomes : Dict[str, Optional[str]], mutants : List[str], threshhold : float, at_least : bool) -> bool:
+    """
+    whether `killed / len(mutants) >= threshhold` (at_least) or `<= threshhold` (not at_least) is
+    already settled, counting the mutants missing from outcomes as undecided
+    """
+    kills = sum(1 for mutant in mutants if killed(outcomes.get(mutant)))
+    undecided = sum(1 for mutant in mutants if mutant not in outcomes)
+    needed = threshhold * len(mutants)
+    if at_least : return kills >= needed or kills + undecided < needed
+    return kills > needed or kills + undecided <= needed
+
+def stratum_of(tree : ast.Module, mutant : str) -> Tuple[str, str]:
+    """(function, node type) of the first place mutant changes"""
+    try:
+        sites = sorted(find_mutation_sites(tree, ast.parse(mutant)))
+    except SyntaxError:
+        sites = []
+    if not sites : return ("?", "?")
+
+    return stratum_at(tree, sites[0][0])
+
+def stratify(dep_list : str, mutants : List[str]) -> Dict[str, Tuple[str, str]]:
+    tree = ast.parse(dep_list)
+    return {mutant : stratum_of(tree, mutant) for mutant in mutants}
+
+def stratified_order(mutants : List[str], strata : Dict[str, tuple]) -> List[str]:
+    """shuffles within every stratum, then interleaves them all, so any prefix has every stratum in close to its share"""
+    groups = defaultdict(list)
+    for mutant in sorted(mutants):
+        groups[strata[mutant]].append(mutant)
+
+    # the i-th mutant of a stratum of size n lands at roughly i/n, so bigger strata get dealt from more often
+    queue = []
+    for group in groups.values():
+        random.shuffle(group)
+        queue += [((i + random.random()) / len(group), mutant) for i, mutant in enumerate(group)]
+    return [mutant for _, mutant in sorted(queue)]
+
+def wilson_interval(p : float, n : float, z : float = Z_95) -> Tuple[float, float]:
+    if n <= 0 : return (0.0, 1.0)
+    if math.isinf(n) : return (p, p)
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return (max(0.0, center - half), min(1.0, center + half))
+
+def stratified_estimate(outcomes : Dict[str, Optional[str]], strata : Dict[str, tuple]) -> Optional[Tuple[float, float, float]]:
+    """
+    estimates the share of all mutants in strata that survive from the ones in outcomes, returning
+    (estimate, low, high), or None while some stratum hasn't had a single decided run yet
+    """
+    sizes, runs, survivors = defaultdict(int), defaultdict(int), defaultdict(int)
+    for mutant, stratum in strata.items():
+        outcome = outcomes.get(mutant)
+        if mutant in outcomes and not (killed(outcome) or survived(outcome)) : continue # pytest didn't pick the PBT up, so it says nothing
+        sizes[stratum] += 1
+        if mutant in outcomes:
+            runs[stratum] += 1
+            survivors[stratum] += survived(outcome)
+
+    if not sizes or any(runs[stratum] == 0 for stratum in sizes) : return None
+    total = sum(sizes.values())
+
+    estimate, variance = 0.0, 0.0
+    for stratum, size in sizes.items():
+        n = runs[stratum]
+        share = survivors[stratum] / n
+        weight = size / total
+        estimate += weight * share
+        if n > 1:
+            variance += weight * weight * (1 - n / size) * share * (1 - share) / (n - 1)
+
+    sampled = sum(runs.values())
+    if sampled == total : return (estimate, estimate, estimate) # nothing left to estimate
+
+    if variance > 0:
+        effective_n = estimate * (1 - estimate) / variance
+    else:
+        # every stratum is all-or-nothing so far, so fall back to the plain sample size, corrected for the finite pool
+        effective_n = sampled / (1 - sampled / total)
+    low, high = wilson_interval(estimate, effective_n)
+    return (estimate, low, high)
+
+def interval_settled(outcomes : Dict[str, Optional[str]], strata : Dict[str, tuple], width : float) -> bool:
+    """whether the interval of the stratified estimate is at most width wide"""
+    estimate = stratified_estimate(outcomes, strata)
+    return estimate is not None and estimate[2] - estimate[1] <= width
@@ -0,0 +1,137 @@
+"""
+how often mutants of each kind get killed, kept across runs in <repo>/.gru/stats.json.
+
+every mutation of a mutant (see gru.mutator.mutator.mutation_id) has an operator class, the kind of
+node and what it was changed from and to (say "Compare:Lt->LtE"), and a function, the top-level
+function it is in. outcomes of mutants run against an unrefined PBT are added up per class and
+per function, and from those the chance that a mutant gets killed is guessed before it runs.
+refinement uses that to run the mutants it's looking for first, and analyze to skip most of the
+mutants of classes that practically always die
+"""
+import ast, json, os
+from typing import Dict, List, Optional, Tuple
+
+from gru.mutator.mutator import OPERATOR_GROUPS, get_node_at, stratum_at, parse_mutation_id
+from gru.mutator.limits import TIMEOUT
+from gru.parsing.ast_manip import write_file_atomic
+
+# outcome of a mutant that wasn't run because its class nearly always gets killed
+LIKELY_KILLED = "likely killed"
+
+MIN_RUNS = 20 # runs of a class before it can be called trivially killed
+TRIVIAL_RATE = 0.95 # smoothed kill rate from which it is
+KEEP_TRIVIAL = 2 # mutants of a trivially killed class that still run in every sample, so its rate stays honest
+
+# (operator class, function) of each mutation of a mutant
+Features = List[Tuple[str, str]]
+
+def stats_path(repo_dir : str) -> str:
+    return os.path.join(os.path.abspath(repo_dir), '.gru', 'stats.json')
+
+def operator_class(tree : ast.AST, mutation : tuple) -> str:
+    path, replacement = mutation
+    node = get_node_at(tree, path)
+    if isinstance(node, ast.Compare):
+        return "Compare:" + type(node.ops[0]).__name__ + "->" + replacement
+    if isinstance(node, tuple(OPERATOR_GROUPS)):
+        return type(node).__name__ + ":" + type(node.op).__name__ + "->" + replacement
+    if isinstance(node, ast.Subscript):
+        if replacement == -1 : return "Subscript:last"
+        return "Subscript:+1" if replacement > node.slice.value else "Subscript:-1"
+    return type(node).__name__ + ":" + str(replacement)
+
+def mutant_features(dep_list : str, ids : Dict[str, str]) -> Dict[str, Features]:
+    """mutant -> its features, for every mutant in ids (mutant -> mutation_id, as draw_mutants returns)"""
+    tree = ast.parse(dep_list)
+    features = {}
+    for mutant, mutant_id in ids.items():
+        try:
+            features[mutant] = [(operator_class(tree, mutation), stratum_at(tree, mutation[0])[0])
+                                for mutation in parse_mutation_id(mutant_id)]
+        except (AttributeError, IndexError, TypeError, ValueError):
+            features[mutant] = [] # an id of some other code
+    return features
+
+def _empty() -> dict:
+    return {"operators" : {}, "functions" : {}}
+
+class KillStats:
+    """kill counts per operator class and per function, as [kills, runs]"""
+
+    def __init__(self, path : str):
+        self.path = path
+        self.counts = self._load()
+        self.added = _empty() # what this run recorded, and save still has to write
+
+    def _load(self) -> dict:
+        counts = _empty()
+        try:
+            with open(self.path, 'r') as f:
+                loaded = json.load(f)
+            for kind in counts:
+                counts[kind].update({key : list(value) for key, value in loaded.get(kind, {}).items()})
+        except (OSError, ValueError, AttributeError, TypeError):
+            pass # missing or unreadable; start over
+        return counts
+
+    def _rate(self, kind : str, key : str) -> float:
+        kills, runs = self.counts[kind].get(key, (0, 0))
+        return (kills + 1) / (runs + 2)
+
+    def kill_chance(self, features : Features) -> float:
+        """the guessed chance that a mutant with these features gets killed, 0.5 for nothing known"""
+        if not features : return 0.5
+        survives = 1.0
+        for operator, function in features:
+            survives *= 1 - (self._rate("operators", operator) + self._rate("functions", function)) / 2
+        return 1 - survives
+
+    def trivial_class(self, features : Features) -> Optional[str]:
+        """an operator class of the mutant that practically always gets killed, if there is one"""
+        for operator, _ in features:
+            runs = self.counts["operators"].get(operator, (0, 0))[1]
+            if runs >= MIN_RUNS and self._rate("operators", operator) >= TRIVIAL_RATE : return operator
+        return None
+
+    def order(self, mutants : List[str], features : Dict[str, Features], survivors_first : bool = True) -> List[str]:
+        """mutants sorted by their guessed chance of surviving (or of getting killed), ties keeping their order"""
+        sign = 1 if survivors_first else -1
+        return sorted(mutants, key=lambda mutant : sign * self.kill_chance(features.get(mutant, [])))
+
+    def skip_trivial(self, mutants : List[str], features : Dict[str, Features]) -> Tuple[List[str], List[str]]:
+        """splits mutants into the ones to run and the ones of trivially killed classes past the first KEEP_TRIVIAL of each"""
+        run, skipped, kept = [], [], {}
+        for mutant in mutants:
+            operator = self.trivial_class(features.get(mutant, []))
+            if operator is not None and kept.get(operator, 0) >= KEEP_TRIVIAL:
+                skipped.append(mutant)
+                continue
+            if operator is not None : kept[operator] = kept.get(operator, 0) + 1
+            run.append(mutant)
+        return run, skipped
+
+    def record(self, features : Dict[str, Features], outcomes : Dict[str, Optional[str]]):
+        """adds the outcomes of mutants that actually ran"""
+        for mutant, outcome in outcomes.items():
+            if outcome not in ("passed", "failed", TIMEOUT) : continue
+            kill = int(outcome != "passed")
+            for operator, function in features.get(mutant, []):
+                for kind, key in (("operators", operator), ("functions", function)):
+                    for table in (self.counts, self.added):
+                        entry = table[kind].setdefault(key, [0, 0])
+                        entry[0] += kill
+                        entry[1] += 1
+
+    def save(self):
+        """adds what was recorded since the last save to the file, on top of whatever other runs wrote to it meanwhile"""
+        if not any(self.added.values()) : return
+        counts = self._load()
+        for kind, added in self.added.items():
+            for key, (kills, runs) in added.items():
+                entry = counts[kind].setdefault(key, [0, 0])
+                entry[0] += kills
+                entry[1] += runs
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        write_file_atomic(self.path, json.dumps(counts, indent=1, sort_keys=True).encode())
+        self.counts, self.added = counts, _empty()
@@ -0,0 +1,119 @@
+"""
+running fewer mutants by leaving out the ones another mutant already speaks for.
+
+every outcome of a mutant run goes into a kill matrix, kept in sqlite under <repo>/.gru/: which
+PBT (by its source, along with the test it's a version of) killed or missed which mutant (by its
+source), across PBTs, refinement candidates and invocations. mutant A subsumes mutant B when every
+PBT that killed A also killed B, and the mutants whose killers are minimal (no other mutant's are
+a strict subset) dominate the rest.
+
+one PBT killing A and B says nothing about a different PBT that kills A, so a dominator only
+vouches for B with evidence behind it: A's killers have to come from at least MIN_TESTS different
+tests, and some PBT has to have run A and survived it while killing B. versions of the test being
+run (earlier refinement candidates of it) don't count as evidence for it at all.
+
+so against a new PBT only the dominators get run first, and a mutant one of its dominators died
+to is counted as killed without being run. the ones nothing vouches for (no PBT ever killed them,
+their dominators all survived, or there's too little evidence) still run, so every score still
+covers the full set
+"""
+import hashlib, os, sqlite3, time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from gru.mutator.limits import TIMEOUT
+
+# outcome of a mutant that wasn't run because a mutant that subsumes it was killed
+SUBSUMED = "subsumed"
+
+MAX_ROWS = 500000 # past this, the oldest outcomes are dropped
+MIN_TESTS = 2 # different tests that must have killed a dominator before it vouches for anything
+
+def matrix_path(repo_dir : str) -> str:
+    return os.path.join(os.path.abspath(repo_dir), '.gru', 'kills.sqlite')
+
+def _key(text : str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class KillMatrix:
+    """PBT x mutant -> killed, for every mutant that actually ran"""
+
+    def __init__(self, path : str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(kills)')]
+        # matrices from before outcomes knew which test they came from can't tell versions of one test apart
+        if columns and 'test' not in columns : self.db.execute('DROP TABLE kills')
+        self.db.execute('CREATE TABLE IF NOT EXISTS kills (pbt TEXT, test TEXT, mutant TEXT, killed INTEGER, recorded REAL, PRIMARY KEY (pbt, mutant))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS kills_mutant ON kills (mutant)')
+        self.db.commit()
+
+    def record(self, test : str, pbt : str, outcomes : Dict[str, Optional[str]]):
+        """
+        adds the outcomes of mutants that ran against pbt (the path of its file and its source),
+        a version of test (the path of its file and its name)
+        """
+        now = time.time()
+        rows = [(_key(pbt), _key(test), _key(mutant), int(outcome != "passed"), now)
+                for mutant, outcome in outcomes.items() if outcome in ("passed", "failed", TIMEOUT)]
+        if not rows : return
+        self.db.executemany('INSERT OR REPLACE INTO kills VALUES (?, ?, ?, ?, ?)', rows)
+        self.db.commit()
+        self._prune()
+
+    def outcomes(self, mutants : List[str], test : str = None) -> Tuple[Dict[str, Dict[str, bool]], Dict[str, str]]:
+        """
+        mutant -> {PBT that ran it -> whether it killed it}, and PBT -> the test it's a version of,
+        leaving out the versions of test
+        """
+        keys = {_key(mutant) : mutant for mutant in mutants}
+        skip = None if test is None else _key(test)
+        ran, tests = defaultdict(dict), {}
+        key_list = list(keys)
+        for i in range(0, len(key_list), 500): # sqlite caps the number of query parameters
+            chunk = key_list[i:i + 500]
+            rows = self.db.execute('SELECT pbt, test, mutant, killed FROM kills WHERE mutant IN (' + ','.join('?' * len(chunk)) + ')', chunk)
+            for pbt, pbt_test, mutant, was_killed in rows:
+                if pbt_test == skip : continue
+                ran[keys[mutant]][pbt] = bool(was_killed)
+                tests[pbt] = pbt_test
+        return {mutant : ran.get(mutant, {}) for mutant in mutants}, tests
+
+    def reduce(self, mutants : List[str], test : str = None) -> Tuple[List[str], Dict[str, List[str]]]:
+        """
+        splits mutants into the ones to run first, and for every other one the dominators that
+        subsume it, going only by what PBTs other than versions of test did. mutants that nothing
+        has killed yet, or that no dominator has enough evidence for, are run first too
+        """
+        ran, tests = self.outcomes(mutants, test)
+        killers = {mutant : frozenset(pbt for pbt, was_killed in ran[mutant].items() if was_killed) for mutant in mutants}
+        groups = defaultdict(list) # killers -> mutants killed by exactly those PBTs, in the order given
+        for mutant in mutants:
+            if killers[mutant] : groups[killers[mutant]].append(mutant)
+        minimal = [pbts for pbts in groups if not any(other < pbts for other in groups)]
+
+        def vouches(dominator, mutant):
+            if len({tests[pbt] for pbt in killers[dominator]}) < MIN_TESTS : return False
+            # a PBT that survived the dominator but killed mutant shows they really are different mutants
+            return any(ran[dominator].get(pbt) is False for pbt in killers[mutant])
+
+        first, subsumed_by = [], {}
+        dominators = {group[0] for pbts, group in groups.items() if pbts in minimal}
+        for mutant in mutants:
+            if killers[mutant] and mutant not in dominators:
+                vouching = [groups[pbts][0] for pbts in minimal if pbts <= killers[mutant] and vouches(groups[pbts][0], mutant)]
+                if vouching:
+                    subsumed_by[mutant] = vouching
+                    continue
+            first.append(mutant)
+        return first, subsumed_by
+
+    def _prune(self):
+        total = self.db.execute('SELECT COUNT(*) FROM kills').fetchone()[0]
+        if total <= MAX_ROWS : return
+        self.db.execute('DELETE FROM kills WHERE rowid IN (SELECT rowid FROM kills ORDER BY recorded LIMIT ?)',
+                        (total - int(MAX_ROWS * 0.9),))
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
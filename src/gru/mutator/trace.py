@@ -0,0 +1,52 @@
+"""
+a pytest plugin that counts how often each line of a set of files runs while the tests run.
+
+loaded into the baseline pytest run with `-p gru.mutator.trace`. the files to trace come in
+through GRU_TRACE_TARGETS (separated by os.pathsep), and the counts are written as json to
+GRU_TRACE_FILE when pytest exits. only the test calls are traced, not collection, so module
+level code that runs on import doesn't count as reached
+"""
+import json, os, sys, threading
+from collections import defaultdict
+
+import pytest
+
+TRACE_FILE_ENV = 'GRU_TRACE_FILE'
+TRACE_TARGETS_ENV = 'GRU_TRACE_TARGETS'
+
+_targets = {os.path.realpath(path) for path in os.environ.get(TRACE_TARGETS_ENV, '').split(os.pathsep) if path}
+_is_target = {} # co_filename -> bool, so realpath only runs once per file
+_hits = defaultdict(lambda : defaultdict(int))
+
+def _local_trace(frame, event, arg):
+    if event == 'line':
+        _hits[frame.f_code.co_filename][frame.f_lineno] += 1
+    return _local_trace
+
+def _global_trace(frame, event, arg):
+    filename = frame.f_code.co_filename
+    if filename not in _is_target:
+        _is_target[filename] = os.path.realpath(filename) in _targets
+    return _local_trace if _is_target[filename] else None
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    if not _targets:
+        yield
+        return
+
+    previous = sys.gettrace()
+    sys.settrace(_global_trace)
+    threading.settrace(_global_trace)
+    try:
+        yield
+    finally:
+        sys.settrace(previous)
+        threading.settrace(None)
+
+def pytest_unconfigure(config):
+    trace_file = os.environ.get(TRACE_FILE_ENV)
+    if not trace_file : return
+    hits = {os.path.realpath(filename) : dict(lines) for filename, lines in _hits.items()}
+    with open(trace_file, 'w') as f:
+        json.dump(hits, f)
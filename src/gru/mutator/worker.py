@@ -0,0 +1,340 @@
+"""
+a long-lived worker that imports a project and collects a PBT once, then runs that PBT against
+many mutants by compiling only the mutated functions and swapping their `__code__` in place.
+
+every mutant runs in a child forked from the warm worker, so the imports are shared but whatever
+the mutant does to module state (memo tables, registries, caches) dies with the child, exactly
+as if it had had a fresh process of its own. where there's no fork, mutants run in the worker
+itself and module globals are put back afterwards, which can't undo changes made inside mutable
+globals, so a project that has any falls back to pytest there.
+
+the worker is started with `python -m gru.mutator.worker` inside a sandbox, and talks to
+InProcessWorker over stdin/stdout with one JSON message per line. anything the worker can't
+handle in-process (fixtures, closures, crashes) comes back as "fallback", and the caller runs
+that mutant through the usual pytest path instead
+"""
+import ast, importlib, inspect, json, os, select, subprocess, sys, types
+from typing import Dict, List, Optional
+
+from gru.mutator.schema import MUTANT_ID_ENV
+from gru.mutator.limits import TIMEOUT, NO_LIMITS, Limits, popen_kwargs, kill_group
+from gru.mutator.replay import Replayer
+
+FALLBACK = "fallback"
+
+def find_basedir(path : str) -> str:
+    """first directory upwards from path that isn't a package, mirroring pytest's rootdir insertion"""
+    basedir = os.path.dirname(os.path.abspath(path))
+    while os.path.exists(os.path.join(basedir, '__init__.py')):
+        basedir = os.path.dirname(basedir)
+    return basedir
+
+def module_name_for(path : str, basedir : str) -> str:
+    rel_path = os.path.relpath(os.path.abspath(path), basedir)
+    return os.path.splitext(rel_path)[0].replace(os.sep, '.')
+
+def compile_function(fdef : ast.FunctionDef, filename : str, in_class : bool) -> Optional[types.CodeType]:
+    """compiles a single function definition and returns its code object"""
+    body = [fdef]
+    if in_class:
+        # methods that use super() need the implicit __class__ cell, which only exists inside a class
+        wrapper = ast.parse("class _gru_:\n    pass").body[0]
+        wrapper.body = [fdef]
+        body = [wrapper]
+    module = ast.fix_missing_locations(ast.Module(body=body, type_ignores=[]))
+    code = compile(module, filename, 'exec')
+
+    consts = list(code.co_consts)
+    while consts:
+        const = consts.pop()
+        if isinstance(const, types.CodeType):
+            if const.co_name == fdef.name : return const
+            consts.extend(const.co_consts)
+    return None
+
+def _unwrap(obj):
+    if isinstance(obj, (staticmethod, classmethod)) : obj = obj.__func__
+    while hasattr(obj, '__wrapped__') and not isinstance(obj, types.FunctionType):
+        obj = obj.__wrapped__
+    return obj
+
+class Session:
+    """the in-process state of one worker: the imported test module and the functions it can swap"""
+
+    def __init__(self, sandbox_dir : str, pbt_path : str, pbt_name : str, dep_list : str, dep_files : Dict[str, str]):
+        self.sandbox_dir = os.path.abspath(sandbox_dir)
+        self.pbt_path = os.path.abspath(pbt_path)
+        self.pbt_name = pbt_name
+        self.pbt_source = None
+
+        basedir = find_basedir(self.pbt_path)
+        for path in (self.sandbox_dir, basedir):
+            if path not in sys.path : sys.path.insert(0, path)
+
+        self.module = importlib.import_module(module_name_for(self.pbt_path, basedir))
+        self.test = getattr(self.module, pbt_name)
+
+        self.originals = {}
+        for node in ast.parse(dep_list).body:
+            if isinstance(node, ast.FunctionDef) : self.originals[node.name] = ast.dump(node)
+        self.dep_files = {name : os.path.abspath(path) for name, path in dep_files.items()}
+
+        self.targets = self._find_targets()
+        self.original_code = {name : [func.__code__ for func, _ in funcs] for name, funcs in self.targets.items()}
+        self.compiled = {} # mutant -> [(function, mutated code)], or None if it can't be swapped in
+        self.replayers = {} # replay settings -> Replayer
+        self.snapshot = self._take_snapshot()
+        self.original_state = self.snapshot[self.module]
+        self.forks = hasattr(os, 'fork')
+        self.stateful = self._has_mutable_globals()
+
+    def supported(self) -> bool:
+        """plain hypothesis tests that need no fixtures can be called directly"""
+        if not getattr(self.test, 'is_hypothesis_test', False) : return False
+        return len(inspect.signature(self.test).parameters) == 0
+
+    def _sandbox_modules(self) -> List[types.ModuleType]:
+        modules = []
+        for module in list(sys.modules.values()):
+            path = getattr(module, '__file__', None)
+            if path and os.path.abspath(path).startswith(self.sandbox_dir + os.sep):
+                modules.append(module)
+        return modules
+
+    def _find_targets(self) -> Dict[str, list]:
+        """every function object (and whether it is a method) that a dependency name refers to"""
+        targets = {name : [] for name in self.originals}
+        seen = set()
+
+        def consider(obj, in_class):
+            func = _unwrap(obj)
+            if not isinstance(func, types.FunctionType) or id(func) in seen : return
+            name = func.__code__.co_name
+            if name in targets and os.path.abspath(func.__code__.co_filename) == self.dep_files.get(name):
+                seen.add(id(func))
+                targets[name].append((func, in_class))
+
+        for module in self._sandbox_modules():
+            for value in list(vars(module).values()):
+                if isinstance(value, type):
+                    for attr in list(vars(value).values()) : consider(attr, True)
+                else:
+                    consider(value, False)
+        return targets
+
+    def _has_mutable_globals(self) -> bool:
+        """whether a module of the project keeps state in a container that resetting globals wouldn't undo"""
+        for module in self._sandbox_modules():
+            for name, value in vars(module).items():
+                if not name.startswith('__') and isinstance(value, (dict, list, set, bytearray)) : return True
+        return False
+
+    def _take_snapshot(self) -> dict:
+        return {module : dict(vars(module)) for module in self._sandbox_modules()}
+
+    def reset(self):
+        """puts the original code and module globals back after a mutant has run"""
+        for name, funcs in self.targets.items():
+            for (func, _), code in zip(funcs, self.original_code[name]):
+                func.__code__ = code
+
+        for module, state in self.snapshot.items():
+            module_dict = vars(module)
+            module_dict.clear()
+            module_dict.update(state)
+            for value in state.values():
+                # memoized dependencies would otherwise answer with results cached from another mutant
+                if hasattr(value, 'cache_clear') and callable(value.cache_clear):
+                    try:
+                        value.cache_clear()
+                    except Exception:
+                        pass
+
+    def set_pbt(self, pbt_source : Optional[str]):
+        if pbt_source == self.pbt_source : return
+        if pbt_source is not None:
+            exec(compile(pbt_source, self.pbt_path, 'exec'), vars(self.module))
+        else:
+            vars(self.module).clear()
+            vars(self.module).update(self.original_state)
+        self.pbt_source = pbt_source
+        self.test = getattr(self.module, self.pbt_name)
+        self.snapshot[self.module] = dict(vars(self.module))
+
+    def _compile(self, mutant : str) -> Optional[list]:
+        swaps = []
+        for node in ast.parse(mutant).body:
+            if not isinstance(node, ast.FunctionDef) or node.name not in self.originals : continue
+            if ast.dump(node) == self.originals[node.name] : continue
+            if not self.targets[node.name] : return None
+
+            for func, in_class in self.targets[node.name]:
+                code = compile_function(node, func.__code__.co_filename, in_class)
+                if code is None or code.co_freevars != func.__code__.co_freevars : return None
+                swaps.append((func, code))
+        return swaps
+
+    def compiled_swaps(self, mutant : str) -> Optional[list]:
+        """the code swaps of mutant, None if it can't be swapped in"""
+        # the same mutants come back for every candidate PBT during refinement, so compile each once
+        if mutant not in self.compiled : self.compiled[mutant] = self._compile(mutant)
+        return self.compiled[mutant]
+
+    def apply(self, mutant : str) -> bool:
+        """swaps in the code of every function the mutant changed; False if that can't be done in-process"""
+        if self.compiled_swaps(mutant) is None : return False
+        for func, code in self.compiled[mutant]:
+            func.__code__ = code
+        return True
+
+    def _execute(self, mutant : Optional[str], mutant_id : int, replayer : Optional[Replayer]) -> Optional[str]:
+        """the PBT against the mutant, in this process, leaving the mutant in place"""
+        if mutant_id is not None:
+            os.environ[MUTANT_ID_ENV] = str(mutant_id)
+        elif mutant is not None:
+            self.apply(mutant)
+        if replayer is not None : replayer.prepare(self.test)
+        try:
+            self.test()
+            return "passed"
+        except KeyboardInterrupt:
+            raise
+        except BaseException as e:
+            if type(e).__name__ == 'Skipped' : return None
+            return "failed"
+        finally:
+            if replayer is not None : replayer.finish(self.test)
+
+    def _execute_forked(self, mutant : Optional[str], mutant_id : int, replayer : Optional[Replayer]) -> Optional[str]:
+        """_execute in a child of this process, which takes whatever the mutant changed with it"""
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            outcome = FALLBACK
+            try:
+                outcome = self._execute(mutant, mutant_id, replayer)
+            finally:
+                os.write(write_end, json.dumps(outcome).encode())
+                os._exit(0)
+        os.close(write_end)
+        with os.fdopen(read_end, 'rb') as f:
+            data = f.read()
+        os.waitpid(pid, 0)
+        # a child that died without a word (a crash in native code, say) is left to pytest
+        return json.loads(data) if data else FALLBACK
+
+    def run(self, mutant : Optional[str], pbt_source : Optional[str], mutant_id : int = None,
+            replay : Dict[str, str] = None) -> Optional[str]:
+        """runs the PBT against a mutant, given either as source to swap in or as an id into a written schema"""
+        try:
+            self.set_pbt(pbt_source)
+        except Exception:
+            return None # same as pytest failing to collect the test
+
+        if not self.supported() : return FALLBACK
+
+        replayer = None
+        if replay is not None:
+            key = tuple(sorted(replay.items()))
+            if key not in self.replayers : self.replayers[key] = Replayer(replay)
+            replayer = self.replayers[key]
+
+        if mutant_id is None and mutant is not None and self.compiled_swaps(mutant) is None : return FALLBACK
+        if self.forks : return self._execute_forked(mutant, mutant_id, replayer)
+        if self.stateful : return FALLBACK
+
+        try:
+            return self._execute(mutant, mutant_id, replayer)
+        finally:
+            os.environ.pop(MUTANT_ID_ENV, None)
+            self.reset()
+
+def serve():
+    # keep the real stdout for the protocol, and send anything the tests print to stderr
+    protocol = os.fdopen(os.dup(1), 'w')
+    os.dup2(2, 1)
+
+    session = None
+    for line in sys.stdin:
+        request = json.loads(line)
+        try:
+            if request["op"] == "load":
+                session = Session(request["sandbox_dir"], request["pbt_path"], request["pbt_name"],
+                                  request["dep_list"], request["dep_files"])
+                response = {"outcome" : "loaded", "supported" : session.supported()}
+            else:
+                response = {"outcome" : session.run(request["mutant"], request["pbt"], request.get("mutant_id"), request.get("replay"))}
+        except Exception as e:
+            response = {"outcome" : FALLBACK, "error" : repr(e)}
+
+        protocol.write(json.dumps(response) + "\n")
+        protocol.flush()
+
+class InProcessWorker:
+    """client side of a worker process living in one sandbox"""
+
+    def __init__(self, sandbox_dir : str, pbt_path : str, pbt_name : str, dep_list : str, dep_files : Dict[str, str]):
+        self.load_request = {"op" : "load", "sandbox_dir" : sandbox_dir, "pbt_path" : pbt_path,
+                             "pbt_name" : pbt_name, "dep_list" : dep_list, "dep_files" : dep_files}
+        self.sandbox_dir = sandbox_dir
+        self.proc = None
+        self.usable = True
+
+    def _request(self, request : dict, timeout : float = None) -> dict:
+        self.proc.stdin.write(json.dumps(request) + "\n")
+        self.proc.stdin.flush()
+        if timeout is not None:
+            ready, _, _ = select.select([self.proc.stdout], [], [], timeout)
+            if not ready : raise TimeoutError("worker timed out")
+        line = self.proc.stdout.readline()
+        if not line : raise EOFError("worker exited")
+        return json.loads(line)
+
+    def start(self, limits : Limits = NO_LIMITS):
+        import gru
+        env = os.environ.copy()
+        # the sandbox comes first, but gru itself still has to be importable by the worker
+        env['PYTHONPATH'] = self.sandbox_dir + os.pathsep + os.path.dirname(os.path.dirname(os.path.abspath(gru.__file__)))
+
+        self.proc = subprocess.Popen(
+            [sys.executable, '-m', 'gru.mutator.worker'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env, cwd=self.sandbox_dir, text=True,
+            # no cpu limit, since that would add up over every mutant this worker ever runs
+            **popen_kwargs(limits, cpu=False),
+        )
+        response = self._request(self.load_request)
+        if response["outcome"] != "loaded" or not response["supported"]:
+            # the PBT can't run outside of pytest (import errors, fixtures), so don't bother trying again
+            self.usable = False
+            self.close()
+
+    def run(self, mutant : Optional[str], pbt_source : Optional[str] = None, mutant_id : int = None,
+            limits : Limits = NO_LIMITS, replay : Dict[str, str] = None) -> Optional[str]:
+        if not self.usable : return FALLBACK
+        try:
+            if self.proc is None : self.start(limits)
+            if not self.usable : return FALLBACK
+            request = {"op" : "run", "mutant" : mutant, "pbt" : pbt_source, "mutant_id" : mutant_id, "replay" : replay}
+            return self._request(request, limits[0])["outcome"]
+        except TimeoutError:
+            # stuck in the mutant; there's no getting it back, so kill it and start over next time
+            kill_group(self.proc)
+            self.proc = None
+            return TIMEOUT
+        except (EOFError, BrokenPipeError, OSError):
+            # the mutant took the worker down with it; start a fresh one next time
+            self.close()
+            return FALLBACK
+
+    def close(self):
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=5)
+            except Exception:
+                self.proc.kill()
+            self.proc = None
+
+if __name__ == '__main__':
+    serve()
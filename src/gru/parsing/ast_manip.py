@@ -1,17 +1,29 @@
 from gru.parsing.utils import extract_function_defs, extract_pbts_with_dirs_and_context
 from typing import List, Tuple, Dict, Set
-import ast, os
+import ast, io, os, tokenize
 
 class NodeReplacer(ast.NodeTransformer):
     def __init__(self, target_name, replacement_node):
         self.target_name = target_name
         self.replacement_node = replacement_node
+        self.replaced = False
 
     def visit_FunctionDef(self, node):
         if node.name == self.target_name:
+            self.replaced = True
             return self.replacement_node
         return node
 
+def write_file_atomic(filepath : str, data : bytes):
+    """
+    Writes data next to filepath and swaps it in. Sandboxes may hardlink files to the original repo,
+    so writing in place would write straight through to the user's checkout.
+    """
+    tmp_path = filepath + '.gru-tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, filepath)
+
 def replace_function_signatures_in_file(filepath : str, function_defs : List[ast.AST]):
     """
     Replaces matching function signatures in a single file with those from the given function definitions.
@@ -27,15 +39,19 @@ def replace_function_signatures_in_file(filepath : str, function_defs : List[ast
     tree = ast.parse(source_code)
 
     tree_c = ast.parse(source_code)
+    replaced = False
     for name, fdef in function_map.items():
         replacer = NodeReplacer(name, fdef)
         tree_c = replacer.visit(tree_c)
+        replaced = replaced or replacer.replaced
+
+    # files without any of the functions are left alone, so their caches stay valid
+    if not replaced : return
 
     new_source_code = ast.unparse(tree_c)
     
     # Write the new source code back to the file
-    with open(filepath, 'w') as file:
-        file.write(new_source_code)
+    write_file_atomic(filepath, new_source_code.encode('utf-8'))
 
 def replace_function_signatures_in_directory(directory : str, function_defs : List[ast.AST]):
     """
@@ -47,6 +63,125 @@ def replace_function_signatures_in_directory(directory : str, function_defs : Li
                 filepath = os.path.join(subdir, file)
                 replace_function_signatures_in_file(filepath, function_defs)
 
+def function_spans(source : str, names : Set[str]) -> Dict[str, List[Tuple[int, int, int]]]:
+    """
+    Finds the (start line, end line, column) of every definition of the given function names.
+    Start lines include decorators, and lines are 1-indexed and inclusive like the AST's.
+    """
+    spans = {name : [] for name in names}
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name in spans:
+            start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+            spans[node.name].append((start, node.end_lineno, node.col_offset))
+    return spans
+
+def normalized_source(source : str) -> str:
+    """
+    A dump of the AST of source without positions, comments or docstrings, so that code which only
+    differs in formatting normalizes to the same string. None if it doesn't parse.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return None
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Module)) and node.body:
+            first = node.body[0]
+            if isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant) and isinstance(first.value.value, str):
+                node.body = node.body[1:] or [ast.Pass()]
+    return ast.dump(tree)
+
+def string_continuation_lines(code : str) -> Set[int]:
+    """
+    The (1-indexed) lines of code that continue a string literal started on an earlier line. Those
+    are part of the string's value, so they must not be re-indented.
+    """
+    string_types = {tokenize.STRING, getattr(tokenize, 'FSTRING_MIDDLE', tokenize.STRING)}
+    lines = set()
+    for token in tokenize.generate_tokens(io.StringIO(code).readline):
+        if token.type in string_types:
+            lines.update(range(token.start[0] + 1, token.end[0] + 1))
+    return lines
+
+class FunctionSplicer:
+    """
+    Splices new function definitions over the exact line spans of the old ones, writing only the files
+    that hold a function that actually changed. The original bytes of every written file are kept in
+    memory, so restore() puts back exactly what was there and nothing else in the tree is rewritten.
+    """
+
+    def __init__(self, function_files : Dict[str, str]):
+        self.function_files = function_files # function name -> file it's defined in
+        self.originals = {} # file -> (original bytes, original mtime in ns)
+        self.spans = {} # file -> (bytes the spans were computed from, spans)
+        self.generation = 0
+
+    def _spans_for(self, filepath : str, source : bytes) -> Dict[str, List[Tuple[int, int, int]]]:
+        cached = self.spans.get(filepath)
+        if cached is None or cached[0] != source:
+            names = {name for name, path in self.function_files.items() if path == filepath}
+            cached = (source, function_spans(source.decode('utf-8'), names))
+            self.spans[filepath] = cached
+        return cached[1]
+
+    def _write(self, filepath : str, data : bytes, mtime_ns : int):
+        write_file_atomic(filepath, data)
+        os.utime(filepath, ns=(mtime_ns, mtime_ns))
+
+    def splice(self, function_defs : List[ast.AST]) -> bool:
+        """
+        Replaces each given function in its own file. Returns False (and changes nothing) if any of
+        them can't be located, so the caller can fall back to a full rewrite.
+        """
+        by_file = {}
+        for fdef in function_defs:
+            filepath = self.function_files.get(fdef.name)
+            if filepath is None : return False
+            by_file.setdefault(filepath, []).append(fdef)
+
+        edits = {}
+        for filepath, fdefs in by_file.items():
+            if filepath in self.originals:
+                source = self.originals[filepath][0]
+            else:
+                with open(filepath, 'rb') as f:
+                    source = f.read()
+
+            spans = self._spans_for(filepath, source)
+            replacements = []
+            for fdef in fdefs:
+                if not spans.get(fdef.name) : return False
+                for start, end, col in spans[fdef.name]:
+                    replacements.append((start, end, col, fdef))
+            edits[filepath] = (source, replacements)
+
+        for filepath, (source, replacements) in edits.items():
+            lines = source.decode('utf-8').splitlines(keepends=True)
+            for start, end, col, fdef in sorted(replacements, key=lambda r : r[0], reverse=True):
+                indent = lines[start - 1][:col]
+                code = ast.unparse(fdef)
+                verbatim = string_continuation_lines(code)
+                new_lines = [(indent + line if line and i not in verbatim else line) + "\n"
+                             for i, line in enumerate(code.split("\n"), 1)]
+                lines[start - 1:end] = new_lines
+
+            if filepath not in self.originals:
+                self.originals[filepath] = (source, os.stat(filepath).st_mtime_ns)
+
+            # every version written gets its own mtime (whole seconds apart, which is what .pyc files
+            # record), so bytecode compiled from one mutant is never mistaken for another's
+            self.generation += 1
+            mtime_ns = self.originals[filepath][1] + self.generation * 1_000_000_000
+            self._write(filepath, "".join(lines).encode('utf-8'), mtime_ns)
+
+        return True
+
+    def restore(self):
+        """Writes back the original bytes (and mtimes) of every file spliced since the last restore."""
+        for filepath, (source, mtime_ns) in self.originals.items():
+            self._write(filepath, source, mtime_ns)
+        self.originals = {}
+
 if __name__ == '__main__':
     # example
 
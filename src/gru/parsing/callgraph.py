@@ -0,0 +1,289 @@
+"""
+the call graph of a project, over functions named by the module they're defined in.
+
+a call is resolved the way python would look the name up: a function of the same module, then
+whatever an import binds the name to (following re-exports and star imports), and for a call like
+mod.f() the module mod is bound to. whatever that can't pin down (methods, mostly) goes to the
+last function of that name in the project, which is how every call used to be resolved.
+
+the strongly connected components of the graph are condensed once, and the transitive closure of
+every component worked out bottom up as a bitset over the functions, so what a PBT depends on is
+the union of a few precomputed sets rather than a search per PBT. pbts_reaching answers the other
+way around, which PBTs end up calling a function
+"""
+import os
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from gru.parsing.index import ProjectIndex, Call
+
+# a function: (file path, name)
+Node = Tuple[str, str]
+
+def module_name(directory : str, file_path : str) -> str:
+    """the dotted name a file would be imported by, from the project directory"""
+    parts = os.path.relpath(file_path, directory)[:-len('.py')].split(os.sep)
+    if parts[-1] == '__init__' : parts = parts[:-1]
+    return ".".join(parts)
+
+def _members(bits : int) -> List[int]:
+    text = bin(bits)[:1:-1] # lowest bit first
+    members, i = [], text.find('1')
+    while i != -1:
+        members.append(i)
+        i = text.find('1', i + 1)
+    return members
+
+class CallGraph:
+
+    def __init__(self, index : ProjectIndex):
+        self.index = index
+        self.file_modules = {file_path : module_name(index.directory, file_path) for file_path in index.files}
+        self.module_files = {}
+        for file_path, module in self.file_modules.items():
+            self.module_files.setdefault(module, file_path)
+        # so that "pkg.mod" is found in a src/ layout, or wherever the import root is below the project directory
+        self.suffixes = defaultdict(list)
+        for module in self.module_files:
+            parts = module.split('.')
+            for i in range(1, len(parts)):
+                self.suffixes[".".join(parts[i:])].append(module)
+
+        self.bindings = {} # file path -> local name -> (module, imported name or None, level)
+        self.stars = {} # file path -> (module, level) of every star import
+        for file_path, indexed in index.files.items():
+            self.bindings[file_path] = {}
+            self.stars[file_path] = []
+            for local, module, name, level in indexed["bindings"]:
+                if name == "*" : self.stars[file_path].append((module, level))
+                else : self.bindings[file_path][local] = (module, name, level)
+
+        self.nodes : List[Node] = [] # in os.walk order, and definition order within a file
+        self.ids : Dict[Node, int] = {}
+        self.by_name : Dict[str, Node] = {} # name -> the last function of that name
+        for file_path, indexed in index.files.items():
+            for name in indexed["functions"]:
+                self.ids[(file_path, name)] = len(self.nodes)
+                self.nodes.append((file_path, name))
+                self.by_name[name] = (file_path, name)
+
+        self.edges = [sorted(self.resolve_calls(file_path, index.files[file_path]["functions"][name][1]))
+                      for file_path, name in self.nodes]
+        self._condense()
+
+        self.pbt_reach : Dict[Node, List[int]] = {} # PBT -> the functions it calls, directly or not
+        self.reached_by : Dict[Node, List[Node]] = defaultdict(list) # function -> the PBTs that reach it
+        for name, code, file_path, calls in index.pbts:
+            bits = 0
+            for target in self.resolve_calls(file_path, calls):
+                bits |= self.closures[self.component[target]]
+            self.pbt_reach[(file_path, name)] = _members(bits)
+            for target in self.pbt_reach[(file_path, name)]:
+                self.reached_by[self.nodes[target]].append((file_path, name))
+
+    def qualified(self, node : Node) -> str:
+        module = self.file_modules[node[0]]
+        return module + "." + node[1] if module else node[1]
+
+    def _find_module(self, module : str) -> Optional[str]:
+        """the file of a module of the project, None for anything else (or if the name is ambiguous)"""
+        if module in self.module_files : return self.module_files[module]
+        candidates = self.suffixes.get(module, [])
+        return self.module_files[candidates[0]] if len(candidates) == 1 else None
+
+    def _absolute(self, file_path : str, module : str, level : int) -> str:
+        if level == 0 : return module
+        package = self.file_modules[file_path].split('.') if self.file_modules[file_path] else []
+        if os.path.basename(file_path) != '__init__.py' : package = package[:-1]
+        package = package[:len(package) - (level - 1)]
+        return ".".join(package + ([module] if module else []))
+
+    def _resolve_name(self, file_path : str, name : str, seen : set) -> Optional[Node]:
+        """the function that name stands for in file_path, defined there or imported into it"""
+        if name in self.index.files[file_path]["functions"] : return (file_path, name)
+        if (file_path, name) in seen : return None # import cycle
+        seen.add((file_path, name))
+
+        binding = self.bindings[file_path].get(name)
+        if binding is not None and binding[1] is not None:
+            target = self._find_module(self._absolute(file_path, binding[0], binding[2]))
+            found = self._resolve_name(target, binding[1], seen) if target is not None else None
+            if found is not None : return found
+        for module, level in self.stars[file_path]:
+            target = self._find_module(self._absolute(file_path, module, level))
+            found = self._resolve_name(target, name, seen) if target is not None else None
+            if found is not None : return found
+        return None
+
+    def _qualifier_module(self, file_path : str, qualifier : str) -> Optional[str]:
+        """the file of the project module a dotted name like mod or pkg.mod refers to in file_path"""
+        parts = qualifier.split('.')
+        for i in range(len(parts), 0, -1):
+            binding = self.bindings[file_path].get(".".join(parts[:i]))
+            if binding is None : continue
+            module, name, level = binding
+            module = self._absolute(file_path, module, level)
+            if name is not None : module = module + "." + name if module else name # from pkg import mod
+            return self._find_module(".".join([module] + parts[i:]))
+        return None
+
+    def resolve(self, file_path : str, call : Call) -> Optional[Node]:
+        """the function a call in file_path calls, or None if it isn't one of the project's"""
+        qualifier, name = call
+        found = None
+        if qualifier is None:
+            found = self._resolve_name(file_path, name, set())
+        else:
+            module = self._qualifier_module(file_path, qualifier)
+            if module is not None : found = self._resolve_name(module, name, set())
+        return found if found is not None else self.by_name.get(name)
+
+    def resolve_calls(self, file_path : str, calls : set) -> set:
+        resolved = {self.resolve(file_path, call) for call in calls}
+        return {self.ids[node] for node in resolved if node is not None}
+
+    def _condense(self):
+        """tarjan's algorithm (without recursion), then the closure of every component as a bitset of functions"""
+        order = [None] * len(self.nodes)
+        low = [0] * len(self.nodes)
+        on_stack = [False] * len(self.nodes)
+        stack, components = [], []
+        self.component = [None] * len(self.nodes)
+        counter = 0
+        for root in range(len(self.nodes)):
+            if order[root] is not None : continue
+            order[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            work = [(root, 0)]
+            while work:
+                v, i = work[-1]
+                if i < len(self.edges[v]):
+                    work[-1] = (v, i + 1)
+                    w = self.edges[v][i]
+                    if order[w] is None:
+                        order[w] = low[w] = counter
+                        counter += 1
+                        stack.append(w)
+                        on_stack[w] = True
+                        work.append((w, 0))
+                    elif on_stack[w]:
+                        low[v] = min(low[v], order[w])
+                    continue
+
+                work.pop()
+                if work : low[work[-1][0]] = min(low[work[-1][0]], low[v])
+                if low[v] == order[v]:
+                    members = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        self.component[w] = len(components)
+                        members.append(w)
+                        if w == v : break
+                    components.append(members)
+
+        # a component comes out of tarjan's after every component it reaches, so their closures are done by then
+        self.closures = []
+        for c, members in enumerate(components):
+            bits = 0
+            for v in members:
+                bits |= 1 << v
+                for w in self.edges[v]:
+                    if self.component[w] != c : bits |= self.closures[self.component[w]]
+            self.closures.append(bits)
+
+    def reach(self, node : Node) -> List[Node]:
+        """every function node calls, directly or not"""
+        bits = 0
+        for w in self.edges[self.ids[node]]:
+            bits |= self.closures[self.component[w]]
+        return [self.nodes[v] for v in _members(bits)]
+
+    def pbts_reaching(self, node : Node) -> List[Node]:
+        """the PBTs that end up calling the function"""
+        return self.reached_by.get(node, [])
+
+def affected_pbts(old : CallGraph, new : CallGraph, changed_files : set) -> set:
+    """
+    names of the PBTs of new that are in one of changed_files (absolute paths) or reach a function
+    of one, before or after the change
+    """
+    affected = set()
+    for graph in (old, new):
+        for file_path, indexed in graph.index.files.items():
+            if os.path.abspath(file_path) not in changed_files : continue
+            affected.update(name for name, code, calls in indexed["pbts"])
+            for name in indexed["functions"]:
+                affected.update(pbt for _, pbt in graph.pbts_reaching((file_path, name)))
+    return affected & {name for _, name in new.pbt_reach}
+
+def impacted_pbts(graph : CallGraph, changed : set) -> Dict[str, Optional[set]]:
+    """
+    PBT name -> the names of the changed functions (of changed, a set of nodes) among its
+    dependencies, for every PBT that depends on one. None if the PBT itself changed, as then it's
+    worth checking against mutants of any of them. a dependency goes by the same function here as
+    in pbts_with_context, so a changed function shadowed by another of the same name doesn't count
+    """
+    impacted = {}
+    for pbt, reach in graph.pbt_reach.items():
+        if pbt in changed:
+            impacted[pbt[1]] = None
+            continue
+        deps = {}
+        for v in reach:
+            deps.setdefault(graph.nodes[v][1], graph.nodes[v])
+        names = {name for name, node in deps.items() if node in changed}
+        if names : impacted[pbt[1]] = names
+    return impacted
+
+def pbts_with_context(index : ProjectIndex, graph : CallGraph = None, only : set = None) -> dict:
+    """
+    for every PBT (or just the ones named in only), the tuple extract_pbts_with_dirs_and_context returns. the dependencies go by
+    their bare names there (that's how mutants get spliced back), so if a PBT reaches functions of
+    the same name in different modules, the first one found in the project stands in for all of them
+    """
+    if graph is None : graph = CallGraph(index)
+    filenames = index.filenames
+    names_project_file = {} # import statement -> whether it has the name of a file of the project in it
+
+    full_pbt_deps = {}
+    for name, pbt, filename, calls in index.pbts:
+        if only is not None and name not in only : continue
+        reached = [graph.nodes[v] for v in graph.pbt_reach[(filename, name)]]
+        deps = {}
+        for node in reached:
+            deps.setdefault(node[1], node)
+
+        # the imports of every file the PBT reaches into
+        imports = set(index.files[filename]["imports"])
+        for file_path in {node[0] for node in reached}:
+            imports.update(index.files[file_path]["imports"])
+
+        # go through imports
+        requires_external = False
+        for import_statement, state in list(imports):
+            # want to see if any dep appears in the import statement
+            # if the state is third party, and appears in a dep, remove it
+            # whether a project file appears in it is the same for every PBT, so that's only checked once per statement
+            if import_statement not in names_project_file:
+                names_project_file[import_statement] = any(module in import_statement for module in filenames)
+            if state == "third-party" and (
+                    names_project_file[import_statement] or
+                    any(dep in import_statement for dep in deps)):
+                imports.remove((import_statement, state))
+            elif state == "third-party" and not "hypothesis" in import_statement: requires_external = True
+
+        ret = [None] * 8
+        ret[0] = name # pbt name
+        ret[1] = list(deps) # list of the dependency names
+        ret[2] = index.files[filename]["functions"][name][0] # get the function definition for the pbt
+        ret[3] = [index.files[node[0]]["functions"][node[1]][0] for node in deps.values()] # get the function definitions for all dependent functions
+        ret[4] = imports # all import statements required by pbt and deps
+        ret[5] = requires_external # does this pbt require external packages, besides hypothesis?
+        ret[6] = filename # filename for the pbt
+        ret[7] = {dep : node[0] for dep, node in deps.items()} # get all the function filenames for each dependency
+        full_pbt_deps[name] = tuple(ret)
+
+    return full_pbt_deps
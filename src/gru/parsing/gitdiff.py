@@ -0,0 +1,60 @@
+"""
+what changed in a project since a git ref, down to the functions: the line ranges of
+`git diff --unified=0 <ref>` (which covers the working tree, committed or not) and untracked python
+files, mapped onto the spans of the function definitions in the project index
+"""
+import os, re, subprocess
+from typing import Dict, List, Set, Tuple
+
+from gru.parsing.index import ProjectIndex
+
+HUNK = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+
+# a file that is new altogether counts as changed on every line
+WHOLE_FILE = [(1, float('inf'))]
+
+def _git(repo_dir : str, *args : str) -> str:
+    result = subprocess.run(['git', '-C', repo_dir] + list(args), capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError('git ' + ' '.join(args) + ' failed: ' + result.stderr.strip())
+    return result.stdout
+
+def parse_diff(diff : str, root : str) -> Dict[str, List[Tuple[int, int]]]:
+    """absolute path -> (first line, last line) of every hunk, in the new version of the file"""
+    changed = {}
+    path = None
+    for line in diff.splitlines():
+        if line.startswith('+++ '):
+            target = line[4:].strip()
+            path = None if target == '/dev/null' else os.path.join(root, target[2:]) # drop the b/
+            if path is not None : changed.setdefault(path, [])
+            continue
+        match = HUNK.match(line)
+        if match is None or path is None : continue
+        start, count = int(match.group(1)), int(match.group(2) or 1)
+        if count == 0:
+            # a deletion, between line start and the one after it
+            changed[path].append((start, start + 1))
+        else:
+            changed[path].append((start, start + count - 1))
+    return changed
+
+def changed_lines(repo_dir : str, ref : str) -> Dict[str, List[Tuple[int, int]]]:
+    """absolute path -> changed line ranges of every python file that differs from ref"""
+    root = _git(repo_dir, 'rev-parse', '--show-toplevel').strip()
+    diff = _git(repo_dir, 'diff', '--unified=0', '--no-color', '--no-ext-diff', ref, '--', '*.py')
+    changed = parse_diff(diff, root)
+    for rel_path in _git(repo_dir, 'ls-files', '--others', '--exclude-standard', '--full-name', '--', '*.py').splitlines():
+        changed[os.path.join(root, rel_path)] = WHOLE_FILE
+    return {os.path.realpath(path) : ranges for path, ranges in changed.items()}
+
+def changed_functions(index : ProjectIndex, lines : Dict[str, List[Tuple[int, int]]]) -> Set[Tuple[str, str]]:
+    """(file path, name) of every function of the index that has a definition overlapping a changed line"""
+    changed = set()
+    for file_path, indexed in index.files.items():
+        ranges = lines.get(os.path.realpath(file_path))
+        if not ranges : continue
+        for name, (definition, calls, spans) in indexed["functions"].items():
+            if any(start <= last and first <= end for start, end in spans for first, last in ranges):
+                changed.add((file_path, name))
+    return changed
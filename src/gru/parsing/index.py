@@ -0,0 +1,278 @@
+"""
+indexing a project for PBTs and the functions they depend on, parsing and walking every file once.
+
+index_source makes a single pass over one file and collects its PBTs, its function definitions
+(with what each calls and the lines it spans) and its imports. index_project does that for every
+file of a project, and gru.parsing.callgraph resolves the calls across files.
+
+with an IndexCache, what index_source found in every file is kept in <repo>/.gru/index.sqlite,
+and a file is only parsed again when its size and mtime changed and then its content hash too.
+the files that do need parsing can be spread over a pool of processes
+"""
+import ast, hashlib, json, os, sqlite3, sys, zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import astor
+
+from gru.parsing.utils import get_full_function_name, unparse_decorator, is_standard_library
+
+# what a call calls: (qualifier, name), with the qualifier the dotted name the function is an attribute of
+# ("np.linalg" for np.linalg.norm(x), "self" for self.f()), or None for a bare name or something else (f()(), x[0].f())
+Call = Tuple[Optional[str], str]
+
+def _dotted(node : ast.AST) -> Optional[str]:
+    if isinstance(node, ast.Name) : return node.id
+    if isinstance(node, ast.Attribute):
+        prefix = _dotted(node.value)
+        return prefix + "." + node.attr if prefix is not None else None
+    return None
+
+def _called(call : ast.Call) -> Optional[Call]:
+    if isinstance(call.func, ast.Name) : return (None, call.func.id)
+    if isinstance(call.func, ast.Attribute) : return (_dotted(call.func.value), call.func.attr)
+    return None
+
+class _Indexer(ast.NodeVisitor):
+    """
+    one walk over a module. the calls of a function include those of the functions nested in it,
+    and exclude its own decorators, but not the decorators of nested functions
+    """
+
+    def __init__(self):
+        self.pbts = [] # (name, code, calls)
+        self.definitions = {} # name -> (depth, unparsed definition) of the shallowest def of that name
+        self.calls = {} # name -> what every def of that name calls
+        self.spans = {} # name -> (first line, last line) of every def of that name, decorators included
+        self.imports = []
+        self.bindings = [] # (local name, module, imported name or None, relative import level) of every import
+        self.depth = 0
+        self.stack = [] # call sets of the functions we're in
+
+    def visit(self, node : ast.AST):
+        self.depth += 1
+        super().visit(node)
+        self.depth -= 1
+
+    def visit_FunctionDef(self, node : ast.FunctionDef):
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+
+        calls = set()
+        self.stack.append(calls)
+        for field, value in ast.iter_fields(node):
+            if field == 'decorator_list' : continue
+            if isinstance(value, ast.AST):
+                self.visit(value)
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, ast.AST) : self.visit(item)
+        self.stack.pop()
+        if self.stack : self.stack[-1].update(calls)
+
+        # ast.walk order is breadth first, so the first def of a name it finds is the shallowest one
+        if node.name not in self.definitions or self.definitions[node.name][0] > self.depth:
+            self.definitions[node.name] = (self.depth, ast.unparse(node))
+        start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+        self.spans.setdefault(node.name, []).append((start, node.end_lineno))
+        self.calls.setdefault(node.name, set()).update(calls)
+
+        # notably, our heuristic for determining if a function definition is a hypothesis
+        # function definition is if it has the decorator "given"
+        decorator_code = ""
+        for decorator in node.decorator_list:
+            if isinstance(decorator, ast.Call) and "given" in get_full_function_name(decorator.func).split('.'):
+                decorator_code = "@" + unparse_decorator(decorator)
+        if decorator_code:
+            self.pbts.append((node.name, decorator_code + "\n" + astor.to_source(node), calls))
+
+    def visit_Call(self, node : ast.Call):
+        called = _called(node)
+        if self.stack and called is not None : self.stack[-1].add(called)
+        self.generic_visit(node)
+
+    def visit_Import(self, node : ast.Import):
+        statement = astor.to_source(node).strip()
+        for alias in node.names:
+            self.imports.append((statement, "standard" if is_standard_library(alias.name) else "third-party"))
+            # import a.b binds a, but a.b.f() is looked up by its whole qualifier anyway
+            self.bindings.append((alias.asname or alias.name, alias.name, None, 0))
+
+    def visit_ImportFrom(self, node : ast.ImportFrom):
+        self.imports.append((astor.to_source(node).strip(), "standard" if is_standard_library(node.module) else "third-party"))
+        for alias in node.names:
+            self.bindings.append((alias.asname or alias.name, node.module or "", alias.name, node.level))
+
+def index_source(code : str) -> dict:
+    """
+    the PBTs ((name, code, calls) tuples), functions (name -> (definition, calls, spans)), import
+    statements ((statement, "standard" or "third-party") tuples) and import bindings ((local name,
+    module, imported name, level) tuples, with "*" for a star import) of a file
+    """
+    indexer = _Indexer()
+    indexer.visit(ast.parse(code))
+    functions = {name : (definition, indexer.calls[name], indexer.spans[name])
+                 for name, (_, definition) in indexer.definitions.items()}
+    return {"pbts" : indexer.pbts, "functions" : functions, "imports" : indexer.imports, "bindings" : indexer.bindings}
+
+class ProjectIndex:
+    """what index_project found"""
+
+    def __init__(self, directory : str):
+        self.directory = directory
+        self.files : Dict[str, dict] = {} # file path -> what index_source found in it, in os.walk order
+        self.pbts = [] # (name, code, file path, calls)
+        self.filenames = set() # module names of every python file
+
+    def add(self, file_path : str, indexed : dict):
+        self.files[file_path] = indexed
+        for name, code, calls in indexed["pbts"]:
+            self.pbts.append((name, code, file_path, calls))
+
+def python_files(directory : str, ignore_dirs : list = []) -> List[str]:
+    """every python file under directory, in os.walk order, leaving out the ones in ignore_dirs"""
+    ignore_dirs = [os.path.abspath(ignore_dir) for ignore_dir in ignore_dirs]
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        if any(os.path.commonpath([os.path.abspath(root), ignore_dir]) == ignore_dir for ignore_dir in ignore_dirs):
+            continue
+        paths += [os.path.join(root, file) for file in files if file.endswith('.py')]
+    return paths
+
+def index_file(file_path : str) -> dict:
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return index_source(f.read())
+
+INDEX_VERSION = 3 # bump whenever what index_source returns changes
+
+def index_path(repo_dir : str) -> str:
+    return os.path.join(os.path.abspath(repo_dir), '.gru', 'index.sqlite')
+
+def _dump(indexed : dict) -> bytes:
+    def calls(called): return sorted(called, key=lambda call : (call[0] or "", call[1]))
+    data = {"pbts" : [[name, code, calls(called)] for name, code, called in indexed["pbts"]],
+            "functions" : {name : [definition, calls(called), spans] for name, (definition, called, spans) in indexed["functions"].items()},
+            "imports" : indexed["imports"], "bindings" : indexed["bindings"]}
+    return zlib.compress(json.dumps(data).encode())
+
+def _load(blob : bytes) -> dict:
+    data = json.loads(zlib.decompress(blob))
+    def calls(called): return {tuple(call) for call in called}
+    return {"pbts" : [(name, code, calls(called)) for name, code, called in data["pbts"]],
+            "functions" : {name : (definition, calls(called), [tuple(span) for span in spans]) for name, (definition, called, spans) in data["functions"].items()},
+            "imports" : [tuple(entry) for entry in data["imports"]],
+            "bindings" : [tuple(entry) for entry in data["bindings"]]}
+
+class IndexCache:
+    """what index_source found in every file, by absolute path, along with the file's size, mtime and hash"""
+
+    def __init__(self, path : str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, digest TEXT, data BLOB)')
+
+        # unparsed code differs between python versions, so entries of another one (or another format) can't be used
+        version = str(INDEX_VERSION) + ' ' + sys.version
+        found = self.db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if found is None or found[0] != version:
+            self.db.execute('DELETE FROM files')
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+        self.db.commit()
+
+        self.files = {path : (mtime, size, digest, data) for path, mtime, size, digest, data in self.db.execute('SELECT * FROM files')}
+        self.changed = {} # path -> the row to write
+        self.seen = set()
+
+    def lookup(self, file_path : str) -> Optional[dict]:
+        """index_source of the file if it hasn't changed since it was last indexed, None if it has to be parsed (and then stored)"""
+        path = os.path.abspath(file_path)
+        self.seen.add(path)
+        stat = os.stat(path)
+        row = self.files.get(path)
+        if row is not None and row[0] == stat.st_mtime_ns and row[1] == stat.st_size:
+            return _load(row[3])
+
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        if row is not None and row[2] == digest: # touched, but the same
+            self.files[path] = self.changed[path] = (stat.st_mtime_ns, stat.st_size, digest, row[3])
+            return _load(row[3])
+        self.changed[path] = (stat.st_mtime_ns, stat.st_size, digest, None)
+        return None
+
+    def store(self, file_path : str, indexed : dict):
+        """what index_source found in a file lookup didn't have"""
+        path = os.path.abspath(file_path)
+        self.files[path] = self.changed[path] = self.changed[path][:3] + (_dump(indexed),)
+
+    def save(self):
+        """writes the files indexed again, and forgets the ones that weren't indexed at all this time (deleted, most likely)"""
+        gone = [(path,) for path in self.files if path not in self.seen]
+        self.db.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                            [(path,) + row for path, row in self.changed.items() if row[3] is not None])
+        self.db.executemany('DELETE FROM files WHERE path = ?', gone)
+        self.db.commit()
+        for path, in gone : del self.files[path]
+        self.changed, self.seen = {}, set()
+
+    def close(self):
+        self.db.close()
+
+def _index_files(file_paths : List[str]) -> list:
+    """index_file of every file, or why it couldn't be parsed. runs in the worker processes of index_project"""
+    results = []
+    for file_path in file_paths:
+        try:
+            results.append((index_file(file_path), None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
+MIN_PARALLEL_FILES = 64 # below this many files to parse, starting worker processes costs more than it saves
+CHUNK_FILES = 32 # files a worker parses per task, at most
+
+def index_project(directory : str, ignore_dirs : list = [], cache : Optional[IndexCache] = None, jobs : int = 1) -> ProjectIndex:
+    """
+    indexes every python file of the project, spreading the parsing over jobs processes. the results
+    get merged in os.walk order either way, so the index is the same for any number of jobs
+    """
+    file_paths = python_files(directory, ignore_dirs)
+    results = {} # file path -> (what index_source found, or None, and why it couldn't be parsed, or None)
+    pending = []
+    for file_path in file_paths:
+        try:
+            indexed = cache.lookup(file_path) if cache is not None else None
+        except Exception as e:
+            results[file_path] = (None, str(e))
+            continue
+        if indexed is not None : results[file_path] = (indexed, None)
+        else : pending.append(file_path)
+
+    if jobs > 1 and len(pending) >= MIN_PARALLEL_FILES:
+        size = max(1, min(CHUNK_FILES, len(pending) // (jobs * 4)))
+        chunks = [pending[i:i + size] for i in range(0, len(pending), size)]
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            parsed = [result for chunk in pool.map(_index_files, chunks) for result in chunk]
+    else:
+        parsed = _index_files(pending)
+
+    for file_path, (indexed, error) in zip(pending, parsed):
+        results[file_path] = (indexed, error)
+        if cache is not None and indexed is not None : cache.store(file_path, indexed)
+
+    index = ProjectIndex(directory)
+    for file_path in file_paths:
+        file = os.path.basename(file_path)
+        index.filenames.add(file[0:file.index(".py")])
+        indexed, error = results[file_path]
+        if error is not None:
+            print("failed to parse at " + str(file_path) + " due to " + error)
+            continue
+        index.add(file_path, indexed)
+    if cache is not None : cache.save()
+    return index
+
+def pbt_names(index : ProjectIndex) -> List[str]:
+    """the names of the PBTs, in the order pbts_with_context has them, without working out their context"""
+    return list(dict.fromkeys(name for name, pbt, filename, calls in index.pbts))
@@ -342,109 +342,13 @@ def extract_pbts_with_context(directory: str) -> List[Tuple[str, List[str], str,
 
     return full_pbt_deps
 
-def extract_pbts_with_dirs_and_context(directory: str, ignore_dirs : list = []):
+def extract_pbts_with_dirs_and_context(directory: str, ignore_dirs : list = [], index_cache = None, index_jobs : int = 1):
     """Extracts all PBTs from a project, then acquires the minimum amount of context, including dirs, for the PBT.
         the motivation for this function's existence is so we can find and replace modified versions of the PBT into the original project!
+        every file is parsed and walked once, see gru.parsing.index, and only if it changed since index_cache (an IndexCache) last saw it.
+        index_jobs processes share the parsing. calls are resolved module by module, see gru.parsing.callgraph
     """
-    pbts = extract_pbts_from_project_with_filenames(directory, ignore_dirs)
-
-    pbt_deps: Dict[str, Set[str]] = {}
-    pbt_filenames: Dict[str, str] = {}
-    pbt_import_deps: Dict[str, Set[str]] = {} # track which imports are required for a PBT
-    functions: Dict[str, str] = {}  # Track function names to function definitions
-    function_deps: Dict[str, Set[str]] = {}  # Track function names to called functions called within the function
-    import_statements: Dict[str, Set[str]] = {} # track function import requirements, also whether all standard or not
-    pbt_requires_external_pkgs: Dict[str, bool] = {}
-    function_filenames: Dict[str, str] = {}
-
-    filenames = set()
-    for name, pbt, filename in pbts:
-        pbt_deps[name] = set()
-        pbt_filenames[name] = filename
-
-    ignore_dirs = [os.path.abspath(ignore_dir) for ignore_dir in ignore_dirs]
-
-    # categorize all functions by what they call etc, this can probably be done more efficiently
-    # through some DP-esque thing but it's ok
-    for root, dirs, files in os.walk(directory):
-        if any(os.path.commonpath([os.path.abspath(root), ignore_dir]) == ignore_dir for ignore_dir in ignore_dirs):
-            continue
-
-        for file in files:
-            if file.endswith('.py'):
-                filenames.add(file[0:file.index(".py")])
-                file_path = os.path.join(root, file)
-
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    func_names = get_all_function_names(content)
-                    imports = get_import_statements(content)
-                    for func_name in func_names:
-                        try:
-                            # This is very inefficient since we parse and walk the AST a ton, but it's fine for now I guess
-                            func_def = get_function_definition(func_name, content)
-                            called_funcs = get_called_function_names(func_name, content)
-
-                            functions[func_name] = func_def
-                            function_deps[func_name] = called_funcs
-                            function_filenames[func_name] = file_path
-                            import_statements[func_name] = imports
-
-                        except Exception as e:
-                            continue
-        
-    # Now, we want to get _all_ dependent functions such that we can add them as context
-    prog_defs = set(functions.keys()) - set(pbts)
-    for name, pbt, filename in pbts:
-        deps = set()
-        new_deps = set(get_called_function_names(name, pbt))
-        deps = new_deps.union(deps)
-        to_add = new_deps.copy()
-
-        imports = set()
-        imports = imports.union(set(import_statements[name]))
-
-        while to_add != set():  # While there are things to add
-            proc = set()
-            for func in to_add:
-                if func in function_deps:
-                    imports = imports.union(set(import_statements[func]))
-                    proc = proc.union(set(function_deps[func]))
-
-            to_add = proc - deps
-            deps = deps.union(proc)
-
-        deps = deps.intersection(prog_defs)
-        pbt_deps[name] = deps
-
-        # go through imports
-        requires_external = False
-        imports_res = list(imports)
-        for import_statement, state in imports_res:
-            # want to see if any dep appears in the import statement
-            # if the state is third party, and appears in a dep, remove it
-            if state == "third-party" and (
-                    any(dep in import_statement for dep in deps) or
-                    any(filename in import_statement for filename in filenames)):
-                imports.remove((import_statement, state))
-            elif state == "third-party" and not "hypothesis" in import_statement: requires_external = True
-
-        import_statements[name] = imports
-        pbt_requires_external_pkgs[name] = requires_external
-    
-
-    full_pbt_deps = {}
-    for pbts, deps in pbt_deps.items():
-        ret = [None] * 8
-        ret[0] = pbts # pbt name
-        ret[1] = list(deps) # list of the dependency names
-        ret[2] = functions[pbts] # get the function definition for the pbt
-        ret[3] = [functions[dep] for dep in deps] # get the function definitions for all dependent functions
-        ret[4] = import_statements[pbts] # all import statements required by pbt and deps
-        ret[5] = pbt_requires_external_pkgs[pbts] # does this pbt require external packages, besides hypothesis?
-        ret[6] = pbt_filenames[pbts] # filename for the pbt
-        ret[7] = {dep : function_filenames[dep] for dep in deps} # get all the function filenames for each dependency
-        full_pbt_deps[pbts] = tuple(ret)
-
-    return full_pbt_deps
-
+    # index builds on the helpers here
+    from gru.parsing.index import index_project
+    from gru.parsing.callgraph import pbts_with_context
+    return pbts_with_context(index_project(directory, ignore_dirs, index_cache, index_jobs))
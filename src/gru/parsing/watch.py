@@ -0,0 +1,41 @@
+"""
+noticing changes to a project by polling: a snapshot is the size and mtime of every file gru
+would put in a sandbox, and two snapshots differ in the files that were added, removed or changed
+"""
+import os, time
+from typing import Dict, Set, Tuple
+
+from gru.mutator.sandbox import all_files
+
+Snapshot = Dict[str, Tuple[int, int]]
+
+def snapshot(repo_dir : str) -> Snapshot:
+    """absolute path -> (mtime in ns, size) of every file of the project"""
+    ret = {}
+    for rel_path in all_files(repo_dir):
+        path = os.path.abspath(os.path.join(repo_dir, rel_path))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue # gone since the walk
+        ret[path] = (stat.st_mtime_ns, stat.st_size)
+    return ret
+
+def changed_files(old : Snapshot, new : Snapshot) -> Set[str]:
+    return {path for path in old.keys() | new.keys() if old.get(path) != new.get(path)}
+
+def wait_for_changes(repo_dir : str, last : Snapshot, interval : float = 1.0) -> Tuple[Snapshot, Set[str]]:
+    """
+    blocks until files of the project change, and then until they stop changing for an interval
+    (an editor saving several files, a git checkout). returns the new snapshot and what changed
+    """
+    while True:
+        time.sleep(interval)
+        current = snapshot(repo_dir)
+        if changed_files(last, current) : break
+    while True:
+        time.sleep(interval)
+        settled = snapshot(repo_dir)
+        if not changed_files(current, settled) : break
+        current = settled
+    return current, changed_files(last, current)
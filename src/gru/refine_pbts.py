@@ -1,33 +1,74 @@
-import tempfile, os, subprocess, json, random, shutil, argparse
+import tempfile, os, random, argparse, ast
 
-from gru.mutator.harness import mutate_map
+from gru.mutator.harness import draw_mutants, pool_size
+from gru.mutator.filter import describe_removed
 from gru.parsing.utils import (
     extract_pbts_with_dirs_and_context,
-    extract_function_defs,
     get_all_function_names,
 )
+from gru.parsing.index import IndexCache, index_path
 from gru.parsing.ast_manip import (
-    replace_function_signatures_in_directory,
+    normalized_source,
 )
+from gru.mutator.runner import MutantRunner, split_outcomes, killed, survived
+from gru.mutator.mutator import find_mutation_sites
+from gru.mutator.sandbox import build_sandbox
+from gru.mutator.cache import OutcomeCache, cache_path, DEFAULT_CACHE_SIZE
+from gru.mutator.sequential import threshold_decided
+from gru.mutator.subsumption import KillMatrix, matrix_path
+from gru.mutator.stats import KillStats, stats_path, mutant_features
 from gru.llm.prompts import (
     gen_tighten_prompt_from_pbt_and_mutant,
     gen_generalize_prompt_from_pbt_and_mutant,
     extract_python_code,
 )
-from gru.llm.models import model
-
-def tighten_repo_pbt(repo_dir : str, pbt_name : str, threshhold : float = 0.8, mutant_num : int = 10, max_iters : int = 10) -> str:
-    pbts_data = extract_pbts_with_dirs_and_context(repo_dir)
+from gru.llm.models import model, DEFAULT_TIMEOUT
+from gru.llm.cache import ResponseCache, response_cache_path
+
+def mutation_sites(dep_list : str, mutants : list) -> dict:
+    """parses every mutant once, up front, and returns the places in dep_list each one changes"""
+    tree = ast.parse(dep_list)
+    sites = {}
+    for mutant in mutants:
+        try:
+            sites[mutant] = {path for path, _ in find_mutation_sites(tree, ast.parse(mutant))}
+        except SyntaxError:
+            sites[mutant] = set()
+    return sites
+
+def fail_fast_order(mutants : list, ref_mutant : str, sites : dict) -> list:
+    """
+    mutants that change the same places as ref_mutant are the likeliest to flip along with it,
+    so they go first (otherwise the order is kept)
+    """
+    ref_sites = sites.get(ref_mutant, set())
+    return sorted(mutants, key=lambda mutant : not (sites.get(mutant, set()) & ref_sites))
+
+def tighten_repo_pbt(repo_dir : str, pbt_name : str, threshhold : float = 0.8, mutant_num : int = 10, max_iters : int = 10, jobs : int = 1, mode : str = "pytest", schema : bool = False,
+                     selective_sandbox : bool = False, reuse_sandbox : bool = False,
+                     timeout_factor : float = 5.0, timeout_slack : float = 10.0, memory_limit : int = None,
+                     coverage : bool = False, cache : bool = False, cache_size : int = DEFAULT_CACHE_SIZE,
+                     replay : bool = False, seed : int = None, stats : bool = False,
+                     subsumption : bool = False, index_cache : bool = False, index_jobs : int = 1,
+                     candidates : int = 1, llm_timeout : float = DEFAULT_TIMEOUT, llm_cache : bool = True) -> str:
+    if seed is not None : random.seed(seed) # for the sampling that happens after the mutants are drawn
+    file_index = IndexCache(index_path(repo_dir)) if index_cache else None
+    pbts_data = extract_pbts_with_dirs_and_context(repo_dir, [os.path.join(repo_dir, '.gru')], file_index, index_jobs)
+    if file_index is not None : file_index.close()
+    outcome_cache = OutcomeCache(cache_path(repo_dir), cache_size) if cache else None
+    kill_stats = KillStats(stats_path(repo_dir)) if stats else None
+    kill_matrix = KillMatrix(matrix_path(repo_dir)) if subsumption else None
+    responses = ResponseCache(response_cache_path(repo_dir)) if llm_cache else None
 
     with tempfile.TemporaryDirectory() as tmpdir:
 
-        dst_dir = os.path.join(tmpdir, os.path.basename(repo_dir))
-        shutil.copytree(repo_dir, dst_dir)
-
         if not pbt_name in pbts_data:
             print("pbt not found...")
             return
 
+        dst_dir, sandbox_files = build_sandbox(repo_dir, tmpdir, {pbt_name : pbts_data[pbt_name]},
+                                               selective_sandbox, reuse_sandbox)
+
         data = pbts_data[pbt_name]
 
         pbt_name = data[0]
@@ -39,204 +80,170 @@ def tighten_repo_pbt(repo_dir : str, pbt_name : str, threshhold : float = 0.8, m
         pbt_path = data[6]
         dependency_filenames = data[7]
 
-        """ assert the PBT passes """
-
-        report_file_path = os.path.join(dst_dir, 'report.json')
-
-        env = os.environ.copy()
-        env['PYTHONPATH'] = dst_dir
-
-        result = subprocess.run(
-            ['pytest', '-q', '--json-report', '--json-report-file=' + report_file_path, 
-             pbt_path + "::" + pbt_name],
-            env=env,  # pass the modified environment to the subprocess
-        )
-
-        with open(report_file_path, 'r') as f:
-            ret_data = json.loads(f.read())
-
-            if len(ret_data["tests"]) == 0: 
-                print("PBT " + str(pbt_name) + " failed to be detected by pytest... skipping")
-                return
-
-            for test in ret_data["tests"]:
-                name = test["nodeid"][test["nodeid"].index("::")+2:]
-                outcome = test["outcome"]
-                if outcome == "failed": 
-                    print("PBT " + str(pbt_name) + " did not pass with pytest... skipping")
-                    return
-
-        """ evaluate the pbt against mutants """
-        print(str(pbt_name) + " passed with pytest, doing mutant analysis now ...")
-
         dep_list = ""
         for dep_def in dependency_definitions : dep_list += dep_def + "\n"
-        op_def_nodes = extract_function_defs(dep_list)
-
-        mutation_set = mutate_map(dep_list, mutant_num, 2)
-        mutants = list(random.sample(list(mutation_set), mutant_num))
-
-        passed_tests = set()
-        failed_tests = set()
-
-        for mutant in mutants:
-            def_nodes = extract_function_defs(mutant)
-
-            replace_function_signatures_in_directory(dst_dir, def_nodes)
-
-            env = os.environ.copy()
-            env['PYTHONPATH'] = dst_dir
-
-            report_file_path = os.path.join(dst_dir, 'report.json')
-            result = subprocess.run(
-                ['pytest', '-q', '--json-report', '--json-report-file=' + report_file_path, 
-                 pbt_path + "::" + pbt_name],
-                env=env
-            )
-
-            with open(report_file_path, 'r') as f:
-                data = json.loads(f.read())
-                for test in data["tests"]:
-                    name = test["nodeid"][test["nodeid"].index("::")+2:]
-                    outcome = test["outcome"]
-                    if outcome == "passed":
-                        passed_tests.add(mutant)
-
-                    elif outcome == "failed":
-                        failed_tests.add(mutant)
-
-            replace_function_signatures_in_directory(dst_dir, op_def_nodes)
-
-        """ refine the PBT """
-
-        # default condition: does this PBT kill enough mutants?
-        if (len(failed_tests)/len(mutants)) >= threshhold : return pbt_definition
 
-        # if not, we iteratively improve the PBT with the LLM
+        with MutantRunner(repo_dir, dst_dir, pbt_path, pbt_name, dep_list, pbt_definition, jobs=jobs,
+                          mode=mode, dependency_filenames=dependency_filenames, schema=schema,
+                          sandbox_files=sandbox_files, timeout_factor=timeout_factor,
+                          timeout_slack=timeout_slack, memory_limit=memory_limit, coverage=coverage,
+                          cache=outcome_cache, replay=replay, kill_matrix=kill_matrix) as runner:
 
-        iters = max_iters
-        op_pbt = extract_function_defs(pbt_definition)
+            """ assert the PBT passes """
 
-        current_pbt = pbt_definition
-        while iters > 0:
-            # pick a mutant to refine against
-            ref_mutant = random.choice(list(passed_tests))
+            outcome = runner.run_pbt()
 
-            # modify the PBT
-            generate_lim = 5 # arbitrary choice
-            while generate_lim > 0:
+            if outcome is None: 
+                print("PBT " + str(pbt_name) + " failed to be detected by pytest... skipping")
+                return
 
-                # generate the modified PBT based on reflection 
-                prompt = gen_tighten_prompt_from_pbt_and_mutant(dep_list, current_pbt, ref_mutant)
-                res = model.generate_full(prompt)
-                pbt_res = extract_python_code(res)
-                
-                print("NEW PBTS!!\n\n")
-                print(pbt_res)
+            if outcome == "failed": 
+                print("PBT " + str(pbt_name) + " did not pass with pytest... skipping")
+                return
 
-                new_pbt_name = get_all_function_names(pbt_res)[0]
+            """ evaluate the pbt against mutants """
+            print(str(pbt_name) + " passed with pytest, doing mutant analysis now ...")
 
-                # assert the generated pbt has the same name as the original
-                if new_pbt_name != pbt_name:
-                    generate_lim-=1
-                    continue
+            mutation_ids, removed = draw_mutants(dep_list, pool_size(mutant_num, coverage), seed)
+            if removed : print(describe_removed(removed))
+            mutation_set = list(mutation_ids)
+            mutants = runner.sample_mutants(mutation_set, mutant_num)
 
-                pbt_res_ast = extract_function_defs(pbt_res)
+            if mutants == []:
+                print("no runnable mutants for " + str(pbt_name) + "... skipping")
+                return
 
-                # make sure the new pbt actually passes
-                replace_function_signatures_in_directory(dst_dir, pbt_res_ast)
+            if kill_stats is not None:
+                features = mutant_features(dep_list, mutation_ids)
+                # likely survivors first: with the early stop, one to tighten against usually turns up in the first few runs
+                mutants = kill_stats.order(mutants, features, survivors_first=True)
+
+            # stop running mutants as soon as the rest can't change which side of the threshhold we're on
+            outcomes = runner.run_reduced(mutants, stop=lambda known : threshold_decided(known, mutants, threshhold, True))
+            if kill_stats is not None:
+                kill_stats.record(features, outcomes)
+                kill_stats.save()
+            passed_tests, failed_tests = split_outcomes(outcomes)
+
+            """ refine the PBT """
+
+            # default condition: does this PBT kill enough mutants?
+            if (len(failed_tests)/len(mutants)) >= threshhold : return pbt_definition
+
+            # if not, we iteratively improve the PBT with the LLM
+
+            iters = max_iters
+            sites = mutation_sites(dep_list, mutants)
+
+            current_pbt = pbt_definition
+            tried = {normalized_source(pbt_definition)} # candidates that only differ in formatting from one of these get skipped
+            while iters > 0:
+                # pick a mutant to refine against
+                ref_mutant = random.choice([mutant for mutant in mutants if mutant in passed_tests])
+
+                # modify the PBT
+                generate_lim = max(5, candidates) # arbitrary choice, but at least one whole batch of candidates
+                pending = []
+                while generate_lim > 0:
+
+                    # generate the modified PBT based on reflection, a batch of candidates from one request at a time
+                    if not pending:
+                        prompt = gen_tighten_prompt_from_pbt_and_mutant(dep_list, current_pbt, ref_mutant)
+                        if responses is not None : pending = responses.generate_n(model, prompt, min(candidates, generate_lim), llm_timeout)
+                        else : pending = model.generate_n(prompt, min(candidates, generate_lim), llm_timeout)
+                    pbt_res = extract_python_code(pending.pop(0))
+
+                    # don't run the same PBT through pytest twice
+                    normalized = normalized_source(pbt_res)
+                    if normalized is not None and normalized in tried:
+                        generate_lim-=1
+                        print("this pbt was already tried...")
+                        continue
+                    tried.add(normalized)
 
-                report_file_path = os.path.join(dst_dir, 'report.json')
+                    print("NEW PBTS!!\n\n")
+                    print(pbt_res)
 
-                env = os.environ.copy()
-                env['PYTHONPATH'] = dst_dir
+                    new_pbt_name = get_all_function_names(pbt_res)[0]
 
-                result = subprocess.run(
-                    ['pytest', '-q', '--json-report', '--json-report-file=' + report_file_path, 
-                     pbt_path + "::" + pbt_name],
-                    env=env,  # pass the modified environment to the subprocess
-                )
+                    # assert the generated pbt has the same name as the original
+                    if new_pbt_name != pbt_name:
+                        generate_lim-=1
+                        continue
 
-                with open(report_file_path, 'r') as f:
-                    ret_data = json.loads(f.read())
+                    # make sure the new pbt actually passes
+                    outcome = runner.run_pbt(pbt_res)
 
-                    if len(ret_data["tests"]) == 0: 
+                    if outcome is None: 
                         generate_lim-=1
                         print("this pbt failed to compile...")
                         continue
 
-                    for test in ret_data["tests"]:
-                        name = test["nodeid"][test["nodeid"].index("::")+2:]
-                        outcome = test["outcome"]
-                        if outcome == "failed": 
-                            generate_lim-=1
-                            print("this pbt failed to pass...")
-                            continue
-
-                current_pbt = pbt_res
-                replace_function_signatures_in_directory(dst_dir, op_pbt)
-                break
-
-
-            # if we failed to generate a new pbt based off the mutant, just skip it
-            if generate_lim == 0 : continue
-
-            # assess the new PBT (current_pbt) against the mutants, generate a new passed_tests and failed_tests set (based on original mutants)
-
-            current_pbt_ast = extract_function_defs(current_pbt)
-            replace_function_signatures_in_directory(dst_dir, current_pbt_ast)
-
-            passed_tests = set()
-            failed_tests = set()
-
-            for mutant in mutants:
-                def_nodes = extract_function_defs(mutant)
-
-                replace_function_signatures_in_directory(dst_dir, def_nodes)
-
-                env = os.environ.copy()
-                env['PYTHONPATH'] = dst_dir
+                    if outcome == "failed": 
+                        generate_lim-=1
+                        print("this pbt failed to pass...")
+                        continue
 
-                report_file_path = os.path.join(dst_dir, 'report.json')
-                result = subprocess.run(
-                    ['pytest', '-q','--json-report', '--json-report-file=' + report_file_path, 
-                     pbt_path + "::" + pbt_name],
-                    env=env
-                )
+                    # it was written to kill ref_mutant, so if it doesn't, don't bother with the rest
+                    runner.set_pbt(pbt_res)
+                    ref_outcome = runner.run_mutants([ref_mutant])[ref_mutant]
+                    if not killed(ref_outcome):
+                        generate_lim-=1
+                        print("this pbt did not kill the mutant...")
+                        runner.set_pbt(current_pbt)
+                        continue
 
-                with open(report_file_path, 'r') as f:
-                    data = json.loads(f.read())
-                    for test in data["tests"]:
-                        name = test["nodeid"][test["nodeid"].index("::")+2:]
-                        outcome = test["outcome"]
-                        if outcome == "passed":
-                            passed_tests.add(mutant)
+                    current_pbt = pbt_res
+                    break
 
-                        elif outcome == "failed":
-                            failed_tests.add(mutant)
 
-                replace_function_signatures_in_directory(dst_dir, op_pbt)
+                # if we failed to generate a new pbt based off the mutant, just skip it
+                if generate_lim == 0:
+                    iters-=1
+                    continue
 
+                # assess the new PBT (current_pbt) against the mutants. it's a rewrite, so it may no longer kill what the
+                # old one killed: every mutant runs again, the likeliest to flip (old survivors, and whatever an early
+                # stop never ran) first, then the ones the old PBT killed, until the threshhold is settled either way
+                flippable = [mutant for mutant in mutants if not killed(outcomes.get(mutant)) and mutant != ref_mutant]
+                decided = [mutant for mutant in mutants if killed(outcomes.get(mutant)) and mutant != ref_mutant]
+                outcomes = {ref_mutant : ref_outcome}
+                outcomes.update(runner.run_reduced(fail_fast_order(flippable, ref_mutant, sites) + fail_fast_order(decided, ref_mutant, sites),
+                                                   stop=lambda known : threshold_decided({ref_mutant : ref_outcome, **known}, mutants, threshhold, True)))
+                passed_tests, failed_tests = split_outcomes(outcomes)
 
-            # re-determine if PBT passes threshhold
-            if (len(failed_tests)/len(mutants)) >= threshhold : return current_pbt
+                # re-determine if PBT passes threshhold
+                if (len(failed_tests)/len(mutants)) >= threshhold : return current_pbt
 
-            iters-=1
+                iters-=1
 
         return "failed to tighten pbt..."
 
-def generalize_repo_pbt(repo_dir : str, pbt_name : str, threshhold : float = 0.3, mutant_num : int = 10, max_iters : int = 10) -> str:
-    pbts_data = extract_pbts_with_dirs_and_context(repo_dir)
+def generalize_repo_pbt(repo_dir : str, pbt_name : str, threshhold : float = 0.3, mutant_num : int = 10, max_iters : int = 10, jobs : int = 1, mode : str = "pytest", schema : bool = False,
+                     selective_sandbox : bool = False, reuse_sandbox : bool = False,
+                     timeout_factor : float = 5.0, timeout_slack : float = 10.0, memory_limit : int = None,
+                     coverage : bool = False, cache : bool = False, cache_size : int = DEFAULT_CACHE_SIZE,
+                     replay : bool = False, seed : int = None, stats : bool = False,
+                     subsumption : bool = False, index_cache : bool = False, index_jobs : int = 1,
+                     candidates : int = 1, llm_timeout : float = DEFAULT_TIMEOUT, llm_cache : bool = True) -> str:
+    if seed is not None : random.seed(seed) # for the sampling that happens after the mutants are drawn
+    file_index = IndexCache(index_path(repo_dir)) if index_cache else None
+    pbts_data = extract_pbts_with_dirs_and_context(repo_dir, [os.path.join(repo_dir, '.gru')], file_index, index_jobs)
+    if file_index is not None : file_index.close()
+    outcome_cache = OutcomeCache(cache_path(repo_dir), cache_size) if cache else None
+    kill_stats = KillStats(stats_path(repo_dir)) if stats else None
+    kill_matrix = KillMatrix(matrix_path(repo_dir)) if subsumption else None
+    responses = ResponseCache(response_cache_path(repo_dir)) if llm_cache else None
 
     with tempfile.TemporaryDirectory() as tmpdir:
 
-        dst_dir = os.path.join(tmpdir, os.path.basename(repo_dir))
-        shutil.copytree(repo_dir, dst_dir)
-
         if not pbt_name in pbts_data:
             print("pbt not found...")
             return
 
+        dst_dir, sandbox_files = build_sandbox(repo_dir, tmpdir, {pbt_name : pbts_data[pbt_name]},
+                                               selective_sandbox, reuse_sandbox)
+
         data = pbts_data[pbt_name]
 
         pbt_name = data[0]
@@ -248,184 +255,136 @@ def generalize_repo_pbt(repo_dir : str, pbt_name : str, threshhold : float = 0.3
         pbt_path = data[6]
         dependency_filenames = data[7]
 
-        """ assert the PBT passes """
-
-        report_file_path = os.path.join(dst_dir, 'report.json')
-
-        env = os.environ.copy()
-        env['PYTHONPATH'] = dst_dir
-
-        result = subprocess.run(
-            ['pytest', '-q','--json-report', '--json-report-file=' + report_file_path, 
-             pbt_path + "::" + pbt_name],
-            env=env,  # pass the modified environment to the subprocess
-        )
-
-        with open(report_file_path, 'r') as f:
-            ret_data = json.loads(f.read())
-
-            if len(ret_data["tests"]) == 0: 
-                print("PBT " + str(pbt_name) + " failed to be detected by pytest... skipping")
-                return
-
-            for test in ret_data["tests"]:
-                name = test["nodeid"][test["nodeid"].index("::")+2:]
-                outcome = test["outcome"]
-                if outcome == "failed": 
-                    print("PBT " + str(pbt_name) + " did not pass with pytest... skipping")
-                    return
-
-        """ evaluate the pbt against mutants """
-        print(str(pbt_name) + " passed with pytest, doing mutant analysis now ...")
-
         dep_list = ""
         for dep_def in dependency_definitions : dep_list += dep_def + "\n"
-        op_def_nodes = extract_function_defs(dep_list)
-
-        mutation_set = mutate_map(dep_list, mutant_num, 2)
-        mutants = list(random.sample(list(mutation_set), mutant_num))
-
-        passed_tests = set()
-        failed_tests = set()
-
-        for mutant in mutants:
-            def_nodes = extract_function_defs(mutant)
-
-            replace_function_signatures_in_directory(dst_dir, def_nodes)
-
-            env = os.environ.copy()
-            env['PYTHONPATH'] = dst_dir
-
-            report_file_path = os.path.join(dst_dir, 'report.json')
-            result = subprocess.run(
-                ['pytest', '-q', '--json-report', '--json-report-file=' + report_file_path, 
-                 pbt_path + "::" + pbt_name],
-                env=env
-            )
-
-            with open(report_file_path, 'r') as f:
-                data = json.loads(f.read())
-                for test in data["tests"]:
-                    name = test["nodeid"][test["nodeid"].index("::")+2:]
-                    outcome = test["outcome"]
-                    if outcome == "passed":
-                        passed_tests.add(mutant)
-
-                    elif outcome == "failed":
-                        failed_tests.add(mutant)
-
-            replace_function_signatures_in_directory(dst_dir, op_def_nodes)
-
-        """ refine the PBT """
-
-        # default condition: does this PBT kill enough mutants?
-        if (len(failed_tests)/len(mutants)) <= threshhold : return pbt_definition
-
-        # if not, we iteratively improve the PBT with the LLM
-
-        iters = max_iters
-        op_pbt = extract_function_defs(pbt_definition)
 
-        current_pbt = pbt_definition
-        while iters > 0:
-            # pick a mutant to refine against
-            ref_mutant = random.choice(list(passed_tests))
+        with MutantRunner(repo_dir, dst_dir, pbt_path, pbt_name, dep_list, pbt_definition, jobs=jobs,
+                          mode=mode, dependency_filenames=dependency_filenames, schema=schema,
+                          sandbox_files=sandbox_files, timeout_factor=timeout_factor,
+                          timeout_slack=timeout_slack, memory_limit=memory_limit, coverage=coverage,
+                          cache=outcome_cache, replay=replay, kill_matrix=kill_matrix) as runner:
 
-            # modify the PBT
-            generate_lim = 5 # arbitrary choice
-            while generate_lim > 0:
+            """ assert the PBT passes """
 
-                # generate the modified PBT based on reflection 
-                prompt = gen_generalize_prompt_from_pbt_and_mutant(dep_list, current_pbt, ref_mutant)
-                res = model.generate_full(prompt)
-                pbt_res = extract_python_code(res)
+            outcome = runner.run_pbt()
 
-                new_pbt_name = get_all_function_names(pbt_res)[0]
-
-                # assert the generated pbt has the same name as the original
-                if new_pbt_name != pbt_name:
-                    generate_lim-=1
-                    continue
-
-                pbt_res_ast = extract_function_defs(pbt_res)
-
-                # make sure the new pbt actually passes
-                replace_function_signatures_in_directory(dst_dir, pbt_res_ast)
+            if outcome is None: 
+                print("PBT " + str(pbt_name) + " failed to be detected by pytest... skipping")
+                return
 
-                report_file_path = os.path.join(dst_dir, 'report.json')
+            if outcome == "failed": 
+                print("PBT " + str(pbt_name) + " did not pass with pytest... skipping")
+                return
 
-                env = os.environ.copy()
-                env['PYTHONPATH'] = dst_dir
+            """ evaluate the pbt against mutants """
+            print(str(pbt_name) + " passed with pytest, doing mutant analysis now ...")
 
-                result = subprocess.run(
-                    ['pytest','-q','--json-report', '--json-report-file=' + report_file_path, 
-                     pbt_path + "::" + pbt_name],
-                    env=env,  # pass the modified environment to the subprocess
-                )
+            mutation_ids, removed = draw_mutants(dep_list, pool_size(mutant_num, coverage), seed)
+            if removed : print(describe_removed(removed))
+            mutation_set = list(mutation_ids)
+            mutants = runner.sample_mutants(mutation_set, mutant_num)
 
-                with open(report_file_path, 'r') as f:
-                    ret_data = json.loads(f.read())
+            if mutants == []:
+                print("no runnable mutants for " + str(pbt_name) + "... skipping")
+                return
 
-                    if len(ret_data["tests"]) == 0: 
+            if kill_stats is not None:
+                features = mutant_features(dep_list, mutation_ids)
+                # likely kills first: with the early stop, one to generalize against usually turns up in the first few runs
+                mutants = kill_stats.order(mutants, features, survivors_first=False)
+
+            # stop running mutants as soon as the rest can't change which side of the threshhold we're on
+            outcomes = runner.run_reduced(mutants, stop=lambda known : threshold_decided(known, mutants, threshhold, False))
+            if kill_stats is not None:
+                kill_stats.record(features, outcomes)
+                kill_stats.save()
+            passed_tests, failed_tests = split_outcomes(outcomes)
+
+            """ refine the PBT """
+
+            # default condition: does this PBT kill enough mutants?
+            if (len(failed_tests)/len(mutants)) <= threshhold : return pbt_definition
+
+            # if not, we iteratively improve the PBT with the LLM
+
+            iters = max_iters
+            sites = mutation_sites(dep_list, mutants)
+
+            current_pbt = pbt_definition
+            tried = {normalized_source(pbt_definition)} # candidates that only differ in formatting from one of these get skipped
+            while iters > 0:
+                # pick a mutant to refine against; generalizing means letting a killed one through
+                ref_mutant = random.choice([mutant for mutant in mutants if mutant in failed_tests])
+
+                # modify the PBT
+                generate_lim = max(5, candidates) # arbitrary choice, but at least one whole batch of candidates
+                pending = []
+                while generate_lim > 0:
+
+                    # generate the modified PBT based on reflection, a batch of candidates from one request at a time
+                    if not pending:
+                        prompt = gen_generalize_prompt_from_pbt_and_mutant(dep_list, current_pbt, ref_mutant)
+                        if responses is not None : pending = responses.generate_n(model, prompt, min(candidates, generate_lim), llm_timeout)
+                        else : pending = model.generate_n(prompt, min(candidates, generate_lim), llm_timeout)
+                    pbt_res = extract_python_code(pending.pop(0))
+
+                    # don't run the same PBT through pytest twice
+                    normalized = normalized_source(pbt_res)
+                    if normalized is not None and normalized in tried:
                         generate_lim-=1
+                        print("this pbt was already tried...")
                         continue
+                    tried.add(normalized)
 
-                    for test in ret_data["tests"]:
-                        name = test["nodeid"][test["nodeid"].index("::")+2:]
-                        outcome = test["outcome"]
-                        if outcome == "failed": 
-                            generate_lim-=1
-                            continue
-
-                current_pbt = pbt_res
-                replace_function_signatures_in_directory(dst_dir, op_pbt)
-                break
-
-
-            # if we failed to generate a new pbt based off the mutant, just skip it
-            if generate_lim == 0 : continue
-
-            # assess the new PBT (current_pbt) against the mutants, generate a new passed_tests and failed_tests set (based on original mutants)
+                    new_pbt_name = get_all_function_names(pbt_res)[0]
 
-            current_pbt_ast = extract_function_defs(current_pbt)
-            replace_function_signatures_in_directory(dst_dir, current_pbt_ast)
-
-            passed_tests = set()
-            failed_tests = set()
+                    # assert the generated pbt has the same name as the original
+                    if new_pbt_name != pbt_name:
+                        generate_lim-=1
+                        continue
 
-            for mutant in mutants:
-                def_nodes = extract_function_defs(mutant)
+                    # make sure the new pbt actually passes
+                    outcome = runner.run_pbt(pbt_res)
 
-                replace_function_signatures_in_directory(dst_dir, def_nodes)
+                    if outcome is None: 
+                        generate_lim-=1
+                        continue
 
-                env = os.environ.copy()
-                env['PYTHONPATH'] = dst_dir
+                    if outcome == "failed": 
+                        generate_lim-=1
+                        continue
 
-                report_file_path = os.path.join(dst_dir, 'report.json')
-                result = subprocess.run(
-                    ['pytest', '-q', '--json-report', '--json-report-file=' + report_file_path, 
-                     pbt_path + "::" + pbt_name],
-                    env=env
-                )
+                    # it was written to let ref_mutant survive, so if it doesn't, don't bother with the rest
+                    runner.set_pbt(pbt_res)
+                    ref_outcome = runner.run_mutants([ref_mutant])[ref_mutant]
+                    if not survived(ref_outcome):
+                        generate_lim-=1
+                        runner.set_pbt(current_pbt)
+                        continue
 
-                with open(report_file_path, 'r') as f:
-                    data = json.loads(f.read())
-                    for test in data["tests"]:
-                        name = test["nodeid"][test["nodeid"].index("::")+2:]
-                        outcome = test["outcome"]
-                        if outcome == "passed":
-                            passed_tests.add(mutant)
+                    current_pbt = pbt_res
+                    break
 
-                        elif outcome == "failed":
-                            failed_tests.add(mutant)
 
-                replace_function_signatures_in_directory(dst_dir, [op_pbt])
+                # if we failed to generate a new pbt based off the mutant, just skip it
+                if generate_lim == 0:
+                    iters-=1
+                    continue
 
+                # assess the new PBT (current_pbt) against the mutants. it's a rewrite, so it may no longer let through
+                # what the old one let through: every mutant runs again, the likeliest to flip (killed mutants, and
+                # whatever an early stop never ran) first, then the old survivors, until the threshhold is settled either way
+                flippable = [mutant for mutant in mutants if not survived(outcomes.get(mutant)) and mutant != ref_mutant]
+                decided = [mutant for mutant in mutants if survived(outcomes.get(mutant)) and mutant != ref_mutant]
+                outcomes = {ref_mutant : ref_outcome}
+                outcomes.update(runner.run_reduced(fail_fast_order(flippable, ref_mutant, sites) + fail_fast_order(decided, ref_mutant, sites),
+                                                   stop=lambda known : threshold_decided({ref_mutant : ref_outcome, **known}, mutants, threshhold, False)))
+                passed_tests, failed_tests = split_outcomes(outcomes)
 
-            # re-determine if PBT passes threshhold
-            if (len(failed_tests)/len(mutants)) <= threshhold : return current_pbt
+                # re-determine if PBT passes threshhold
+                if (len(failed_tests)/len(mutants)) <= threshhold : return current_pbt
 
-            iters-=1
+                iters-=1
 
         return "failed to generalize pbt..."
 
@@ -436,6 +395,41 @@ def main():
     parser.add_argument('--threshhold', type=float, default=0.8, help='Threshold value')
     parser.add_argument('--mutant_num', type=int, default=10, help='Number of mutants')
     parser.add_argument('--max_iters', type=int, default=10, help='Maximum iterations')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of mutants to run in parallel, each in its own sandbox')
+    parser.add_argument('--mode', choices=['pytest', 'inprocess'], default='pytest',
+                        help='Run every mutant in a fresh pytest process, or hot-swap mutants into a long-lived worker')
+    parser.add_argument('--schema', action='store_true',
+                        help='Write all mutants into the sandbox once as a mutant schema, and pick them by id')
+    parser.add_argument('--selective_sandbox', action='store_true',
+                        help='Only put the files the PBT imports (plus conftest.py, __init__.py and config files) in the sandbox')
+    parser.add_argument('--reuse_sandbox', action='store_true',
+                        help='Keep the sandbox in <repo_dir>/.gru/sandbox and reset it on the next run instead of rebuilding it')
+    parser.add_argument('--timeout_factor', type=float, default=5.0,
+                        help='Kill a mutant after this many times the unmutated PBT runtime (plus --timeout_slack); 0 disables the timeout')
+    parser.add_argument('--timeout_slack', type=float, default=10.0, help='Seconds added to every mutant time budget')
+    parser.add_argument('--memory_limit', type=int, default=None, help='Address space limit for mutant runs, in MB')
+    parser.add_argument('--coverage', action='store_true',
+                        help='Trace which dependency lines the PBT reaches; skip mutants of unreached code and favour often-run code')
+    parser.add_argument('--cache', action='store_true',
+                        help='Remember baseline and mutant outcomes in <repo_dir>/.gru/cache.sqlite and reuse them while nothing they depend on changed')
+    parser.add_argument('--cache_size', type=int, default=DEFAULT_CACHE_SIZE, help='Size limit of the outcome cache, in MB')
+    parser.add_argument('--replay', action='store_true',
+                        help='Share a hypothesis example database in <repo_dir>/.gru between all runs, and replay recorded baseline inputs and killing inputs before every mutant run')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed for drawing and sampling mutants, so that the same code gets the same mutants every run')
+    parser.add_argument('--stats', action='store_true',
+                        help='Keep kill rates per operator class and function in <repo_dir>/.gru/stats.json, and run the mutants likeliest to be refined against first')
+    parser.add_argument('--subsumption', action='store_true',
+                        help='Record which PBT killed which mutant in <repo_dir>/.gru/kills.sqlite, and skip mutants subsumed by a mutant that got killed')
+    parser.add_argument('--index_cache', action='store_true',
+                        help='Keep what every file defines, calls and imports in <repo_dir>/.gru/index.sqlite, and only parse files that changed since')
+    parser.add_argument('--index_jobs', type=int, default=1, help='Number of processes that parse the project files when indexing it')
+    parser.add_argument('--candidates', type=int, default=1,
+                        help='Number of candidate PBTs to ask the LLM for in one request, tried in turn before asking again')
+    parser.add_argument('--llm_timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help='Seconds to wait on an LLM response before retrying the request')
+    parser.add_argument('--no_llm_cache', action='store_true',
+                        help='Always ask the LLM, instead of replaying the responses to the same prompts kept in <repo_dir>/.gru/llm_cache.sqlite')
     args = parser.parse_args()
 
     # Call the desired function based on the script name
@@ -446,7 +440,27 @@ def main():
             args.pbt_name,
             threshhold=args.threshhold,
             mutant_num=args.mutant_num,
-            max_iters=args.max_iters
+            max_iters=args.max_iters,
+            jobs=args.jobs,
+            mode=args.mode,
+            schema=args.schema,
+            selective_sandbox=args.selective_sandbox,
+            reuse_sandbox=args.reuse_sandbox,
+            timeout_factor=args.timeout_factor,
+            timeout_slack=args.timeout_slack,
+            memory_limit=args.memory_limit,
+            coverage=args.coverage,
+            cache=args.cache,
+            cache_size=args.cache_size,
+            replay=args.replay,
+            seed=args.seed,
+            stats=args.stats,
+            subsumption=args.subsumption,
+            index_cache=args.index_cache,
+            index_jobs=args.index_jobs,
+            candidates=args.candidates,
+            llm_timeout=args.llm_timeout,
+            llm_cache=not args.no_llm_cache,
         )
     elif sys.argv[0].endswith('generalize-pbt'):
         result = generalize_repo_pbt(
@@ -454,7 +468,27 @@ def main():
             args.pbt_name,
             threshhold=args.threshhold,
             mutant_num=args.mutant_num,
-            max_iters=args.max_iters
+            max_iters=args.max_iters,
+            jobs=args.jobs,
+            mode=args.mode,
+            schema=args.schema,
+            selective_sandbox=args.selective_sandbox,
+            reuse_sandbox=args.reuse_sandbox,
+            timeout_factor=args.timeout_factor,
+            timeout_slack=args.timeout_slack,
+            memory_limit=args.memory_limit,
+            coverage=args.coverage,
+            cache=args.cache,
+            cache_size=args.cache_size,
+            replay=args.replay,
+            seed=args.seed,
+            stats=args.stats,
+            subsumption=args.subsumption,
+            index_cache=args.index_cache,
+            index_jobs=args.index_jobs,
+            candidates=args.candidates,
+            llm_timeout=args.llm_timeout,
+            llm_cache=not args.no_llm_cache,
         )
     else:
 
@@ -0,0 +1,70 @@
+"""
+the in-process worker has to give the same outcomes as running every mutant in a fresh pytest
+process, including for dependencies that keep state in module globals (here a memo table that
+would otherwise carry correct, or wrong, results over from one mutant to the next)
+"""
+import ast, os, shutil
+
+from gru.mutator.harness import draw_mutants
+from gru.mutator.runner import run_mutant, run_pbt
+from gru.mutator.worker import InProcessWorker, FALLBACK
+
+FIBS = '''
+_memo = {}
+
+def fib(n):
+    if n in _memo:
+        return _memo[n]
+    if n < 2:
+        result = n
+    else:
+        result = fib(n - 1) + fib(n - 2)
+    _memo[n] = result
+    return result
+'''
+
+TEST = '''
+from hypothesis import given, settings, strategies as st
+from mylib.fibs import fib
+
+@settings(derandomize=True, database=None, max_examples=50)
+@given(st.integers(min_value=0, max_value=25))
+def test_fib(n):
+    assert fib(n + 2) == fib(n + 1) + fib(n)
+    assert fib(n + 1) >= fib(n)
+'''
+
+def write_project(directory : str):
+    os.makedirs(os.path.join(directory, 'mylib'))
+    os.makedirs(os.path.join(directory, 'tests'))
+    open(os.path.join(directory, 'mylib', '__init__.py'), 'w').close()
+    with open(os.path.join(directory, 'mylib', 'fibs.py'), 'w') as f:
+        f.write(FIBS)
+    with open(os.path.join(directory, 'tests', 'test_fib.py'), 'w') as f:
+        f.write(TEST)
+
+def test_inprocess_matches_pytest_on_stateful_module(tmp_path):
+    pytest_dir, inprocess_dir = str(tmp_path / 'pytest'), str(tmp_path / 'inprocess')
+    write_project(pytest_dir)
+    shutil.copytree(pytest_dir, inprocess_dir)
+
+    dep_list = ast.unparse(ast.parse(FIBS).body[1]) + "\n\n"
+    mutants = list(draw_mutants(dep_list, 12, seed=7)[0])
+    assert mutants
+
+    assert run_pbt(pytest_dir, os.path.join(pytest_dir, 'tests', 'test_fib.py'), 'test_fib') == "passed"
+    expected = {}
+    for mutant in mutants:
+        expected[mutant] = run_mutant(pytest_dir, os.path.join(pytest_dir, 'tests', 'test_fib.py'), 'test_fib', mutant, dep_list)
+
+    worker = InProcessWorker(inprocess_dir, os.path.join(inprocess_dir, 'tests', 'test_fib.py'), 'test_fib', dep_list,
+                             {'fib' : os.path.join(inprocess_dir, 'mylib', 'fibs.py')})
+    try:
+        # the unmutated run fills the memo table with correct results first
+        assert worker.run(None) == "passed"
+        actual = {mutant : worker.run(mutant) for mutant in mutants}
+    finally:
+        worker.close()
+
+    assert all(outcome != FALLBACK for outcome in actual.values())
+    assert actual == expected
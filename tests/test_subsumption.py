@@ -0,0 +1,28 @@
+"""
+a mutant is only counted as subsumed when the kill matrix has real evidence for it, and never on
+the word of earlier versions of the PBT being run
+"""
+from gru.mutator.subsumption import KillMatrix
+
+def test_one_pbt_killing_both_is_no_evidence(tmp_path):
+    matrix = KillMatrix(str(tmp_path / 'kills.sqlite'))
+    matrix.record('t.py::test_a', 'a1', {'A' : 'failed', 'B' : 'failed', 'C' : 'passed'})
+    assert matrix.reduce(['A', 'B', 'C'], 't.py::test_new') == (['A', 'B', 'C'], {})
+
+def test_distinguishing_evidence_from_several_tests(tmp_path):
+    matrix = KillMatrix(str(tmp_path / 'kills.sqlite'))
+    matrix.record('t.py::test_a', 'a1', {'A' : 'failed', 'B' : 'failed'})
+    matrix.record('t.py::test_b', 'b1', {'A' : 'failed', 'B' : 'failed'})
+    matrix.record('t.py::test_c', 'c1', {'A' : 'passed', 'B' : 'failed'})
+    assert matrix.reduce(['A', 'B'], 't.py::test_new') == (['A'], {'B' : ['A']})
+
+def test_versions_of_the_same_test_are_no_evidence(tmp_path):
+    matrix = KillMatrix(str(tmp_path / 'kills.sqlite'))
+    matrix.record('t.py::test_a', 'a1', {'A' : 'failed', 'B' : 'failed'})
+    matrix.record('t.py::test_a', 'a2', {'A' : 'failed', 'B' : 'failed'})
+    matrix.record('t.py::test_a', 'a3', {'A' : 'passed', 'B' : 'failed'})
+    assert matrix.reduce(['A', 'B'], 't.py::test_new') == (['A', 'B'], {})
+    matrix.record('t.py::test_b', 'b1', {'A' : 'failed', 'B' : 'failed'})
+    assert matrix.reduce(['A', 'B'], 't.py::test_new') == (['A'], {'B' : ['A']})
+    # refining test_a itself only has test_b to go by
+    assert matrix.reduce(['A', 'B'], 't.py::test_a') == (['A', 'B'], {})